@@ -0,0 +1,73 @@
+"""
+Comparativa entre el decodificador SD basado en ``struct`` (``src/sdCodec.py``) y la
+disección con Scapy de la misma trama SubscribeEventgroup.
+
+Uso::
+
+    python bench/bench_sd_decoder.py [-n ITERACIONES]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from scapy.all import Ether, Dot1Q, IP, UDP
+from scapy.contrib.automotive.someip import SOMEIP, SD, SDEntry_EventGroup, SDOption_IP4_EndPoint
+from sdCodec import ENTRY_SUBSCRIBE, iter_frame_sd_entries
+
+
+def build_frame() -> bytes:
+    """
+    Construye una trama SubscribeEventgroup con una opción de endpoint IPv4.
+    """
+    entry = SDEntry_EventGroup(type=0x06, srv_id=568, inst_id=1, major_ver=3, ttl=3,
+                               eventgroup_id=1, index_1=0, n_opt_1=1)
+    sd = SD()
+    sd.set_entryArray([entry])
+    sd.set_optionArray([SDOption_IP4_EndPoint(addr="192.168.114.3", l4_proto=0x11, port=30491)])
+    return bytes(
+        Ether(src="AA:BB:CC:DD:00:03", dst="AA:BB:CC:DD:20:60") /
+        Dot1Q(vlan=1500, prio=5) /
+        IP(src="192.168.114.3", dst="192.168.114.98") /
+        UDP(sport=30490, dport=30490) /
+        SOMEIP(srv_id=0xFFFF, sub_id=0x8100, msg_type=0x02) /
+        sd
+    )
+
+
+def with_struct(frame: bytes) -> bool:
+    return any(entry.type == ENTRY_SUBSCRIBE for entry in iter_frame_sd_entries(frame))
+
+
+def with_scapy(frame: bytes) -> bool:
+    someip = Ether(frame).getlayer(SOMEIP)
+    sd = SD(bytes(someip)[16:])
+    return any(entry.type == 0x06 for entry in sd.entry_array)
+
+
+def measure(func, frame: bytes, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(frame)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    frame = build_frame()
+    assert with_struct(frame) and with_scapy(frame)
+
+    t_struct = measure(with_struct, frame, args.iterations)
+    t_scapy = measure(with_scapy, frame, max(1, args.iterations // 20))
+    print(f"struct: {t_struct * 1e6:8.2f} us/trama")
+    print(f"scapy : {t_scapy * 1e6:8.2f} us/trama")
+    print(f"mejora: x{t_scapy / t_struct:.1f}")
+
+
+if __name__ == "__main__":
+    main()
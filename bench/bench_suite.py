@@ -0,0 +1,270 @@
+"""
+Benchmarks de las etapas principales del simulador: consultas al ``Parser``,
+codificación de payloads, construcción de eventos y OFFER, transmisión y jitter del
+planificador cíclico.
+
+No necesita ``eth1`` ni hardware: la transmisión se mide contra un fichero pcapng
+temporal y, si hay permisos para abrir un socket raw, contra la interfaz ``lo``.
+
+Para cada etapa se informa de paquetes/s, latencia p50/p99 por operación y memoria
+asignada por paquete (medida con ``tracemalloc``: pico de memoria durante la
+operación y bloques que quedan retenidos tras ella). Los resultados se guardan en
+JSON para compararlos entre commits.
+
+Uso::
+
+    python bench/bench_suite.py [-n ITERACIONES] [-o resultados.json] [--compare base.json]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(SRC_DIR)
+# Las rutas de los ficheros de configuración del Parser son relativas a src/
+os.chdir(SRC_DIR)
+
+from parser import Parser
+from pluginRegistry import get_plugin_registry
+from scheduler import CyclicScheduler
+from serviceDiscovery import someipSD
+from someip import Someip
+from pcapFile import PcapngWriter
+from transmit import PcapTransmitter, Transmitter
+
+SRC_ECU = "PCU_Proxy_Frontend"
+DST_ECU = "IVC"
+SERVICE = 140
+# Tramas por lote en las etapas de envío por lotes
+BATCH = 64
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(op: Callable[[], Any], iterations: int, packets_per_op: int = 1) -> Dict[str, float]:
+    """
+    Mide una operación: primero la latencia de cada llamada con ``perf_counter_ns`` y
+    después, en una segunda pasada bajo ``tracemalloc``, la memoria asignada.
+
+    :param op: Operación a medir.
+    :type op: Callable[[], Any]
+
+    :param iterations: Número de llamadas.
+    :type iterations: int
+
+    :param packets_per_op: Paquetes que procesa cada llamada (para las etapas por lotes).
+    :type packets_per_op: int
+
+    :return: Métricas de la etapa.
+    :rtype: Dict[str, float]
+    """
+    for _ in range(min(100, iterations)):
+        op()
+
+    clock = time.perf_counter_ns
+    latencies = [0] * iterations
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = clock()
+        for i in range(iterations):
+            t0 = clock()
+            op()
+            latencies[i] = clock() - t0
+        total = clock() - start
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    latencies.sort()
+
+    samples = min(iterations, 1000)
+    peak_bytes = 0
+    tracemalloc.start()
+    try:
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(samples):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            op()
+            peak_bytes += tracemalloc.get_traced_memory()[1] - before
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+    finally:
+        tracemalloc.stop()
+
+    packets = iterations * packets_per_op
+    return {
+        "iterations": iterations,
+        "packets_per_s": packets / (total / 1e9) if total else 0.0,
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "max_us": latencies[-1] / 1000,
+        "alloc_bytes_per_packet": peak_bytes / (samples * packets_per_op),
+        "retained_blocks_per_packet": retained_blocks / (samples * packets_per_op),
+    }
+
+
+def bench_jitter(period: float, seconds: float) -> Dict[str, float]:
+    """
+    Ejecuta una tarea cíclica con reloj real durante ``seconds`` segundos y mide el
+    retraso de cada ejecución respecto a su deadline.
+    """
+    scheduler = CyclicScheduler()
+    lateness: List[float] = []
+    clock = scheduler.clock
+    scheduler.add("jitter", period, lambda task: lateness.append(clock() - task.deadline))
+    expires = clock() + seconds
+    scheduler.run(lambda: clock() < expires)
+    lateness.sort()
+    task = scheduler.tasks()[0]
+    return {
+        "iterations": len(lateness),
+        "period_ms": period * 1000,
+        "p50_us": percentile(lateness, 0.50) * 1e6,
+        "p99_us": percentile(lateness, 0.99) * 1e6,
+        "max_us": lateness[-1] * 1e6 if lateness else 0.0,
+        "missed": task.missed,
+    }
+
+
+def build_stages(tmpdir: str) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    """
+    Prepara las etapas a medir. Cada una recibe el número de iteraciones y devuelve
+    sus métricas.
+    """
+    parser = Parser()
+    data_dst = parser.ecu1_to_ecu2(SRC_ECU, DST_ECU)
+    method = parser.get_service_data(SERVICE)
+    encoder = get_plugin_registry().bind(method)
+    payload_buffer = bytearray(encoder.size)
+    some = Someip()
+    sd = someipSD()
+    frame = bytes(some.craft_someip_frame(SERVICE, data_dst))
+    frames = [frame] * BATCH
+
+    writer = PcapngWriter(os.path.join(tmpdir, "bench.pcapng"))
+    pcap_tx = PcapTransmitter(writer, "bench")
+
+    stages = {
+        "parser.get_service_data": lambda n: measure(lambda: parser.get_service_data(SERVICE), n),
+        "parser.ecu1_to_ecu2": lambda n: measure(lambda: parser.ecu1_to_ecu2(SRC_ECU, DST_ECU), n),
+        "plugin.get_payload": lambda n: measure(encoder.encode, n),
+        "plugin.write_payload": lambda n: measure(lambda: encoder.write(payload_buffer, 0), n),
+        "someip.craft_someip_pk": lambda n: measure(
+            lambda: bytes(some.craft_someip_pk(SERVICE, data_dst)), max(1, n // 20)
+        ),
+        "someip.craft_someip_frame": lambda n: measure(lambda: some.craft_someip_frame(SERVICE, data_dst), n),
+        "sd.craft_offer_packet": lambda n: measure(
+            lambda: bytes(sd.craft_offer_packet(SRC_ECU, DST_ECU, SERVICE)), max(1, n // 20)
+        ),
+        "tx.pcap.send": lambda n: measure(lambda: pcap_tx.send(frame), n),
+        "tx.pcap.send_batch": lambda n: measure(lambda: pcap_tx.send_batch(frames), max(1, n // BATCH), BATCH),
+    }
+
+    try:
+        lo_tx = Transmitter("lo")
+    except OSError as e:
+        reason = f"sin socket raw en lo: {e}"
+        stages["tx.loopback.send"] = lambda n: {"skipped": reason}
+        stages["tx.loopback.send_batch"] = lambda n: {"skipped": reason}
+    else:
+        stages["tx.loopback.send"] = lambda n: measure(lambda: lo_tx.send(frame), n)
+        stages["tx.loopback.send_batch"] = lambda n: measure(
+            lambda: lo_tx.send_batch(frames), max(1, n // BATCH), BATCH
+        )
+    return stages
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], base_path: str):
+    """
+    Muestra la variación de paquetes/s y p99 respecto a unos resultados anteriores.
+    """
+    with open(base_path) as f:
+        base = json.load(f)
+    print(f"\nComparación con {base_path} ({base['meta'].get('commit')}):")
+    for name, stage in results["stages"].items():
+        old = base["stages"].get(name)
+        if not old or "skipped" in stage or "skipped" in old:
+            continue
+        if "packets_per_s" in stage:
+            ratio = stage["packets_per_s"] / old["packets_per_s"] if old["packets_per_s"] else 0.0
+            print(f"  {name:28s} pps x{ratio:5.2f}   p99 {old['p99_us']:9.2f} -> {stage['p99_us']:9.2f} us")
+        else:
+            print(f"  {name:28s} p99 {old['p99_us']:9.2f} -> {stage['p99_us']:9.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    parser.add_argument("-o", "--output", default=None, help="Fichero JSON donde guardar los resultados")
+    parser.add_argument("--compare", default=None, help="Resultados JSON anteriores con los que comparar")
+    parser.add_argument("--only", default=None, help="Etapas a medir, separadas por comas")
+    parser.add_argument("--jitter-period", type=float, default=0.02, help="Periodo de la tarea de jitter (s)")
+    parser.add_argument("--jitter-seconds", type=float, default=2.0,
+                        help="Duración de la medida de jitter (s, 0 para omitirla)")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+        },
+        "stages": {},
+    }
+    only = set(args.only.split(",")) if args.only else None
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        stages = build_stages(tmpdir)
+        if args.jitter_seconds > 0:
+            stages["scheduler.jitter"] = lambda n: bench_jitter(args.jitter_period, args.jitter_seconds)
+
+        print(f"{'etapa':28s} {'paquetes/s':>12s} {'p50 us':>9s} {'p99 us':>9s} {'B/paquete':>10s}")
+        for name, run in stages.items():
+            if only is not None and name not in only:
+                continue
+            stage = run(args.iterations)
+            results["stages"][name] = stage
+            if "skipped" in stage:
+                print(f"{name:28s} omitida ({stage['skipped']})")
+            elif "packets_per_s" in stage:
+                print(f"{name:28s} {stage['packets_per_s']:12.0f} {stage['p50_us']:9.2f} "
+                      f"{stage['p99_us']:9.2f} {stage['alloc_bytes_per_packet']:10.1f}")
+            else:
+                print(f"{name:28s} {'-':>12s} {stage['p50_us']:9.2f} {stage['p99_us']:9.2f} "
+                      f"{'-':>10s}  (retraso, {stage['missed']} deadlines perdidos)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-import struct
 from enum import IntEnum
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Tuple, Union
+
+from plugins.codec import PayloadCodec, compile_layout
 
 # Enumeraciones definidas en el .def file
 # En este .def file en concreto, se encuentran definidos los distintos tipos de datos, así
@@ -36,6 +37,48 @@ class SpeedSupposedStateT(IntEnum):
     STANDSTILL = 1
     MOVING = 2
 
+# Layouts de las payloads tal y como se declaran en el .def: campos (nombre, tipo) en
+# orden de codificación, little endian y sin relleno. Cada layout se compila una sola
+# vez en un codec (ver plugins/codec.py); un evento nuevo solo necesita su layout.
+EVENT_LAYOUTS = {
+    "VehicleSpeed": (
+        ("vehicleSpeedValueState", "uint8"),
+        ("vehicleSpeed", "float32"),
+        ("vehicleSpeedSignValueState", "uint8"),
+        ("vehicleSpeedSign", "uint8"),
+        ("vehicleLowSpeedValueState", "uint8"),
+        ("vehicleLowSpeed", "float32"),
+        ("standStillSupposedValueState", "uint8"),
+        ("standStillSupposed", "uint8"),
+    ),
+    "VehicleAccelAndYaw": (
+        ("longitudinalAccelCorrectedValueState", "uint8"),
+        ("longitudinalAccelCorrected", "float32"),
+        ("transversalAccelCorrectedValueState", "uint8"),
+        ("transversalAccelCorrected", "float32"),
+        ("yawRateCorrectedValueState", "uint8"),
+        ("yawRateCorrected", "float32"),
+        ("longitudinalAccelRawValueState", "uint8"),
+        ("longitudinalAccelRaw", "float32"),
+        ("transversalAccelRawValueState", "uint8"),
+        ("transversalAccelRaw", "float32"),
+        ("yawRateRawValueState", "uint8"),
+        ("yawRateRaw", "float32"),
+    ),
+    "VehicleSpeedBody": (
+        ("vehicleSpeedBodyValueState", "uint8"),
+        ("vehicleSpeedBody", "float32"),
+    ),
+}
+
+# Layouts de las peticiones de los métodos (REQUEST/REQUEST_NO_RETURN) que atiende el
+# plugin. Los métodos que no aparecen aquí no llevan payload en la petición.
+REQUEST_LAYOUTS = {
+    "SetVehicleSpeed": (
+        ("vehicleSpeed", "float32"),
+    ),
+}
+
 class VehicleDynamicsPlugin:
     """
     Clase que simula los datos que conforman la payload y genera las estructuras
@@ -46,8 +89,8 @@ class VehicleDynamicsPlugin:
     ser consultados o modificados. Permite construir estructuras binarias 
     que serán inyectadas como payload en mensajes SOME/IP.
 
-    Los datos se empaquetan usando la biblioteca `struct`, siguiendo el 
-    formato especificado por los archivos de definición de cada servicio.
+    Los datos se empaquetan con los codecs compilados a partir de `EVENT_LAYOUTS`,
+    que siguen el formato especificado por los archivos de definición de cada servicio.
     """
     def __init__(self):
         self.vehicle_speed = {
@@ -83,6 +126,31 @@ class VehicleDynamicsPlugin:
 
         self._speed_increment = 1.0
 
+        # Escenario precalculado (ver plugins/scenario.py) y siguiente ciclo de cada evento
+        self._scenario = None
+        self._scenario_loop = True
+        self._scenario_cycle: Dict[str, int] = {}
+
+        # Manejador de cada método, referenciado desde el campo Response de services.json
+        self._methods: Dict[str, Callable[[memoryview], Optional[bytes]]] = {
+            "GetVehicleSpeed": self._get_vehicle_speed,
+            "SetVehicleSpeed": self._set_vehicle_speed,
+        }
+        self._request_codecs: Dict[str, PayloadCodec] = {
+            name: compile_layout(name, layout) for name, layout in REQUEST_LAYOUTS.items()
+        }
+
+        # Codec y diccionario de estado de cada evento
+        self._events: Dict[str, Tuple[PayloadCodec, Dict[str, Any]]] = {
+            "VehicleSpeed": (compile_layout("VehicleSpeed", EVENT_LAYOUTS["VehicleSpeed"]), self.vehicle_speed),
+            "VehicleAccelAndYaw": (
+                compile_layout("VehicleAccelAndYaw", EVENT_LAYOUTS["VehicleAccelAndYaw"]), self.vehicle_accel_yaw
+            ),
+            "VehicleSpeedBody": (
+                compile_layout("VehicleSpeedBody", EVENT_LAYOUTS["VehicleSpeedBody"]), self.vehicle_speed_body
+            ),
+        }
+
     def increment_speed(self):
         """Incrementa la velocidad simulada."""
         self.vehicle_speed["vehicleSpeed"] += self._speed_increment
@@ -100,6 +168,37 @@ class VehicleDynamicsPlugin:
         self.vehicle_accel_yaw["longitudinalAccelRaw"] = longitudinal
         self.vehicle_accel_yaw["transversalAccelRaw"] = transversal
 
+    def load_scenario(self, scenario, loop: bool = True):
+        """
+        Carga un escenario precalculado (``plugins.scenario.ScenarioPayloads``). Mientras
+        esté cargado, cada payload de un evento incluido en el escenario se toma del
+        siguiente ciclo del mismo en lugar de codificarse a partir del estado.
+
+        :param scenario: Payloads del escenario. None para descargarlo.
+        :type scenario: ScenarioPayloads
+
+        :param loop: Si es True el escenario vuelve a empezar al terminar; si es False
+            se mantiene el último ciclo.
+        :type loop: bool
+        """
+        self._scenario = scenario
+        self._scenario_loop = loop
+        self._scenario_cycle = {}
+
+    def _scenario_payload(self, event: str) -> Optional[memoryview]:
+        """
+        Devuelve la payload del siguiente ciclo del escenario para un evento, o None si
+        no hay escenario o el evento no forma parte de él.
+        """
+        scenario = self._scenario
+        if scenario is None or event not in scenario:
+            return None
+        cycle = self._scenario_cycle.get(event, 0)
+        if cycle >= len(scenario):
+            cycle = 0 if self._scenario_loop else len(scenario) - 1
+        self._scenario_cycle[event] = cycle + 1
+        return scenario.payload(event, cycle)
+
     def get_payload_vehicle_speed(self) -> bytes:
         """
         Genera el payload binario correspondiente al evento `VehicleSpeed`, con los
@@ -118,18 +217,7 @@ class VehicleDynamicsPlugin:
         :return: Cadena de bytes lista para inyectarse como payload en el mensaje SOME/IP.
         :rtype: bytes
         """
-        return struct.pack(
-            "<BfBBBfBB",
-            int(self.vehicle_speed["vehicleSpeedValueState"]),       # B -> int
-            float(self.vehicle_speed["vehicleSpeed"]),               # f -> float
-            int(self.vehicle_speed["vehicleSpeedSignValueState"]),   # B -> int
-            int(self.vehicle_speed["vehicleSpeedSign"]),             # B -> int
-            int(self.vehicle_speed["vehicleLowSpeedValueState"]),    # Aquí sospecho error (debería ser int, no float)
-            float(self.vehicle_speed["vehicleLowSpeed"]),            # f -> float
-            int(self.vehicle_speed["standStillSupposedValueState"]), # B -> int
-            int(self.vehicle_speed["standStillSupposed"]),           # B -> int
-        )
-
+        return self.get_payload("VehicleSpeed")
 
     def get_payload_accel_and_yaw(self) -> bytes:
         """
@@ -140,21 +228,7 @@ class VehicleDynamicsPlugin:
         :return: Payload codificado como cadena de bytes.
         :rtype: bytes
         """
-        return struct.pack(
-            "<BfBfBfBfBfBf",
-            self.vehicle_accel_yaw["longitudinalAccelCorrectedValueState"],
-            self.vehicle_accel_yaw["longitudinalAccelCorrected"],
-            self.vehicle_accel_yaw["transversalAccelCorrectedValueState"],
-            self.vehicle_accel_yaw["transversalAccelCorrected"],
-            self.vehicle_accel_yaw["yawRateCorrectedValueState"],
-            self.vehicle_accel_yaw["yawRateCorrected"],
-            self.vehicle_accel_yaw["longitudinalAccelRawValueState"],
-            self.vehicle_accel_yaw["longitudinalAccelRaw"],
-            self.vehicle_accel_yaw["transversalAccelRawValueState"],
-            self.vehicle_accel_yaw["transversalAccelRaw"],
-            self.vehicle_accel_yaw["yawRateRawValueState"],
-            self.vehicle_accel_yaw["yawRateRaw"],
-        )
+        return self.get_payload("VehicleAccelAndYaw")
 
     def get_payload_speed_body(self) -> bytes:
         """
@@ -165,11 +239,58 @@ class VehicleDynamicsPlugin:
         :return: Payload codificado como cadena de bytes.
         :rtype: bytes
         """
-        return struct.pack(
-            "<Bf",
-            self.vehicle_speed_body["vehicleSpeedBodyValueState"],
-            self.vehicle_speed_body["vehicleSpeedBody"]
-        )
+        return self.get_payload("VehicleSpeedBody")
+
+    def get_method(self, method: str) -> Callable[[memoryview], Optional[bytes]]:
+        """
+        Devuelve el manejador de un método REQUEST/REQUEST_NO_RETURN. Recibe la payload
+        de la petición y devuelve la de la respuesta.
+
+        :raises ValueError: Si el nombre del método no es reconocido.
+        """
+        try:
+            return self._methods[method]
+        except KeyError:
+            raise ValueError(f"Método no reconocido: {method}") from None
+
+    def _decode_request(self, method: str, payload: memoryview) -> Dict[str, Any]:
+        """
+        Decodifica la payload de una petición según su layout.
+
+        :raises ValueError: Si la longitud no coincide con la del layout.
+        """
+        codec = self._request_codecs[method]
+        if len(payload) != codec.size:
+            raise ValueError(f"{method}: se esperaban {codec.size} bytes y se han recibido {len(payload)}")
+        return codec.decode(payload)
+
+    def _get_vehicle_speed(self, payload: memoryview) -> bytes:
+        """
+        GetVehicleSpeed: devuelve el estado actual de `VehicleSpeed`.
+        """
+        if len(payload):
+            raise ValueError("GetVehicleSpeed no admite payload")
+        return self.get_payload("VehicleSpeed")
+
+    def _set_vehicle_speed(self, payload: memoryview) -> bytes:
+        """
+        SetVehicleSpeed: fija la velocidad simulada y devuelve el nuevo estado de
+        `VehicleSpeed`.
+        """
+        self.set_speed(self._decode_request("SetVehicleSpeed", payload)["vehicleSpeed"])
+        return self.get_payload("VehicleSpeed")
+
+    def get_codec(self, event: str) -> PayloadCodec:
+        """
+        Devuelve el codec compilado de un evento (p. ej. para conocer su longitud o
+        decodificar payloads recibidas).
+
+        :raises ValueError: Si el nombre del evento no es reconocido.
+        """
+        try:
+            return self._events[event][0]
+        except KeyError:
+            raise ValueError(f"Evento no reconocido: {event}") from None
 
     def get_payload(self, event: str) -> bytes:
         """
@@ -183,11 +304,40 @@ class VehicleDynamicsPlugin:
 
         :raises ValueError: Si el nombre del evento no es reconocido.
         """
-        if event == "VehicleSpeed":
-            return self.get_payload_vehicle_speed()
-        elif event == "VehicleAccelAndYaw":
-            return self.get_payload_accel_and_yaw()
-        elif event == "VehicleSpeedBody":
-            return self.get_payload_speed_body()
-        else:
-            raise ValueError(f"Evento no reconocido: {event}")
\ No newline at end of file
+        try:
+            codec, state = self._events[event]
+        except KeyError:
+            raise ValueError(f"Evento no reconocido: {event}") from None
+        payload = self._scenario_payload(event)
+        if payload is not None:
+            return bytes(payload)
+        return codec.encode(state)
+
+    def write_payload(self, event: str, buffer: Union[bytearray, memoryview], offset: int) -> int:
+        """
+        Codifica el payload de un evento directamente sobre el buffer de la trama, sin
+        crear objetos bytes intermedios.
+
+        :param event: Nombre del evento solicitado (e.g., "VehicleSpeed").
+        :type event: str
+
+        :param buffer: Buffer de la trama.
+        :type buffer: bytearray | memoryview
+
+        :param offset: Offset de la payload dentro del buffer.
+        :type offset: int
+
+        :return: Número de bytes escritos.
+        :rtype: int
+
+        :raises ValueError: Si el nombre del evento no es reconocido.
+        """
+        try:
+            codec, state = self._events[event]
+        except KeyError:
+            raise ValueError(f"Evento no reconocido: {event}") from None
+        payload = self._scenario_payload(event)
+        if payload is not None:
+            buffer[offset:offset + len(payload)] = payload
+            return len(payload)
+        return codec.encode_into(buffer, offset, state)
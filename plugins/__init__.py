@@ -0,0 +1,4 @@
+"""
+Plugins de payload. Cada módulo ``<Nombre>.py`` define la clase ``<Nombre>``, que se
+carga de forma perezosa a través de ``src/pluginRegistry.py``.
+"""
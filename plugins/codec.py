@@ -0,0 +1,118 @@
+import struct
+from operator import itemgetter
+from typing import Any, Dict, Mapping, Sequence, Tuple, Union
+
+Buffer = Union[bytearray, memoryview]
+
+# Campo de una payload tal y como se declara en el .def: (nombre, tipo)
+Field = Tuple[str, str]
+
+# Tipos de dato del .def y su código en ``struct``
+DEF_TYPES: Dict[str, str] = {
+    "bool": "?",
+    "uint8": "B",
+    "int8": "b",
+    "uint16": "H",
+    "int16": "h",
+    "uint32": "I",
+    "int32": "i",
+    "uint64": "Q",
+    "int64": "q",
+    "float32": "f",
+    "float64": "d",
+}
+
+
+class PayloadCodec():
+    """
+    Codec de una payload compilado a partir de su layout declarado como datos.
+
+    El layout se traduce una sola vez a un ``struct.Struct`` (sin relleno, en el orden
+    de bytes indicado), de forma que en cada ciclo no se vuelve a interpretar ningún
+    formato: los valores se extraen del diccionario de estado con un ``itemgetter`` y
+    se escriben con ``pack_into`` directamente sobre el buffer de la trama.
+
+    :ivar name: Nombre del evento.
+    :ivar fields: Nombres de los campos en el orden del layout.
+    :ivar size: Longitud en bytes de la payload.
+    """
+
+    def __init__(self, name: str, layout: Sequence[Field], byte_order: str = "<"):
+        """
+        :param name: Nombre del evento.
+        :type name: str
+
+        :param layout: Campos ``(nombre, tipo)`` en el orden en que se codifican.
+        :type layout: Sequence[Tuple[str, str]]
+
+        :param byte_order: Orden de bytes de ``struct`` ("<" little endian, ">" big endian).
+        :type byte_order: str
+
+        :raises ValueError: Si el layout está vacío o usa un tipo no soportado.
+        """
+        if not layout:
+            raise ValueError(f"Layout vacío para el evento {name}")
+        try:
+            fmt = byte_order + "".join(DEF_TYPES[def_type] for _, def_type in layout)
+        except KeyError as e:
+            raise ValueError(f"Tipo no soportado en el layout de {name}: {e}") from None
+        self.name = name
+        self.fields = tuple(field for field, _ in layout)
+        self.layout = tuple(layout)
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        getter = itemgetter(*self.fields)
+        # Con un único campo itemgetter no devuelve una tupla
+        self._values = getter if len(self.fields) > 1 else (lambda state: (getter(state),))
+
+    def encode(self, state: Mapping[str, Any]) -> bytes:
+        """
+        Codifica la payload a partir del diccionario de estado.
+        """
+        return self.struct.pack(*self._values(state))
+
+    def encode_into(self, buffer: Buffer, offset: int, state: Mapping[str, Any]) -> int:
+        """
+        Codifica la payload directamente sobre ``buffer`` a partir de ``offset``.
+
+        :return: Número de bytes escritos.
+        :rtype: int
+        """
+        self.struct.pack_into(buffer, offset, *self._values(state))
+        return self.size
+
+    def decode(self, buffer: Union[bytes, Buffer], offset: int = 0) -> Dict[str, Any]:
+        """
+        Decodifica una payload con este mismo layout.
+
+        :return: Diccionario campo -> valor.
+        :rtype: Dict[str, Any]
+        """
+        return dict(zip(self.fields, self.struct.unpack_from(buffer, offset)))
+
+
+# Codecs ya compilados, indexados por (nombre, layout, orden de bytes)
+_CODECS: Dict[Tuple, PayloadCodec] = {}
+
+
+def compile_layout(name: str, layout: Sequence[Field], byte_order: str = "<") -> PayloadCodec:
+    """
+    Devuelve el codec de un layout, compilándolo solo la primera vez.
+
+    :param name: Nombre del evento.
+    :type name: str
+
+    :param layout: Campos ``(nombre, tipo)`` del evento.
+    :type layout: Sequence[Tuple[str, str]]
+
+    :param byte_order: Orden de bytes de ``struct``.
+    :type byte_order: str
+
+    :return: Codec compilado.
+    :rtype: PayloadCodec
+    """
+    key = (name, tuple(layout), byte_order)
+    codec = _CODECS.get(key)
+    if codec is None:
+        codec = _CODECS[key] = PayloadCodec(name, layout, byte_order)
+    return codec
@@ -0,0 +1,266 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from plugins.codec import Field
+from plugins.VehicleDynamicsPlugin import (
+    EVENT_LAYOUTS, SpeedSignT, SpeedSupposedStateT, ValueState
+)
+
+# Tipos de dato del .def y su tipo NumPy little endian equivalente
+NUMPY_TYPES: Dict[str, str] = {
+    "bool": "?",
+    "uint8": "u1",
+    "int8": "i1",
+    "uint16": "<u2",
+    "int16": "<i2",
+    "uint32": "<u4",
+    "int32": "<i4",
+    "uint64": "<u8",
+    "int64": "<i8",
+    "float32": "<f4",
+    "float64": "<f8",
+}
+
+# Velocidad (km/h) por debajo de la cual se considera que el vehículo está parado
+STANDSTILL_SPEED = 0.1
+# Deceleración (m/s²) con la que se llega a la parada en standstill()
+STANDSTILL_DECELERATION = 3.0
+
+KMH_TO_MS = 1 / 3.6
+
+
+def layout_dtype(layout: Sequence[Field]) -> np.dtype:
+    """
+    Traduce un layout del .def a un dtype estructurado sin relleno, con la misma
+    representación binaria que el codec ``struct`` del mismo layout.
+    """
+    return np.dtype([(name, NUMPY_TYPES[def_type]) for name, def_type in layout])
+
+
+# Registro de un ciclo: las payloads de los tres eventos, una detrás de otra
+CYCLE_DTYPE = np.dtype([(event, layout_dtype(layout)) for event, layout in EVENT_LAYOUTS.items()])
+
+
+class ScenarioPayloads():
+    """
+    Payloads precalculadas de un escenario: un array estructurado contiguo con un
+    registro por ciclo que contiene las payloads de ``VehicleSpeed``,
+    ``VehicleAccelAndYaw`` y ``VehicleSpeedBody`` ya codificadas.
+
+    :meth:`payload` solo calcula un offset y recorta un ``memoryview`` sobre el array,
+    por lo que el bucle de envío no codifica nada.
+
+    :ivar records: Array estructurado con ``CYCLE_DTYPE``.
+    :ivar rate_hz: Frecuencia de ciclo con la que se generó el escenario.
+    """
+
+    def __init__(self, records: np.ndarray, rate_hz: float):
+        self.records = np.ascontiguousarray(records, dtype=CYCLE_DTYPE)
+        self.rate_hz = rate_hz
+        self._view = memoryview(self.records.view(np.uint8).reshape(-1))
+        self._itemsize = CYCLE_DTYPE.itemsize
+        # Offset y longitud de la payload de cada evento dentro del registro
+        self._spans = {
+            event: (CYCLE_DTYPE.fields[event][1], CYCLE_DTYPE[event].itemsize)
+            for event in CYCLE_DTYPE.names
+        }
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, event: str) -> bool:
+        return event in self._spans
+
+    def payload(self, event: str, cycle: int) -> memoryview:
+        """
+        Devuelve la payload codificada de un evento en el ciclo indicado.
+
+        :param event: Nombre del evento (e.g., "VehicleSpeed").
+        :type event: str
+
+        :param cycle: Índice del ciclo.
+        :type cycle: int
+
+        :return: Vista sobre el array del escenario.
+        :rtype: memoryview
+        """
+        offset, size = self._spans[event]
+        start = cycle * self._itemsize + offset
+        return self._view[start:start + size]
+
+    def save(self, path: str):
+        """
+        Guarda el escenario en un fichero ``.npy`` para reproducirlo más tarde.
+        """
+        np.save(path, self.records)
+
+    @classmethod
+    def load(cls, path: str, rate_hz: float) -> "ScenarioPayloads":
+        """
+        Carga un escenario guardado con :meth:`save`.
+        """
+        return cls(np.load(path), rate_hz)
+
+
+class DriveScenario():
+    """
+    Generador de perfiles de conducción para ``VehicleDynamicsPlugin``.
+
+    El perfil se describe encadenando tramos (aceleración, crucero, frenada, curva y
+    parada); cada tramo genera de golpe, con NumPy, las señales de todos sus ciclos.
+    Las señales derivadas se calculan de forma coherente:
+
+    - Aceleración longitudinal como derivada de la velocidad.
+    - Aceleración transversal como ``v * yaw_rate`` en las curvas.
+    - ``SpeedSignT`` y ``SpeedSupposedStateT`` según el signo y la magnitud de la velocidad.
+
+    Las señales ``*Raw`` son las corregidas más un ruido gaussiano opcional, generado
+    con una semilla fija para que el escenario sea reproducible.
+
+    Unidades: velocidad en km/h (negativa en marcha atrás), aceleraciones en m/s² y
+    yaw rate en °/s.
+    """
+
+    def __init__(self, rate_hz: float = 50.0, initial_speed: float = 0.0, noise: float = 0.0, seed: int = 0):
+        """
+        :param rate_hz: Frecuencia de ciclo del evento (p. ej. 50 Hz para Cycle 0.02).
+        :type rate_hz: float
+
+        :param initial_speed: Velocidad inicial en km/h.
+        :type initial_speed: float
+
+        :param noise: Desviación típica del ruido de las señales ``*Raw``.
+        :type noise: float
+
+        :param seed: Semilla del generador de ruido.
+        :type seed: int
+        """
+        if rate_hz <= 0:
+            raise ValueError(f"Frecuencia no válida: {rate_hz}")
+        self.rate_hz = rate_hz
+        self.noise = noise
+        self.seed = seed
+        self.initial_speed = float(initial_speed)
+        self._speed = self.initial_speed
+        self._speed_segments: List[np.ndarray] = []
+        self._yaw_segments: List[np.ndarray] = []
+
+    def _cycles(self, duration: float) -> int:
+        return max(1, int(round(duration * self.rate_hz)))
+
+    def _append(self, speed: np.ndarray, yaw_rate: Optional[np.ndarray] = None) -> "DriveScenario":
+        self._speed_segments.append(speed)
+        self._yaw_segments.append(np.zeros_like(speed) if yaw_rate is None else yaw_rate)
+        self._speed = float(speed[-1])
+        return self
+
+    def ramp(self, target_speed: float, duration: float) -> "DriveScenario":
+        """
+        Rampa lineal desde la velocidad actual hasta ``target_speed`` (aceleración o frenada).
+        """
+        n = self._cycles(duration)
+        return self._append(np.linspace(self._speed, target_speed, n + 1)[1:])
+
+    def cruise(self, duration: float) -> "DriveScenario":
+        """
+        Mantiene la velocidad actual.
+        """
+        return self._append(np.full(self._cycles(duration), self._speed))
+
+    def brake(self, deceleration: float, target_speed: float = 0.0) -> "DriveScenario":
+        """
+        Frena con deceleración constante (m/s², positiva) hasta ``target_speed``.
+        """
+        if deceleration <= 0:
+            raise ValueError(f"Deceleración no válida: {deceleration}")
+        duration = abs(self._speed - target_speed) * KMH_TO_MS / deceleration
+        return self.ramp(target_speed, duration)
+
+    def corner(self, duration: float, yaw_rate: float) -> "DriveScenario":
+        """
+        Curva a velocidad constante con yaw rate constante (°/s, positivo a la izquierda).
+        La entrada y salida de la curva se suavizan con una rampa de un cuarto del tramo.
+        """
+        n = self._cycles(duration)
+        edge = max(1, n // 4)
+        profile = np.ones(n)
+        profile[:edge] = np.linspace(0.0, 1.0, edge, endpoint=False)
+        profile[n - edge:] = np.minimum(profile[n - edge:], np.linspace(1.0, 0.0, edge))
+        return self._append(np.full(n, self._speed), yaw_rate * profile)
+
+    def standstill(self, duration: float, deceleration: float = STANDSTILL_DECELERATION) -> "DriveScenario":
+        """
+        Vehículo detenido durante ``duration`` segundos. Si no lo estaba, antes frena
+        con ``deceleration`` (m/s²) hasta ``STANDSTILL_SPEED``, de modo que la
+        transición a parado no genera un pico de aceleración.
+        """
+        if abs(self._speed) >= STANDSTILL_SPEED:
+            self.brake(deceleration, float(np.copysign(STANDSTILL_SPEED, self._speed)))
+        return self._append(np.zeros(self._cycles(duration)))
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self._speed_segments)
+
+    def build(self) -> ScenarioPayloads:
+        """
+        Calcula todas las señales y codifica las payloads de todos los ciclos en un
+        único array estructurado.
+
+        :return: Payloads precalculadas del escenario.
+        :rtype: ScenarioPayloads
+
+        :raises ValueError: Si el escenario no tiene ningún tramo.
+        """
+        if not self._speed_segments:
+            raise ValueError("El escenario no tiene ningún tramo")
+        speed = np.concatenate(self._speed_segments)
+        yaw_rate = np.concatenate(self._yaw_segments)
+        n = len(speed)
+
+        speed_ms = speed * KMH_TO_MS
+        # El primer ciclo se deriva respecto a la velocidad inicial del escenario
+        long_accel = np.diff(speed_ms, prepend=self.initial_speed * KMH_TO_MS) * self.rate_hz
+        trans_accel = speed_ms * np.radians(yaw_rate)
+        magnitude = np.abs(speed)
+        moving = magnitude >= STANDSTILL_SPEED
+
+        sign = np.full(n, SpeedSignT.NULL_SPEED, dtype=np.uint8)
+        sign[moving & (speed > 0)] = SpeedSignT.FORWARD
+        sign[moving & (speed < 0)] = SpeedSignT.REVERSE
+        supposed = np.where(moving, SpeedSupposedStateT.MOVING, SpeedSupposedStateT.STANDSTILL)
+
+        rng = np.random.default_rng(self.seed)
+
+        def raw(signal: np.ndarray) -> np.ndarray:
+            return signal + rng.normal(0.0, self.noise, n) if self.noise else signal
+
+        records = np.zeros(n, dtype=CYCLE_DTYPE)
+        valid = ValueState.VALID
+
+        vs = records["VehicleSpeed"]
+        vs["vehicleSpeedValueState"] = valid
+        vs["vehicleSpeed"] = magnitude
+        vs["vehicleSpeedSignValueState"] = valid
+        vs["vehicleSpeedSign"] = sign
+        vs["vehicleLowSpeedValueState"] = valid
+        vs["vehicleLowSpeed"] = magnitude
+        vs["standStillSupposedValueState"] = valid
+        vs["standStillSupposed"] = supposed
+
+        ay = records["VehicleAccelAndYaw"]
+        for name, _ in EVENT_LAYOUTS["VehicleAccelAndYaw"]:
+            if name.endswith("ValueState"):
+                ay[name] = valid
+        ay["longitudinalAccelCorrected"] = long_accel
+        ay["transversalAccelCorrected"] = trans_accel
+        ay["yawRateCorrected"] = yaw_rate
+        ay["longitudinalAccelRaw"] = raw(long_accel)
+        ay["transversalAccelRaw"] = raw(trans_accel)
+        ay["yawRateRaw"] = raw(yaw_rate)
+
+        body = records["VehicleSpeedBody"]
+        body["vehicleSpeedBodyValueState"] = valid
+        body["vehicleSpeedBody"] = magnitude
+
+        return ScenarioPayloads(records, self.rate_hz)
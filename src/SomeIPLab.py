@@ -1,13 +1,17 @@
-from typing import Tuple
+from typing import Iterable, Tuple
 from parser import Parser
-from serviceDiscovery import someipSD
 from someip import Someip
-from socketUDP import socketHandler
-import os, sys
-# Agrega el directorio raíz del proyecto al path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-from plugins.VehicleDynamicsPlugin import VehicleDynamicsPlugin
+from scheduler import CyclicScheduler, CyclicTask, VirtualClock
+from someipServer import AsyncSomeipServer
+from sdPhases import CYCLIC_OFFER_DELAY, OFFER_TTL
+from transmit import PcapTransmitter, get_transmitter
+from metrics import MISSED_DEADLINES, SEND_LATENCY, TX_ERRORS, SentFramesCounter, observe_lateness
+from logger import PacketDump, get_logger
+import asyncio, logging, time
+
+log = get_logger("lab")
+# Mensajes por paquete, con limitación de tasa
+packet_log = get_logger("packet")
 
 class MyLab:
     """
@@ -16,25 +20,71 @@ class MyLab:
     por las especificaciones de AUTOSAR. Así como el envío de eventos una vez
     iniciado el mismo.
     """
-    def __init__(self):
+    def __init__(self, use_templates: bool = True):
+        """
+        :param use_templates: Si es True los eventos se construyen en modo plantilla
+            (ver :meth:`Someip.craft_someip_frame`); si es False se apilan las capas
+            de Scapy en cada evento.
+        :type use_templates: bool
+        """
         self.myParser = Parser()
         self.data_dst = None
+        self.use_templates = use_templates
+        # Se reutiliza un único objeto: cada trama toma su propio Session ID del
+        # contador de su método
+        self.some = Someip()
+        self.server = None
+        # Eventos enviados por servicio, contados después de cada envío
+        self.frames_sent = SentFramesCounter()
 
     def start_someip_server(
         self,
         ecu_pair: Tuple[str, str],
-        service_id: int
+        service_id: int,
+        duration: float = None,
+        multicast_threshold: int = None,
+        timestamp_events: bool = False,
+        method_ids: Tuple[int, ...] = (),
+        offer_cycle: float = CYCLIC_OFFER_DELAY,
+        offer_ttl: int = OFFER_TTL
     ) -> Tuple[bool, str]:
         """
         Comienza un servidor SOME/IP. Se debe especificar la tupla de ECUs
         (origen, destino) y el ID del servicio a simular.
 
+        El servidor se ejecuta sobre :class:`AsyncSomeipServer`: los OFFER, la recepción
+        de suscripciones y el envío de eventos cíclicos son tareas concurrentes de un
+        mismo bucle asyncio. La llamada bloquea hasta que se invoca
+        :meth:`stop_someip_server` (desde otro hilo), transcurre ``duration`` o se
+        interrumpe con Ctrl+C.
+
         :param ecu_pair: Tupla con las ECUs (simulada, real)
         :type ecu_pair: tuple[str, str]
 
         :param service_id: ID del servicio SOME/IP a simular
         :type service_id: int
 
+        :param duration: Duración máxima del servidor en segundos. None para no limitarla.
+        :type duration: float
+
+        :param multicast_threshold: Número de suscriptores a partir del cual los eventos
+            se envían a la dirección multicast de la ECU simulada. None para usar solo unicast.
+        :type multicast_threshold: int
+
+        :param timestamp_events: Añadir a cada evento su timestamp de envío para medir
+            la latencia desde un cliente (ver :class:`someipClient.SomeipClient`).
+        :type timestamp_events: bool
+
+        :param method_ids: IDs de los métodos REQUEST/REQUEST_NO_RETURN a atender
+            además de los eventos (ver :class:`methodServer.MethodServer`).
+        :type method_ids: tuple[int, ...]
+
+        :param offer_cycle: Periodo en segundos de los OFFER en la fase principal.
+        :type offer_cycle: float
+
+        :param offer_ttl: TTL en segundos de las entradas OfferService.
+        :type offer_ttl: int
+
         :return: True si se completó con éxito, False en caso de error y mensaje
         :rtype: bool, str
         """
@@ -50,37 +100,105 @@ class MyLab:
         
         # Comienza el servidor SOME/IP
         try:
-            sd = someipSD()
-            sock = socketHandler()
-            self.data_dst = sd.myParser.ecu1_to_ecu2(origen, destino)
-
-            udp_sock = sock.bind_udp_socket(self.data_dst["ip_src"], self.data_dst["udp_dst"])
-
-            i = 0
-            while i != 1:
-
-                offer_packet = sd.craft_offer_packet(origen, destino, service_id)
-                ack = sd.craft_subscribeEventGroupACK_packet(origen, destino, service_id)
-                
-                print("[INFO] Enviando OFFER...")
-                sd.sendSDpacket(offer_packet)
-                
-                pkt_subscribe = sock.escuchar_subscribe_eventgroup(ack)
-                for x in range(0, 15):
-                    self.someip_server_send_event(service_id)
-                
-                i+=1
-                # Aqui se incia el envio de eventos someip. El ttl es de 3 asi que cada 0.2s se envia un paquete
-                # 3/0.2 nos da apra 15 paquetes la secuencia antes de que se desuscriba.
-                
-
-            udp_sock.close()
+            self.server = AsyncSomeipServer(
+                origen, destino, [service_id],
+                use_templates=self.use_templates, multicast_threshold=multicast_threshold,
+                timestamp_events=timestamp_events, method_ids=method_ids,
+                offer_cycle=offer_cycle, offer_ttl=offer_ttl
+            )
+            self.data_dst = self.server.data_dst
+            asyncio.run(self.server.serve(duration))
             return True, "Servidor iniciado correctamente"
 
+        except KeyboardInterrupt:
+            return True, "Servidor detenido por el usuario"
+
         except Exception as e:
             error_msg = f"[ERROR] Error al iniciar servidor SOME/IP: {e}"
             return False, error_msg
 
+    def _craft_event(self, service_id: int) -> bytes:
+        """
+        Construye la trama de un evento como bytes independientes para poder
+        agruparla con el resto de tramas del mismo tick. La trama se cuenta cuando se
+        envía el lote.
+        """
+        if self.use_templates:
+            frame = bytes(self.some.craft_someip_frame(service_id, self.data_dst))
+        else:
+            frame = bytes(self.some.craft_someip_pk(service_id, self.data_dst))
+        self.frames_sent.add(service_id)
+        return frame
+
+    def _on_missed_deadline(self, task: CyclicTask, lateness: float):
+        MISSED_DEADLINES.labels(task.key).inc()
+        packet_log.warning("Deadline perdido en el servicio %s: retraso de %.2f ms", task.key, lateness * 1000)
+
+    def run_cyclic_events(
+        self,
+        service_ids: Iterable[int],
+        ttl: float,
+        ecu_pair: Tuple[str, str] = None,
+        realtime: bool = True
+    ) -> CyclicScheduler:
+        """
+        Envía los eventos de los métodos indicados, cada uno con el periodo de su
+        campo ``SOMEIP.Cycle`` (en segundos), durante ``ttl`` segundos.
+
+        Todos los métodos se planifican desde un único :class:`CyclicScheduler` con
+        deadlines absolutos; las tramas que vencen en el mismo tick se envían en un
+        solo lote.
+
+        :param service_ids: IDs de los métodos a enviar.
+        :type service_ids: Iterable[int]
+
+        :param ttl: Tiempo de vida de la suscripción en segundos.
+        :type ttl: float
+
+        :param ecu_pair: Tupla con las ECUs (simulada, real). Si es None se usan las del
+            último servidor iniciado.
+        :type ecu_pair: tuple[str, str]
+
+        :param realtime: Si es False no se espera entre ciclos: el planificador usa un
+            :class:`VirtualClock` y los ``ttl`` segundos se generan tan rápido como sea
+            posible. Con salida pcapng los timestamps siguen el reloj simulado.
+        :type realtime: bool
+
+        :return: Planificador utilizado, con las estadísticas de cada tarea.
+        :rtype: CyclicScheduler
+        """
+        if ecu_pair is not None:
+            self.data_dst = self.myParser.ecu1_to_ecu2(*ecu_pair)
+        tx = get_transmitter(self.data_dst["interface"])
+        # Reloj del escritor pcapng compartido, que se restaura al terminar
+        writer_clock = None
+        if realtime:
+            clock = time.monotonic
+            scheduler = CyclicScheduler(
+                flush=self.frames_sent.wrap(tx.send_batch), on_missed=self._on_missed_deadline, on_run=observe_lateness
+            )
+        else:
+            clock = VirtualClock()
+            if isinstance(tx, PcapTransmitter):
+                writer_clock = tx.writer.clock
+                tx.writer.clock = clock.time_ns
+            scheduler = CyclicScheduler(
+                flush=self.frames_sent.wrap(tx.send_batch), on_missed=self._on_missed_deadline,
+                clock=clock, sleep_until=clock.advance_to
+            )
+        for service_id in service_ids:
+            cycle = self.myParser.get_service_data(service_id)["SOMEIP"]["Cycle"]
+            scheduler.add(service_id, cycle, lambda task: self._craft_event(task.key))
+
+        expires = clock() + ttl
+        try:
+            scheduler.run(lambda: clock() < expires)
+        finally:
+            # Lo que se escriba después (p. ej. un servidor) vuelve a usar el reloj real
+            if writer_clock is not None:
+                tx.writer.clock = writer_clock
+        return scheduler
+
     def someip_server_send_event(self, service_id: int):
         """
         Manda un evento
@@ -92,13 +210,28 @@ class MyLab:
         :rtype: bool, str
         """
         try:
-            print("[INFO] Enviando EVENTO...")
-            some = Someip()
-            pk = some.craft_someip_pk(service_id, self.data_dst)
-            pk.show()
-            some.send_someip(pk)
+            packet_log.debug("Enviando EVENTO del servicio %s", service_id)
+            if self.use_templates:
+                pk = self.some.craft_someip_frame(service_id, self.data_dst)
+            else:
+                pk = self.some.craft_someip_pk(service_id, self.data_dst)
+                # La copia del paquete solo se hace si el registro va a emitirse
+                if packet_log.isEnabledFor(logging.DEBUG):
+                    packet_log.debug("EVENTO:\n%s", PacketDump(pk))
+            start = time.perf_counter()
+            self.some.send_someip(pk, self.data_dst["interface"])
+            SEND_LATENCY.observe(time.perf_counter() - start)
         except Exception as e:
-            return False, "Error al enviar el evento"
+            TX_ERRORS.labels("event").inc()
+            log.error("Error al enviar el evento del servicio %s: %r", service_id, e)
+            return False, f"Error al enviar el evento: {e}"
+        self.frames_sent.inc(service_id)
+        return True, "Evento enviado"
 
-    def stop_someip_server():
-        pass
+    def stop_someip_server(self):
+        """
+        Detiene el servidor SOME/IP en ejecución. Cancela los OFFER y los eventos
+        cíclicos y cierra el socket UDP. Puede llamarse desde otro hilo.
+        """
+        if self.server is not None:
+            self.server.stop()
@@ -0,0 +1,271 @@
+import ctypes
+import select
+import socket
+import struct
+import time
+from typing import List, Optional, Tuple
+from sdCodec import SD_MESSAGE_ID, SD_PORT
+
+# Constantes de Linux (linux/filter.h, linux/if_packet.h, linux/if_ether.h)
+SO_ATTACH_FILTER = 26
+ETH_P_ALL = 0x0003
+PACKET_OUTGOING = 4
+
+# Clases y modos de las instrucciones BPF clásicas
+BPF_LD, BPF_LDX, BPF_ALU, BPF_JMP, BPF_RET = 0x00, 0x01, 0x04, 0x05, 0x06
+BPF_W, BPF_H, BPF_B = 0x00, 0x08, 0x10
+BPF_ABS, BPF_IND, BPF_MSH = 0x20, 0x40, 0xA0
+BPF_AND, BPF_JEQ, BPF_JSET, BPF_K = 0x50, 0x10, 0x40, 0x00
+
+# Offsets de los datos auxiliares del kernel (SKF_AD_*)
+SKF_AD_OFF = -0x1000
+SKF_AD_PKTTYPE = 4
+SKF_AD_VLAN_TAG = 44
+SKF_AD_VLAN_TAG_PRESENT = 48
+
+Instruction = Tuple[int, object, object, int]
+
+
+def _assemble(program: List[object]) -> List[Tuple[int, int, int, int]]:
+    """
+    Resuelve las etiquetas de un programa BPF. El programa es una lista de
+    instrucciones ``(code, jt, jf, k)`` donde ``jt``/``jf`` pueden ser el nombre de
+    una etiqueta; las etiquetas se indican con un ``str`` en la propia lista.
+    """
+    labels = {}
+    position = 0
+    for item in program:
+        if isinstance(item, str):
+            labels[item] = position
+        else:
+            position += 1
+
+    resolved = []
+    for item in program:
+        if isinstance(item, str):
+            continue
+        code, jt, jf, k = item
+        here = len(resolved)
+        jt = labels[jt] - here - 1 if isinstance(jt, str) else jt
+        jf = labels[jf] - here - 1 if isinstance(jf, str) else jf
+        resolved.append((code, jt, jf, k & 0xFFFFFFFF))
+    return resolved
+
+
+def _udp_tail(base: int, port: int, prefix: str, message_id: Optional[int]) -> List[object]:
+    """
+    Parte común del filtro a partir de la cabecera IPv4 situada en ``base``:
+    UDP, sin fragmentar, puerto destino ``port`` y, si se indica, Message ID de SOME/IP.
+    """
+    program = [
+        prefix,
+        (BPF_LD | BPF_B | BPF_ABS, 0, 0, base + 9),
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, "reject", socket.IPPROTO_UDP),
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, base + 6),
+        (BPF_JMP | BPF_JSET | BPF_K, "reject", 0, 0x1FFF),
+        (BPF_LDX | BPF_B | BPF_MSH, 0, 0, base),
+        (BPF_LD | BPF_H | BPF_IND, 0, 0, base + 2),
+    ]
+    if message_id is None:
+        return program + [(BPF_JMP | BPF_JEQ | BPF_K, "accept", "reject", port)]
+    return program + [
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, "reject", port),
+        (BPF_LD | BPF_W | BPF_IND, 0, 0, base + 8),
+        (BPF_JMP | BPF_JEQ | BPF_K, "accept", "reject", message_id),
+    ]
+
+
+def sd_filter(vlan: Optional[int] = None, port: int = SD_PORT) -> List[Tuple[int, int, int, int]]:
+    """
+    Construye un filtro BPF clásico que solo deja pasar tramas SOME/IP-SD entrantes:
+    IPv4/UDP al puerto ``port`` con Message ID 0xFFFF8100 y, opcionalmente, en la
+    VLAN indicada (ver :func:`udp_filter`).
+    """
+    return udp_filter(vlan, port, SD_MESSAGE_ID)
+
+
+def udp_filter(
+    vlan: Optional[int] = None,
+    port: int = SD_PORT,
+    message_id: Optional[int] = None
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Construye un filtro BPF clásico que solo deja pasar tramas entrantes IPv4/UDP
+    al puerto ``port``, opcionalmente con un Message ID de SOME/IP y en una VLAN.
+
+    La etiqueta VLAN se comprueba tanto si viene en la propia trama como si la tarjeta
+    la ha extraído (VLAN offload), en cuyo caso se consulta en los datos auxiliares.
+
+    :param vlan: VLAN ID a aceptar. None para no filtrar por VLAN.
+    :type vlan: int
+
+    :param port: Puerto UDP destino.
+    :type port: int
+
+    :param message_id: Message ID de SOME/IP a aceptar. None para no comprobarlo.
+    :type message_id: int
+
+    :return: Programa BPF como lista de instrucciones ``(code, jt, jf, k)``.
+    :rtype: List[Tuple[int, int, int, int]]
+    """
+    program: List[object] = [
+        # Se descartan las tramas que envía el propio host
+        (BPF_LD | BPF_W | BPF_ABS, 0, 0, SKF_AD_OFF + SKF_AD_PKTTYPE),
+        (BPF_JMP | BPF_JEQ | BPF_K, "reject", 0, PACKET_OUTGOING),
+        # Etiqueta VLAN extraída por la tarjeta
+        (BPF_LD | BPF_W | BPF_ABS, 0, 0, SKF_AD_OFF + SKF_AD_VLAN_TAG_PRESENT),
+        (BPF_JMP | BPF_JEQ | BPF_K, "inband", 0, 0),
+    ]
+    if vlan is not None:
+        program += [
+            (BPF_LD | BPF_W | BPF_ABS, 0, 0, SKF_AD_OFF + SKF_AD_VLAN_TAG),
+            (BPF_ALU | BPF_AND | BPF_K, 0, 0, 0x0FFF),
+            (BPF_JMP | BPF_JEQ | BPF_K, 0, "reject", vlan),
+        ]
+    program += [
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, 12),
+        (BPF_JMP | BPF_JEQ | BPF_K, "ip_14", "reject", 0x0800),
+        # Etiqueta VLAN dentro de la trama
+        "inband",
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, 12),
+    ]
+    if vlan is None:
+        program += [
+            (BPF_JMP | BPF_JEQ | BPF_K, 0, "untagged", 0x8100),
+        ]
+    else:
+        program += [
+            (BPF_JMP | BPF_JEQ | BPF_K, 0, "reject", 0x8100),
+            (BPF_LD | BPF_H | BPF_ABS, 0, 0, 14),
+            (BPF_ALU | BPF_AND | BPF_K, 0, 0, 0x0FFF),
+            (BPF_JMP | BPF_JEQ | BPF_K, 0, "reject", vlan),
+        ]
+    program += [
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, 16),
+        (BPF_JMP | BPF_JEQ | BPF_K, "ip_18", "reject", 0x0800),
+    ]
+    if vlan is None:
+        program += [
+            "untagged",
+            (BPF_JMP | BPF_JEQ | BPF_K, "ip_14", "reject", 0x0800),
+        ]
+    program += _udp_tail(18, port, "ip_18", message_id)
+    program += _udp_tail(14, port, "ip_14", message_id)
+    program += [
+        "accept",
+        (BPF_RET | BPF_K, 0, 0, 0xFFFF),
+        "reject",
+        (BPF_RET | BPF_K, 0, 0, 0),
+    ]
+    return _assemble(program)
+
+
+def attach_filter(sock: socket.socket, program: List[Tuple[int, int, int, int]]):
+    """
+    Adjunta un programa BPF clásico a un socket (``SO_ATTACH_FILTER``).
+
+    :param sock: Socket de captura.
+    :type sock: socket.socket
+
+    :param program: Instrucciones ``(code, jt, jf, k)``.
+    :type program: List[Tuple[int, int, int, int]]
+    """
+    insns = b"".join(struct.pack("HBBI", *insn) for insn in program)
+    buf = ctypes.create_string_buffer(insns)
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack("HL", len(program), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+class SDCaptureSocket():
+    """
+    Socket de captura ``AF_PACKET`` con un filtro BPF que solo entrega a Python las
+    tramas candidatas a SOME/IP-SD (ver :func:`sd_filter`).
+
+    Las tramas se reciben sobre un buffer preasignado y no se almacenan: cada llamada
+    a :meth:`recv` devuelve una vista de la última trama recibida.
+
+    Si la tarjeta extrae la etiqueta VLAN (VLAN offload), la trama recibida no la
+    contiene; los consumidores deben aceptar ambos formatos.
+
+    Solo lo usa la escucha heredada :meth:`socketUDP.socketHandler.escuchar_subscribe_eventgroup`:
+    el servidor y el cliente reciben el SD por sockets UDP, que ya filtra el kernel.
+    """
+
+    def __init__(self, interface: str, vlan: Optional[int] = None, port: int = SD_PORT, bufsize: int = 65535):
+        """
+        :param interface: Interfaz de red en la que capturar.
+        :type interface: str
+
+        :param vlan: VLAN ID a aceptar. None para cualquier VLAN o trama sin etiquetar.
+        :type vlan: int
+
+        :param port: Puerto UDP de SOME/IP-SD.
+        :type port: int
+
+        :param bufsize: Tamaño del buffer de recepción.
+        :type bufsize: int
+        """
+        # Con protocolo 0 el socket no recibe ninguna trama hasta el bind, así que no se
+        # cuela ninguna trama sin filtrar ni de otras interfaces
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        attach_filter(self.sock, self._program(vlan, port))
+        # Python convierte el protocolo del bind a orden de red
+        self.sock.bind((interface, ETH_P_ALL))
+        self.sock.setblocking(False)
+        self._buffer = bytearray(bufsize)
+        self._view = memoryview(self._buffer)
+
+    @staticmethod
+    def _program(vlan: Optional[int], port: int) -> List[Tuple[int, int, int, int]]:
+        return sd_filter(vlan, port)
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def recv_nowait(self) -> Optional[memoryview]:
+        """
+        Devuelve la siguiente trama pendiente o None si no hay ninguna. La vista es
+        válida hasta la siguiente llamada.
+        """
+        try:
+            n = self.sock.recv_into(self._buffer)
+        except (BlockingIOError, InterruptedError):
+            return None
+        return self._view[:n]
+
+    def recv(self, timeout: Optional[float] = None) -> Optional[memoryview]:
+        """
+        Espera como mucho ``timeout`` segundos a la siguiente trama.
+
+        :return: Vista de la trama recibida, válida hasta la siguiente llamada, o None.
+        :rtype: Optional[memoryview]
+        """
+        frame = self.recv_nowait()
+        if frame is not None:
+            return frame
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if readable:
+                frame = self.recv_nowait()
+                if frame is not None:
+                    return frame
+
+    def close(self):
+        self.sock.close()
+
+
+class UDPCaptureSocket(SDCaptureSocket):
+    """
+    Socket de captura igual que :class:`SDCaptureSocket` pero que acepta cualquier
+    datagrama IPv4/UDP dirigido al puerto indicado (p. ej. los eventos SOME/IP que
+    llegan a un suscriptor), sin comprobar el Message ID.
+    """
+
+    @staticmethod
+    def _program(vlan: Optional[int], port: int) -> List[Tuple[int, int, int, int]]:
+        return udp_filter(vlan, port)
@@ -0,0 +1,304 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, TextIO, Tuple
+
+# Logger raíz de la herramienta
+ROOT_LOGGER = "tooltfg"
+# Logger de los mensajes por paquete (OFFER, eventos, suscripciones, deadlines...),
+# sujeto a limitación de tasa
+PACKET_LOGGER = ROOT_LOGGER + ".packet"
+
+# Mensajes por segundo y ráfaga admitidos por cada tipo de mensaje por paquete
+PACKET_LOG_RATE = 10.0
+PACKET_LOG_BURST = 20
+
+# Registros que caben en la cola hacia el hilo escritor antes de empezar a descartar
+QUEUE_SIZE = 10000
+
+# Etiqueta de cada nivel en el formato de texto (la misma que usaban los print)
+_LEVEL_TAGS = {
+    logging.DEBUG: "DEBUG",
+    logging.INFO: "INFO",
+    logging.WARNING: "WARN",
+    logging.ERROR: "ERROR",
+    logging.CRITICAL: "CRITICAL",
+}
+
+# Atributos propios de LogRecord: el resto son campos estructurados pasados en ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formato de texto: ``[NIVEL] mensaje campo=valor ...``.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"[{_LEVEL_TAGS.get(record.levelno, record.levelname)}] {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formato JSON de una línea por registro, con timestamp, nivel, logger, mensaje y
+    los campos estructurados.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita la tasa de cada tipo de mensaje (mismo logger y misma plantilla) con un
+    token bucket. Cuando vuelve a dejar pasar un mensaje tras haber descartado otros,
+    añade el campo ``suppressed`` con el número de descartados.
+    """
+
+    def __init__(self, rate: float = PACKET_LOG_RATE, burst: int = PACKET_LOG_BURST):
+        """
+        :param rate: Mensajes por segundo admitidos de cada tipo. 0 para no limitar.
+        :type rate: float
+
+        :param burst: Número de mensajes seguidos admitidos antes de limitar.
+        :type burst: int
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets: Dict[Tuple[str, Any], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rate:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # [tokens, último instante, descartados]
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            bucket[2] += 1
+            return False
+        bucket[0] = tokens - 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que descarta (y cuenta) los registros si la cola está llena, en lugar
+    de bloquear al hilo que registra.
+
+    A diferencia de ``QueueHandler``, no da formato al registro antes de encolarlo: el
+    mensaje, sus argumentos y la excepción se formatean en el hilo del
+    ``QueueListener``, fuera del camino de envío.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Copia sin formatear (msg, args y exc_info intactos): otros handlers del mismo
+        # logger pueden seguir usando el registro original
+        return copy.copy(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_rate_filter: Optional[RateLimitFilter] = None
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "text",
+    stream: TextIO = None,
+    path: Optional[str] = None,
+    packet_rate: float = PACKET_LOG_RATE,
+    packet_burst: int = PACKET_LOG_BURST
+):
+    """
+    Configura el logging de la herramienta: el hilo que genera un registro solo lo
+    encola, y un hilo en segundo plano (``QueueListener``) le da formato y lo escribe,
+    de modo que la E/S de la terminal o del fichero no bloquea el envío. Si ya estaba configurado se
+    sustituye la configuración anterior.
+
+    :param level: Nivel mínimo ("DEBUG", "INFO", "WARNING", "ERROR").
+    :type level: str
+
+    :param fmt: Formato de salida: "text" o "json".
+    :type fmt: str
+
+    :param stream: Flujo de salida. Por defecto ``sys.stdout``.
+    :type stream: TextIO
+
+    :param path: Fichero en el que escribir en lugar de ``stream``.
+    :type path: str
+
+    :param packet_rate: Mensajes por segundo admitidos de cada tipo de mensaje por
+        paquete. 0 para no limitar.
+    :type packet_rate: float
+
+    :param packet_burst: Ráfaga admitida de cada tipo de mensaje por paquete.
+    :type packet_burst: int
+
+    :raises ValueError: Si el nivel o el formato no son válidos.
+    """
+    global _listener, _queue_handler, _rate_filter
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Formato de log no válido: {fmt}")
+    numeric_level = logging.getLevelName(level.upper())
+    if not isinstance(numeric_level, int):
+        raise ValueError(f"Nivel de log no válido: {level}")
+
+    with _lock:
+        _shutdown()
+        if path:
+            output = logging.FileHandler(path, encoding="utf-8")
+        else:
+            output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        log_queue = queue.Queue(QUEUE_SIZE)
+        _queue_handler = _DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.handlers[:] = [_queue_handler]
+        root.setLevel(numeric_level)
+        root.propagate = False
+
+        packet = logging.getLogger(PACKET_LOGGER)
+        if _rate_filter is not None:
+            packet.removeFilter(_rate_filter)
+        _rate_filter = RateLimitFilter(packet_rate, packet_burst)
+        packet.addFilter(_rate_filter)
+
+        _listener.start()
+
+
+def _shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def shutdown_logging():
+    """
+    Vacía la cola de registros pendientes y detiene el hilo escritor.
+    """
+    with _lock:
+        _shutdown()
+
+
+atexit.register(shutdown_logging)
+
+
+class _DefaultSetupHandler(logging.Handler):
+    """
+    Handler inicial del logger raíz: con el primer registro, si nadie ha llamado a
+    :func:`setup_logging`, configura el logging por defecto y le entrega el registro.
+    Así importar un módulo no arranca el hilo escritor.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        with _lock:
+            configured = _listener is not None
+        if not configured:
+            setup_logging()
+        _queue_handler.handle(record)
+
+
+_root = logging.getLogger(ROOT_LOGGER)
+_root.handlers[:] = [_DefaultSetupHandler()]
+_root.setLevel(logging.INFO)
+_root.propagate = False
+
+
+def get_logger(name: str = "") -> logging.Logger:
+    """
+    Devuelve un logger de la herramienta (``tooltfg.<name>``).
+
+    :param name: Nombre del módulo o componente. "packet" para los mensajes por paquete.
+    :type name: str
+
+    :return: Logger.
+    :rtype: logging.Logger
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}" if name else ROOT_LOGGER)
+
+
+def dropped_records() -> int:
+    """
+    Devuelve el número de registros descartados por tener la cola llena.
+    """
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+class PacketDump():
+    """
+    Volcado diferido de un paquete de Scapy para los registros de nivel DEBUG: el
+    paquete solo se renderiza (``show(dump=True)``) si el registro llega a formatearse.
+
+    El registro se formatea más tarde en el hilo del listener, así que se guarda una
+    copia del paquete al crear el volcado: los paquetes y buffers que se reutilizan
+    entre eventos (p. ej. la capa ``Someip.some`` o el buffer de una plantilla) ya
+    pueden haber cambiado cuando se formatea.
+    """
+    __slots__ = ("packet",)
+
+    def __init__(self, packet: Any):
+        if isinstance(packet, (bytes, bytearray, memoryview)):
+            self.packet = bytes(packet)
+        else:
+            self.packet = packet.copy()
+
+    def __str__(self) -> str:
+        if isinstance(self.packet, bytes):
+            return self.packet.hex()
+        return self.packet.show(dump=True)
@@ -1,9 +1,243 @@
-from SomeIPLab import MyLab
+import argparse
+import resource
+import sys
+import time
 
-def main():    
-    test = MyLab()
-    a = test.start_someip_server(ecu_pair=("PCU_Proxy_Frontend", "IVC"), service_id=140)
-    print(f"[RESULTADO] Éxito: {a[0]} | Comentario: {a[1]}")
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulador de servidor SOME/IP")
+    parser.add_argument("--src", default="PCU_Proxy_Frontend", help="ECU simulada (origen)")
+    parser.add_argument("--dst", default="IVC", help="ECU real (destino)")
+    parser.add_argument("--service", type=int, default=140, help="ID del método a simular")
+    parser.add_argument("--method", type=int, action="append", default=[], metavar="ID",
+                        help="Atender también el método REQUEST/REQUEST_NO_RETURN con este ID (repetible)")
+    parser.add_argument("--duration", type=float, default=None, help="Duración máxima en segundos")
+    parser.add_argument("--multicast-threshold", type=int, default=None,
+                        help="Suscriptores a partir de los cuales los eventos se envían por multicast")
+    parser.add_argument("--offer-cycle", type=float, default=None,
+                        help="Periodo en segundos de los OFFER en la fase principal (por defecto 1)")
+    parser.add_argument("--offer-ttl", type=int, default=None, help="TTL en segundos de los OFFER (por defecto 3)")
+    parser.add_argument("--legacy", action="store_true",
+                        help="Construir cada evento apilando capas de Scapy en lugar de usar plantillas")
+    parser.add_argument("--pcap-out", default=None,
+                        help="Escribir las tramas en este fichero pcapng en lugar de enviarlas por la red")
+    parser.add_argument("--events-only", action="store_true",
+                        help="Enviar solo los eventos cíclicos durante --duration segundos, sin servidor")
+    parser.add_argument("--fast", action="store_true",
+                        help="Con --events-only, generar los eventos sin esperar entre ciclos (reloj simulado); "
+                             "con --replay, enviar tan rápido como sea posible")
+    parser.add_argument("--replay", default=None, metavar="FICHERO",
+                        help="Reproducir una captura pcap/pcapng en lugar de simular el servidor")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Con --replay, factor de velocidad respecto a la captura (0 o --fast: sin esperas)")
+    parser.add_argument("--loops", type=int, default=1, help="Con --replay, número de repeticiones")
+    parser.add_argument("--rewrite", action="store_true",
+                        help="Con --replay, reescribir MAC, IP, VLAN y Session ID con los datos de --src/--dst")
+    parser.add_argument("--interface", default=None,
+                        help="Con --replay, interfaz de salida (por defecto la de --src)")
+    parser.add_argument("--client", action="store_true",
+                        help="Actuar como cliente (ECU --dst): suscribirse a --service y medir los eventos "
+                             "recibidos durante --duration segundos")
+    parser.add_argument("--server-ip", default=None,
+                        help="Con --client, IP del socket SD del servidor (por defecto la de --src)")
+    parser.add_argument("--bind-ip", default=None, help="Con --client, IP local de los sockets")
+    parser.add_argument("--endpoint-ip", default=None,
+                        help="Con --client, IP anunciada para recibir los eventos (por defecto la de --dst)")
+    parser.add_argument("--capture", default=None, metavar="INTERFAZ",
+                        help="Con --client, capturar los eventos en esta interfaz en lugar de recibirlos por UDP")
+    parser.add_argument("--timestamps", action="store_true",
+                        help="Añadir (servidor) o leer (cliente) el timestamp de envío de cada evento "
+                             "para medir la latencia")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Servir las métricas en formato Prometheus en http://127.0.0.1:PUERTO/metrics")
+    parser.add_argument("--stats-interval", type=float, default=None,
+                        help="Mostrar un resumen de las métricas cada N segundos")
+    parser.add_argument("--log-level", type=str.upper, choices=("DEBUG", "INFO", "WARNING", "ERROR"), default="INFO",
+                        help="Nivel de log (DEBUG muestra además el volcado completo de los paquetes)")
+    parser.add_argument("--log-format", choices=("text", "json"), default="text", help="Formato de los logs")
+    parser.add_argument("--log-file", default=None, help="Escribir los logs en este fichero")
+    parser.add_argument("--packet-log-rate", type=float, default=None,
+                        help="Mensajes por segundo de cada tipo de log por paquete (0 para no limitar)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Mostrar el tiempo de importación y la memoria antes de arrancar")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Solo importar los módulos, mostrar el informe de arranque y salir")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="Terminar con error si la importación supera este tiempo (para CI)")
+    return parser.parse_args(argv)
+
+
+def _rss_kb() -> int:
+    """
+    Devuelve la memoria residente actual del proceso en KB.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def startup_report(import_seconds: float) -> str:
+    """
+    Resume el coste de arranque: tiempo de importación, memoria y qué partes de Scapy
+    se han cargado.
+    """
+    heavy = [name for name in ("scapy.all", "scapy.layers.all", "scapy.contrib.automotive.someip")
+             if name in sys.modules]
+    return (
+        f"[INFO] Arranque: importación {import_seconds * 1000:.1f} ms | "
+        f"RSS {_rss_kb() / 1024:.1f} MB | pico {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB | "
+        f"módulos cargados {len(sys.modules)} | Scapy pesado: {', '.join(heavy) if heavy else 'no'}"
+    )
+
+
+def replay(args: argparse.Namespace) -> int:
+    """
+    Reproduce la captura de ``--replay`` por la interfaz (o el fichero pcapng) de salida.
+    """
+    from parser import Parser
+    from replay import FrameRewriter, Replayer
+    from transmit import get_transmitter
+
+    config = Parser().registry
+    data_dst = config.ecu_pair(args.src, args.dst)
+    if data_dst is None:
+        print(f"[ERROR] ECUs no encontradas: {args.src} -> {args.dst}")
+        return 1
+    rewriter = None
+    if args.rewrite:
+        multicast = config.multicast(args.src) if "MAC_1500_MULTICAST" in config.ecu(args.src) else None
+        rewriter = FrameRewriter(data_dst, multicast)
+
+    tx = get_transmitter(args.interface or data_dst["interface"])
+    speed = None if args.fast else args.speed
+    print(f"[INFO] Reproduciendo {args.replay} por {tx.interface} "
+          f"({'sin esperas' if not speed or speed <= 0 else f'x{speed:g}'}, {args.loops} repeticiones)")
+    deadline = None if args.duration is None else time.monotonic() + args.duration
+    stats = Replayer(tx, rewriter, speed).replay(
+        args.replay, args.loops,
+        is_alive=lambda: deadline is None or time.monotonic() < deadline
+    )
+    rate = stats.frames / stats.elapsed if stats.elapsed else 0.0
+    print(f"[RESULTADO] {stats.frames} tramas ({stats.bytes} bytes) en {stats.elapsed:.3f} s "
+          f"({rate:.0f} tramas/s) | enviadas {stats.sent} | descartadas {stats.dropped} | "
+          f"retraso máximo {stats.max_lateness * 1000:.2f} ms")
+    return 0 if stats.dropped == 0 else 1
+
+
+def client(args: argparse.Namespace) -> int:
+    """
+    Se suscribe a ``--service`` como la ECU ``--dst`` y muestra las estadísticas de los
+    eventos recibidos.
+    """
+    from someipClient import SomeipClient
+
+    if args.duration is None:
+        print("[ERROR] --client necesita --duration")
+        return 1
+    try:
+        someip_client = SomeipClient(
+            args.src, args.dst, [args.service],
+            server_ip=args.server_ip, bind_ip=args.bind_ip, endpoint_ip=args.endpoint_ip,
+            capture_interface=args.capture, timestamps=args.timestamps
+        )
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    results = someip_client.run(args.duration)
+    print(f"[RESULTADO] Suscripciones aceptadas: {someip_client.acks} | rechazadas: {someip_client.nacks}")
+    received = 0
+    for stats in results.values():
+        received += stats["received"]
+        line = (
+            f"[RESULTADO] {stats['msg_id']}: {stats['received']} eventos ({stats['events_per_s']:.1f}/s, "
+            f"{stats['bytes_per_s'] / 1000:.1f} kB/s) | perdidos {stats['lost']} ({stats['loss_pct']:.2f} %) | "
+            f"desordenados {stats['reordered']} | jitter p50 {stats['jitter_p50_ms']:.3f} ms "
+            f"p99 {stats['jitter_p99_ms']:.3f} ms máx {stats['jitter_max_ms']:.3f} ms"
+        )
+        if "latency_p50_ms" in stats:
+            line += (f" | latencia p50 {stats['latency_p50_ms']:.3f} ms p99 {stats['latency_p99_ms']:.3f} ms "
+                     f"máx {stats['latency_max_ms']:.3f} ms")
+        print(line)
+    return 0 if received else 1
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    from logger import PACKET_LOG_RATE, setup_logging
+    setup_logging(
+        args.log_level, args.log_format, path=args.log_file,
+        packet_rate=PACKET_LOG_RATE if args.packet_log_rate is None else args.packet_log_rate
+    )
+
+    start = time.perf_counter()
+    from SomeIPLab import MyLab
+    import_seconds = time.perf_counter() - start
+
+    if args.startup_report or args.dry_run:
+        print(startup_report(import_seconds))
+    if args.max_import_ms is not None and import_seconds * 1000 > args.max_import_ms:
+        print(f"[ERROR] La importación ha tardado {import_seconds * 1000:.1f} ms (límite {args.max_import_ms} ms)")
+        return 1
+    if args.dry_run:
+        return 0
+
+    if args.pcap_out:
+        from transmit import close_pcap_output, set_pcap_output
+        writer = set_pcap_output(args.pcap_out)
+    metrics_server = stats = None
+    if args.metrics_port is not None:
+        from metrics import MetricsServer
+        metrics_server = MetricsServer(args.metrics_port).start()
+    if args.stats_interval:
+        from metrics import StatsDumper
+        stats = StatsDumper(args.stats_interval).start()
+
+    try:
+        if args.replay:
+            return replay(args)
+        if args.client:
+            return client(args)
+
+        test = MyLab(use_templates=not args.legacy)
+        if args.events_only:
+            if args.duration is None:
+                print("[ERROR] --events-only necesita --duration")
+                return 1
+            start = time.perf_counter()
+            scheduler = test.run_cyclic_events(
+                [args.service], args.duration, ecu_pair=(args.src, args.dst), realtime=not args.fast
+            )
+            elapsed = time.perf_counter() - start
+            runs = sum(task.runs for task in scheduler.tasks())
+            print(f"[RESULTADO] {runs} eventos generados en {elapsed:.3f} s ({runs / elapsed:.0f} eventos/s)")
+            return 0
+
+        # Sin --offer-cycle/--offer-ttl se usan los valores por defecto de sdPhases
+        offer = {name: value for name, value in (("offer_cycle", args.offer_cycle), ("offer_ttl", args.offer_ttl))
+                 if value is not None}
+        a = test.start_someip_server(
+            ecu_pair=(args.src, args.dst),
+            service_id=args.service,
+            duration=args.duration,
+            multicast_threshold=args.multicast_threshold,
+            timestamp_events=args.timestamps,
+            method_ids=tuple(args.method),
+            **offer
+        )
+        print(f"[RESULTADO] Éxito: {a[0]} | Comentario: {a[1]}")
+        return 0 if a[0] else 1
+    finally:
+        if stats is not None:
+            stats.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if args.pcap_out:
+            print(f"[INFO] {writer.frames} tramas ({writer.bytes} bytes) escritas en {args.pcap_out}")
+            close_pcap_output()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
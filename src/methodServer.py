@@ -0,0 +1,284 @@
+import asyncio
+import inspect
+import socket
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple, Union
+from parser import Parser
+from pluginRegistry import get_plugin_registry
+from socketUDP import socketHandler
+from metrics import REQUESTS, RESPONSES, TX_ERRORS
+from sdCodec import (
+    E_MALFORMED_MESSAGE, E_NOT_OK, E_NOT_READY, E_OK, E_UNKNOWN_METHOD, E_UNKNOWN_SERVICE,
+    E_WRONG_INTERFACE_VERSION, E_WRONG_MESSAGE_TYPE, E_WRONG_PROTOCOL_VERSION, MSG_ERROR,
+    MSG_REQUEST, MSG_REQUEST_NO_RETURN, MSG_RESPONSE, PROTOCOL_VERSION, SOMEIP_HEADER_LEN,
+    decode_someip_header, encode_someip_header
+)
+from logger import get_logger
+
+log = get_logger("methods")
+# Mensajes por petición (errores de los manejadores), con limitación de tasa
+packet_log = get_logger("packet")
+
+# Datagramas que se leen como máximo cada vez que el socket está legible, para no
+# retrasar al resto de tareas del bucle (eventos cíclicos, OFFER) durante una ráfaga
+RECV_BATCH = 256
+# Peticiones con respuesta diferida (manejadores asíncronos) en curso a la vez
+MAX_PENDING = 1024
+# Tamaño del buffer de recepción del socket, para absorber ráfagas de peticiones
+RCVBUF_SIZE = 4 << 20
+
+Result = Union[bytes, bytearray, memoryview, None]
+Handler = Callable[[memoryview], Union[Result, Awaitable[Result]]]
+
+
+class _Method(NamedTuple):
+    """
+    Método atendido: manejador, tipo de mensaje que acepta, versión de interfaz y
+    contadores.
+    """
+    handle: Handler
+    msg_type: int
+    iface_ver: int
+    requests: Any
+    name: str
+
+
+class MethodServer():
+    """
+    Servidor de métodos SOME/IP (REQUEST y REQUEST_NO_RETURN) sobre el socket UDP del
+    endpoint que anuncian los OFFER.
+
+    Los métodos se definen en ``services.json`` con ``SOMEIP.MessageType`` 0 (REQUEST)
+    o 1 (REQUEST_NO_RETURN) y el campo ``Response`` con el nombre del manejador en su
+    plugin (ver :meth:`PluginRegistry.bind_method`), que se resuelve una sola vez.
+
+    Cada vez que el socket está legible se drenan hasta ``batch`` datagramas sin
+    bloquear y cada petición se despacha en el momento: la RESPONSE (o el ERROR) lleva
+    el mismo Message ID, Client ID y Session ID que la petición y se envía al emisor.
+    Si el manejador devuelve un awaitable, la petición queda en curso y se responde al
+    completarse, sin detener la lectura de las siguientes; por encima de
+    ``max_pending`` peticiones en curso se responde ``E_NOT_READY``.
+
+    Como indica SOME/IP, los REQUEST_NO_RETURN nunca se responden, ni siquiera con un
+    ERROR.
+
+    :ivar sock: Socket UDP, o None si no está abierto.
+    """
+
+    def __init__(self, method_ids: Iterable[int], batch: int = RECV_BATCH, max_pending: int = MAX_PENDING):
+        """
+        :param method_ids: IDs (campo ``ID`` de services.json) de los métodos a atender.
+        :type method_ids: Iterable[int]
+
+        :param batch: Datagramas leídos como máximo por cada aviso de socket legible.
+        :type batch: int
+
+        :param max_pending: Peticiones asíncronas en curso admitidas.
+        :type max_pending: int
+
+        :raises ValueError: Si un método no existe, no es REQUEST/REQUEST_NO_RETURN o su
+            plugin no implementa el manejador.
+        """
+        if batch < 1:
+            raise ValueError(f"Tamaño de lote no válido: {batch}")
+        self.batch = batch
+        self.max_pending = max_pending
+        self.sock: Optional[socket.socket] = None
+        self._buffer = bytearray(65535)
+        self._view = memoryview(self._buffer)
+        self._pending: Set[asyncio.Future] = set()
+
+        parser = Parser()
+        plugins = get_plugin_registry()
+        # Métodos indexados por Message ID (Service ID y Method ID)
+        self._methods: Dict[int, _Method] = {}
+        self._services: Set[int] = set()
+        for method_id in method_ids:
+            data = parser.get_service_data(method_id)
+            if data is None:
+                raise ValueError(f"Método {method_id} no definido en services.json")
+            someip = data["SOMEIP"]
+            if someip["MessageType"] not in (MSG_REQUEST, MSG_REQUEST_NO_RETURN):
+                raise ValueError(f"El método {method_id} no es de tipo REQUEST ni REQUEST_NO_RETURN")
+            handler = plugins.bind_method(data)
+            self._methods[(someip["ServID"] << 16) | someip["MethodID"]] = _Method(
+                handler.handle, someip["MessageType"], int(data["OFFER"]["Major_Version"], 16),
+                REQUESTS.labels(method_id), data["method_name"]
+            )
+            self._services.add(someip["ServID"])
+        self._responses = RESPONSES.labels("response")
+        self._errors = RESPONSES.labels("error")
+        self._tx_errors = TX_ERRORS.labels("response")
+
+    def open(self, ip: str, port: int) -> socket.socket:
+        """
+        Abre el socket UDP de los métodos, no bloqueante y con un buffer de recepción
+        amplio.
+
+        :param ip: IP local de la ECU simulada.
+        :type ip: str
+
+        :param port: Puerto del endpoint anunciado en los OFFER.
+        :type port: int
+
+        :return: Socket abierto.
+        :rtype: socket.socket
+        """
+        self.sock = socketHandler().bind_udp_socket(ip, port)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+        return self.sock
+
+    def close(self):
+        """
+        Cancela las peticiones en curso y cierra el socket.
+        """
+        for future in list(self._pending):
+            future.cancel()
+        self._pending.clear()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    @property
+    def pending(self) -> int:
+        """
+        Número de peticiones asíncronas en curso.
+        """
+        return len(self._pending)
+
+    def on_readable(self):
+        """
+        Lee y atiende hasta ``batch`` datagramas pendientes sin bloquear. Pensado como
+        callback de ``loop.add_reader``: si quedan datagramas, el bucle lo vuelve a
+        llamar tras atender al resto de tareas.
+        """
+        recvfrom_into = self.sock.recvfrom_into
+        view = self._view
+        for _ in range(self.batch):
+            try:
+                n, addr = recvfrom_into(self._buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            # Se copia el datagrama: un manejador asíncrono puede usar la payload
+            # después de que el buffer se reutilice
+            self.handle_datagram(bytes(view[:n]), addr)
+
+    def handle_datagram(self, data: bytes, addr: Tuple[str, int]):
+        """
+        Atiende una petición SOME/IP y envía su respuesta, si la tiene.
+
+        :param data: Contenido UDP del datagrama.
+        :type data: bytes
+
+        :param addr: Dirección (IP, puerto) del emisor.
+        :type addr: Tuple[str, int]
+        """
+        if len(data) < SOMEIP_HEADER_LEN:
+            packet_log.warning("Datagrama de %d bytes recibido de %s:%d: demasiado corto", len(data), *addr)
+            return
+        header = decode_someip_header(data)
+        if header.msg_type not in (MSG_REQUEST, MSG_REQUEST_NO_RETURN):
+            return
+        expects_response = header.msg_type == MSG_REQUEST
+
+        if header.proto_ver != PROTOCOL_VERSION:
+            self._reply_error(header, addr, E_WRONG_PROTOCOL_VERSION, expects_response)
+            return
+        method = self._methods.get(header.msg_id)
+        if method is None:
+            code = E_UNKNOWN_METHOD if header.msg_id >> 16 in self._services else E_UNKNOWN_SERVICE
+            self._reply_error(header, addr, code, expects_response)
+            return
+        method.requests.inc()
+        if header.iface_ver != method.iface_ver:
+            self._reply_error(header, addr, E_WRONG_INTERFACE_VERSION, expects_response)
+            return
+        if header.msg_type != method.msg_type:
+            self._reply_error(header, addr, E_WRONG_MESSAGE_TYPE, expects_response)
+            return
+        end = 8 + header.length
+        if header.length < 8 or end > len(data):
+            self._reply_error(header, addr, E_MALFORMED_MESSAGE, expects_response)
+            return
+
+        try:
+            result = method.handle(memoryview(data)[SOMEIP_HEADER_LEN:end])
+        except ValueError as e:
+            packet_log.warning("Petición mal formada a %s desde %s:%d: %s", method.name, addr[0], addr[1], e)
+            self._reply_error(header, addr, E_MALFORMED_MESSAGE, expects_response)
+            return
+        except Exception as e:
+            packet_log.error("Error en el manejador de %s: %s", method.name, e)
+            self._reply_error(header, addr, E_NOT_OK, expects_response)
+            return
+
+        if inspect.isawaitable(result):
+            self._defer(result, method, header, addr, expects_response)
+        elif expects_response:
+            self._reply(header, addr, result)
+
+    def _defer(self, result: Awaitable[Result], method: _Method, header: Any, addr: Tuple[str, int], expects_response: bool):
+        """
+        Deja en curso una petición con respuesta diferida y la responde al completarse.
+        """
+        if len(self._pending) >= self.max_pending:
+            if inspect.iscoroutine(result):
+                result.close()
+            self._reply_error(header, addr, E_NOT_READY, expects_response)
+            return
+        future = asyncio.ensure_future(result)
+        self._pending.add(future)
+
+        def done(future: asyncio.Future):
+            self._pending.discard(future)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                if expects_response:
+                    self._reply(header, addr, future.result())
+            elif isinstance(error, ValueError):
+                packet_log.warning("Petición mal formada a %s desde %s:%d: %s", method.name, addr[0], addr[1], error)
+                self._reply_error(header, addr, E_MALFORMED_MESSAGE, expects_response)
+            else:
+                packet_log.error("Error en el manejador de %s: %s", method.name, error)
+                self._reply_error(header, addr, E_NOT_OK, expects_response)
+
+        future.add_done_callback(done)
+
+    def _send(self, message: bytes, addr: Tuple[str, int]) -> bool:
+        if self.sock is None:
+            return False
+        try:
+            self.sock.sendto(message, addr)
+        except OSError as e:
+            # Con el buffer de envío lleno se descarta la respuesta, como haría la red
+            self._tx_errors.inc()
+            packet_log.error("No se ha podido enviar la respuesta a %s:%d: %s", addr[0], addr[1], e)
+            return False
+        return True
+
+    def _reply(self, header: Any, addr: Tuple[str, int], payload: Result):
+        payload = b"" if payload is None else payload
+        message = encode_someip_header(
+            header.msg_id, len(payload), header.session_id, MSG_RESPONSE,
+            header.client_id, PROTOCOL_VERSION, header.iface_ver, E_OK
+        ) + payload
+        if self._send(message, addr):
+            self._responses.inc()
+
+    def _reply_error(self, header: Any, addr: Tuple[str, int], code: int, expects_response: bool):
+        """
+        Responde con un mensaje ERROR sin payload. Los REQUEST_NO_RETURN se descartan
+        sin respuesta.
+        """
+        if not expects_response:
+            return
+        message = encode_someip_header(
+            header.msg_id, 0, header.session_id, MSG_ERROR,
+            header.client_id, PROTOCOL_VERSION, header.iface_ver, code
+        )
+        if self._send(message, addr):
+            self._errors.inc()
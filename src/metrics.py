@@ -0,0 +1,416 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from logger import get_logger
+
+log = get_logger("metrics")
+
+# Límites (en segundos) de los buckets de latencia y jitter: de 10 us a 50 ms, que
+# cubre holgadamente un ciclo de 20 ms
+LATENCY_BUCKETS = (
+    10e-6, 25e-6, 50e-6, 100e-6, 250e-6, 500e-6,
+    1e-3, 2.5e-3, 5e-3, 10e-3, 20e-3, 50e-3
+)
+
+# Dirección en la que escucha el endpoint de métricas: solo local
+METRICS_HOST = "127.0.0.1"
+
+
+class Counter():
+    """
+    Contador monótono.
+
+    No usa locks: las métricas del camino crítico se actualizan desde el hilo del
+    servidor y un incremento es una suma sobre un entero. Los lectores (endpoint o
+    volcado periódico) solo leen el valor.
+
+    Si se declara con etiquetas, :meth:`labels` devuelve el contador hijo de cada
+    combinación de valores; conviene guardarlo para no resolverlo en cada evento.
+
+    :ivar name: Nombre de la métrica.
+    :ivar value: Valor actual.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = (), labelvalues: Tuple = ()):
+        self.name = name
+        self.help = description
+        self.labelnames = tuple(labelnames)
+        self.labelvalues = labelvalues
+        self.value = 0
+        self._children: Dict[Tuple, "Counter"] = {}
+
+    def inc(self, amount: Union[int, float] = 1):
+        self.value += amount
+
+    def labels(self, *values: Any) -> "Counter":
+        """
+        Devuelve el contador hijo de los valores de etiqueta indicados, creándolo la
+        primera vez.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labelnames}")
+            child = self._children.setdefault(key, Counter(self.name, self.help, self.labelnames, key))
+        return child
+
+    def series(self) -> List["Counter"]:
+        """
+        Devuelve las series con valor: los hijos si la métrica tiene etiquetas o ella misma.
+        """
+        return list(self._children.values()) if self.labelnames and not self.labelvalues else [self]
+
+    def total(self) -> Union[int, float]:
+        return sum(series.value for series in self.series())
+
+
+class Histogram():
+    """
+    Histograma de buckets fijos.
+
+    Cada observación es una búsqueda binaria sobre los límites y dos sumas, sin locks
+    ni memoria adicional, por lo que se puede registrar en cada ciclo.
+
+    :ivar name: Nombre de la métrica.
+    :ivar bounds: Límites superiores de los buckets (sin incluir +Inf).
+    :ivar counts: Observaciones de cada bucket (el último es +Inf), no acumuladas.
+    :ivar count: Número total de observaciones.
+    :ivar sum: Suma de las observaciones.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str = "", bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = description
+        self.labelnames = ()
+        self.labelvalues = ()
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def series(self) -> List["Histogram"]:
+        return [self]
+
+    def quantile(self, q: float) -> float:
+        """
+        Estima un cuantil como el límite superior del bucket en el que cae. Devuelve
+        ``inf`` si cae en el último bucket y 0 si no hay observaciones.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+Metric = Union[Counter, Histogram]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry():
+    """
+    Registro de métricas del proceso. Genera la exposición en formato texto de
+    Prometheus y un resumen de una línea para los volcados periódicos.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"La métrica {metric.name} ya está registrada con otro tipo")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, description: str = "", labelnames: Sequence[str] = ()) -> Counter:
+        """
+        Registra (o devuelve, si ya existe) un contador.
+        """
+        return self._register(Counter(name, description, labelnames))
+
+    def histogram(self, name: str, description: str = "", bounds: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """
+        Registra (o devuelve, si ya existe) un histograma.
+        """
+        return self._register(Histogram(name, description, bounds))
+
+    def metrics(self) -> List[Metric]:
+        return list(self._metrics.values())
+
+    def render(self) -> str:
+        """
+        Devuelve todas las métricas en formato texto de Prometheus.
+        """
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.bounds, metric.counts):
+                    cumulative += count
+                    lines.append(f'{metric.name}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric.name}_bucket{{le="+Inf"}} {metric.count}')
+                lines.append(f"{metric.name}_sum {metric.sum:.9f}")
+                lines.append(f"{metric.name}_count {metric.count}")
+            else:
+                for series in metric.series():
+                    lines.append(f"{metric.name}{_format_labels(series.labelnames, series.labelvalues)} {series.value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        Resume las métricas en una línea: el total de cada contador y el p50/p99
+        aproximado (en ms) de cada histograma.
+        """
+        parts = []
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    parts.append(
+                        f"{metric.name} p50<={metric.quantile(0.5) * 1000:g}ms "
+                        f"p99<={metric.quantile(0.99) * 1000:g}ms (n={metric.count})"
+                    )
+            else:
+                parts.append(f"{metric.name}={metric.total()}")
+        return " | ".join(parts)
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """
+    Devuelve el registro de métricas compartido por todo el proceso.
+    """
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+
+# Métricas del servidor SOME/IP
+FRAMES_SENT = get_metrics().counter(
+    "someip_frames_sent_total", "Tramas de eventos enviadas por servicio (una por segmento SOME/IP-TP)", ("service",))
+SD_OFFERS = get_metrics().counter("someip_sd_offers_total", "OFFER enviados")
+SD_ACKS = get_metrics().counter(
+    "someip_sd_acks_total", "SubscribeEventgroupAck enviados (result=ack|nack)", ("result",))
+SUBSCRIBES = get_metrics().counter(
+    "someip_sd_subscribes_received_total", "Entradas SubscribeEventgroup recibidas (incluidos StopSubscribe)")
+MISSED_DEADLINES = get_metrics().counter(
+    "someip_missed_deadlines_total", "Deadlines de eventos cíclicos perdidos por servicio", ("service",))
+TX_ERRORS = get_metrics().counter(
+    "someip_tx_errors_total", "Tramas que no se han podido enviar (kind=event|sd|response)", ("kind",))
+TP_DROPPED = get_metrics().counter(
+    "someip_tp_messages_dropped_total", "Mensajes SOME/IP-TP sustituidos por uno más reciente antes de enviarse")
+REQUESTS = get_metrics().counter(
+    "someip_requests_total", "Peticiones REQUEST/REQUEST_NO_RETURN recibidas por método", ("method",))
+RESPONSES = get_metrics().counter(
+    "someip_responses_total", "Respuestas enviadas (result=response|error)", ("result",))
+SEND_LATENCY = get_metrics().histogram(
+    "someip_send_latency_seconds", "Duración de cada envío (trama o lote) al transmisor")
+CYCLE_JITTER = get_metrics().histogram(
+    "someip_cycle_jitter_seconds", "Retraso de cada ejecución cíclica respecto a su deadline")
+
+
+def timed_send_batch(send_batch: Callable[[List[Any]], Any]) -> Callable[[List[Any]], Any]:
+    """
+    Envuelve ``send_batch`` de un transmisor para registrar la latencia de cada lote y
+    las tramas descartadas. Pensado como ``flush`` de :class:`CyclicScheduler`.
+    """
+    clock = time.perf_counter
+    latency = SEND_LATENCY
+    errors = TX_ERRORS.labels("event")
+
+    def flush(frames: List[Any]):
+        start = clock()
+        result = send_batch(frames)
+        latency.observe(clock() - start)
+        if result is not None and result.dropped:
+            errors.inc(result.dropped)
+        return result
+
+    return flush
+
+
+class SentFramesCounter():
+    """
+    Cuenta las tramas de eventos por servicio (``someip_frames_sent_total``) una vez
+    enviadas, no al construirlas.
+
+    Las tareas del planificador anotan con :meth:`add` las tramas que devuelven en el
+    tick y el ``flush`` que devuelve :meth:`wrap` las cuenta después de enviar el lote.
+    ``BatchResult`` dice cuántas tramas se han descartado pero no cuáles, así que en
+    un lote con descartes cada servicio se cuenta en proporción a las enviadas. Los
+    contadores hijos se resuelven una vez por servicio.
+    """
+
+    def __init__(self):
+        self._children: Dict[Any, Counter] = {}
+        self._pending: Dict[Any, int] = {}
+
+    def add(self, service: Any, n: int = 1):
+        """
+        Anota ``n`` tramas de un servicio en el lote del tick en curso.
+        """
+        self._pending[service] = self._pending.get(service, 0) + n
+
+    def inc(self, service: Any, n: int = 1):
+        """
+        Cuenta ``n`` tramas de un servicio ya enviadas.
+        """
+        child = self._children.get(service)
+        if child is None:
+            child = self._children[service] = FRAMES_SENT.labels(service)
+        child.inc(n)
+
+    def wrap(self, send_batch: Callable[[List[Any]], Any]) -> Callable[[List[Any]], Any]:
+        """
+        Igual que :func:`timed_send_batch`, pero además cuenta las tramas anotadas con
+        :meth:`add` cuando el lote se ha enviado.
+        """
+        flush = timed_send_batch(send_batch)
+
+        def counted_flush(frames: List[Any]):
+            # Si el envío lanza una excepción las tramas anotadas no se cuentan
+            pending, self._pending = self._pending, {}
+            result = flush(frames)
+            dropped = result is not None and result.dropped
+            for service, n in pending.items():
+                if dropped:
+                    n = n * result.sent // len(frames)
+                if n:
+                    self.inc(service, n)
+            return result
+
+        return counted_flush
+
+
+def observe_lateness(task: Any, lateness: float):
+    """
+    Registra el jitter de una ejecución cíclica. Pensado como ``on_run`` de
+    :class:`CyclicScheduler`.
+    """
+    CYCLE_JITTER.observe(lateness)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer():
+    """
+    Endpoint HTTP local (``127.0.0.1``) que sirve las métricas en formato Prometheus
+    en ``/metrics``, desde un hilo en segundo plano.
+
+    :ivar port: Puerto en el que escucha (útil si se pidió el 0).
+    """
+
+    def __init__(self, port: int, registry: Optional[MetricsRegistry] = None, host: str = METRICS_HOST):
+        """
+        :param port: Puerto TCP. Con 0 se elige uno libre.
+        :type port: int
+
+        :param registry: Registro a exponer. Por defecto el compartido.
+        :type registry: MetricsRegistry
+
+        :param host: Dirección de escucha.
+        :type host: str
+        """
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or get_metrics()})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics", daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        log.info("Métricas disponibles en http://%s:%d/metrics", METRICS_HOST, self.port)
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StatsDumper():
+    """
+    Vuelca periódicamente un resumen de las métricas desde un hilo en segundo plano.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        registry: Optional[MetricsRegistry] = None,
+        write: Callable[[str], Any] = print
+    ):
+        """
+        :param interval: Segundos entre volcados.
+        :type interval: float
+
+        :param registry: Registro a volcar. Por defecto el compartido.
+        :type registry: MetricsRegistry
+
+        :param write: Función que recibe cada línea de resumen.
+        :type write: Callable[[str], Any]
+        """
+        if interval <= 0:
+            raise ValueError(f"Intervalo no válido: {interval}")
+        self.interval = interval
+        self.registry = registry or get_metrics()
+        self.write = write
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write(f"[STATS] {self.registry.summary()}")
+
+    def start(self) -> "StatsDumper":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Detiene el volcado y escribe un último resumen.
+        """
+        self._stop.set()
+        self._thread.join()
+        self.write(f"[STATS] {self.registry.summary()}")
@@ -0,0 +1,210 @@
+import struct
+from typing import Any, Dict, Mapping, Tuple, Union
+from scapy.layers.l2 import Ether, Dot1Q
+from scapy.layers.inet import IP, UDP
+from scapy.packet import Raw
+from sdCodec import encode_someip_header
+
+# Longitud de la cabecera SOME/IP (Message ID, Length, Request ID y los cuatro bytes
+# de versiones, tipo de mensaje y código de retorno).
+SOMEIP_HEADER_LEN = 16
+# Offset del Session ID dentro de la cabecera SOME/IP
+SOMEIP_SESSION_OFFSET = 10
+# Longitud de las cabeceras Ethernet (14 bytes) y 802.1Q (4 bytes) de las tramas
+ETH_VLAN_HEADER_LEN = 14 + 4
+
+_U16 = struct.Struct("!H")
+
+
+def ones_complement_sum(data: Union[bytes, bytearray, memoryview]) -> int:
+    """
+    Calcula la suma en complemento a uno (sin plegar del todo) de un bloque de datos
+    interpretado como palabras de 16 bits en big endian.
+
+    Se aprovecha que 2^16 es congruente con 1 módulo 0xFFFF, de modo que la suma de
+    las palabras es congruente con el entero formado por todos los bytes. Esto evita
+    recorrer el bloque palabra a palabra en Python.
+
+    :param data: Bloque de bytes. Si su longitud es impar se rellena con un cero al final.
+    :type data: bytes | bytearray | memoryview
+
+    :return: Suma módulo 0xFFFF.
+    :rtype: int
+    """
+    value = int.from_bytes(data, "big")
+    if len(data) & 1:
+        value <<= 8
+    return value % 0xFFFF
+
+
+def finish_checksum(partial: int) -> int:
+    """
+    Convierte una suma módulo 0xFFFF en el valor de checksum a escribir en la cabecera.
+    Nunca devuelve 0, por lo que es válido también para UDP (donde 0 significa "sin checksum").
+
+    :param partial: Suma acumulada de ``ones_complement_sum``.
+    :type partial: int
+
+    :return: Checksum de 16 bits.
+    :rtype: int
+    """
+    return 0xFFFF - (partial % 0xFFFF)
+
+
+class EventTemplate():
+    """
+    Plantilla precompilada de un evento SOME/IP para una pareja de ECUs y un servicio.
+
+    Scapy solo se usa una vez, en la construcción, para obtener los bytes de la trama
+    completa (Ethernet, VLAN, IP, UDP, SOME/IP y payload). En cada ciclo se parchean
+    sobre un buffer preasignado únicamente los campos variables: Session ID y payload.
+    Como la longitud de la payload es fija por plantilla, las longitudes y el checksum
+    IP no cambian; el checksum UDP se recalcula de forma incremental a partir de la
+    suma precalculada de la parte fija (pseudo-cabecera, cabecera UDP y cabecera SOME/IP).
+
+    :ivar buffer: Trama completa que se reutiliza en cada ``build``.
+    :ivar view: ``memoryview`` sobre ``buffer``.
+    :ivar payload_offset: Offset de la payload dentro de la trama.
+    :ivar payload_len: Longitud fija de la payload.
+    """
+
+    def __init__(
+        self,
+        data_dst: Mapping[str, Any],
+        method_data: Mapping[str, Any],
+        payload_len: int,
+        client_id: int = 0x0701
+    ):
+        """
+        Construye la plantilla a partir de los datos de red y del servicio.
+
+        :param data_dst: Datos de red devueltos por ``Parser.ecu1_to_ecu2``.
+        :type data_dst: Mapping[str, Any]
+
+        :param method_data: Datos del método devueltos por ``Parser.get_service_data``.
+        :type method_data: Mapping[str, Any]
+
+        :param payload_len: Longitud en bytes de la payload del evento.
+        :type payload_len: int
+
+        :param client_id: Client ID de la cabecera SOME/IP.
+        :type client_id: int
+        """
+        someip_data = method_data["SOMEIP"]
+        msg_type = someip_data["MessageType"]
+        if isinstance(msg_type, str):
+            msg_type = int(msg_type, 16)
+        # La cabecera SOME/IP se codifica con struct para no cargar el módulo SOME/IP de Scapy
+        header = encode_someip_header(
+            (someip_data["ServID"] << 16) | someip_data["MethodID"], payload_len, 0, msg_type, client_id
+        )
+        pk = (
+            Ether(src=data_dst["mac_address"], dst=data_dst["mac_dst"]) /
+            Dot1Q(vlan=data_dst["vlan"], prio=5) /
+            IP(src=data_dst["ip_src"], dst=data_dst["ip_dst"]) /
+            UDP(sport=data_dst["someip_port_src"], dport=data_dst["someip_port_dst"]) /
+            Raw(load=header + bytes(payload_len))
+        )
+        self.buffer = bytearray(bytes(pk))
+        self.view = memoryview(self.buffer)
+
+        # Offsets calculados a partir de la propia trama para no depender de la
+        # longitud de la cabecera IP.
+        self.ip_offset = ETH_VLAN_HEADER_LEN
+        ihl = (self.buffer[self.ip_offset] & 0x0F) * 4
+        self.udp_offset = self.ip_offset + ihl
+        self.someip_offset = self.udp_offset + 8
+        self.session_offset = self.someip_offset + SOMEIP_SESSION_OFFSET
+        self.payload_offset = self.someip_offset + SOMEIP_HEADER_LEN
+        self.payload_len = payload_len
+        self.checksum_offset = self.udp_offset + 6
+
+        # Suma de la parte fija: pseudo-cabecera (IPs, protocolo, longitud UDP) y
+        # segmento UDP hasta la payload con checksum y Session ID a cero.
+        udp_len = len(self.buffer) - self.udp_offset
+        _U16.pack_into(self.buffer, self.checksum_offset, 0)
+        _U16.pack_into(self.buffer, self.session_offset, 0)
+        pseudo = self.view[self.ip_offset + 12:self.ip_offset + 20]
+        self._base_sum = (
+            ones_complement_sum(pseudo) + 17 + udp_len +
+            ones_complement_sum(self.view[self.udp_offset:self.payload_offset])
+        )
+
+    def build(self, session_id: int, payload: Union[bytes, bytearray, memoryview]) -> memoryview:
+        """
+        Parchea el Session ID y la payload sobre el buffer y recalcula el checksum UDP.
+
+        El ``memoryview`` devuelto apunta al buffer interno de la plantilla, por lo que
+        debe enviarse (o copiarse) antes de la siguiente llamada a ``build``.
+
+        :param session_id: Session ID del mensaje.
+        :type session_id: int
+
+        :param payload: Payload del evento, de longitud ``payload_len``.
+        :type payload: bytes | bytearray | memoryview
+
+        :return: Trama completa lista para enviar.
+        :rtype: memoryview
+
+        :raises ValueError: Si la longitud de la payload no coincide con la plantilla.
+        """
+        if len(payload) != self.payload_len:
+            raise ValueError(
+                f"Longitud de payload {len(payload)} distinta de la plantilla ({self.payload_len})"
+            )
+        self.view[self.payload_offset:] = payload
+        return self.finalize(session_id)
+
+    def finalize(self, session_id: int) -> memoryview:
+        """
+        Escribe el Session ID y el checksum UDP suponiendo que la payload ya se ha
+        escrito directamente sobre ``view[payload_offset:]``.
+
+        :param session_id: Session ID del mensaje.
+        :type session_id: int
+
+        :return: Trama completa lista para enviar.
+        :rtype: memoryview
+        """
+        _U16.pack_into(self.buffer, self.session_offset, session_id)
+        # La payload empieza 24 bytes después de la cabecera UDP, por lo que sus
+        # palabras de 16 bits quedan alineadas con las del checksum.
+        payload_sum = ones_complement_sum(self.view[self.payload_offset:])
+        checksum = finish_checksum(self._base_sum + session_id + payload_sum)
+        _U16.pack_into(self.buffer, self.checksum_offset, checksum)
+        return self.view
+
+
+class TemplateCache():
+    """
+    Caché de plantillas de eventos indexada por (datos de red, servicio, longitud de payload).
+    """
+
+    def __init__(self):
+        self._templates: Dict[Tuple, EventTemplate] = {}
+
+    def get(self, data_dst: Mapping[str, Any], method_data: Mapping[str, Any], payload_len: int) -> EventTemplate:
+        """
+        Devuelve la plantilla asociada, construyéndola con Scapy la primera vez.
+
+        :param data_dst: Datos de red devueltos por ``Parser.ecu1_to_ecu2``.
+        :type data_dst: Mapping[str, Any]
+
+        :param method_data: Datos del método devueltos por ``Parser.get_service_data``.
+        :type method_data: Mapping[str, Any]
+
+        :param payload_len: Longitud de la payload.
+        :type payload_len: int
+
+        :return: Plantilla del evento.
+        :rtype: EventTemplate
+        """
+        key = (tuple(data_dst.values()), method_data["id"], payload_len)
+        template = self._templates.get(key)
+        if template is None:
+            template = EventTemplate(data_dst, method_data, payload_len)
+            self._templates[key] = template
+        return template
+
+    def clear(self):
+        self._templates.clear()
@@ -1,5 +1,303 @@
-import os, json
-from typing import List, Optional, Dict, Any
+import os, json, threading, time
+from types import MappingProxyType
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple, Mapping
+from transmit import DEFAULT_INTERFACE
+from logger import get_logger
+
+log = get_logger("config")
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Convierte recursivamente diccionarios y listas en estructuras de solo lectura
+    (``MappingProxyType`` y ``tuple``) para que los registros compartidos no puedan
+    ser modificados por los consumidores.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class _RegistryState(NamedTuple):
+    """
+    Estado de una carga de los ficheros: definiciones originales, índices y cachés de
+    datos de red. Se publica completo de una vez en cada recarga.
+    """
+    ecus: List[Dict[str, Any]]
+    services: List[Dict[str, Any]]
+    ecus_by_name: Dict[str, Mapping[str, Any]]
+    ecus_by_ip: Dict[str, Mapping[str, Any]]
+    methods_by_id: Dict[int, Mapping[str, Any]]
+    methods_by_someip_id: Dict[Tuple[int, int], Mapping[str, Any]]
+    # Datos de red por pareja de ECUs y multicast por ECU, calculados bajo demanda
+    pairs: Dict[Tuple[str, str], Mapping[str, Any]]
+    multicast: Dict[str, Mapping[str, Any]]
+
+
+class ConfigRegistry():
+    """
+    Registro de configuración compartido por todo el proceso.
+
+    Carga una única vez los ficheros ``ecu_data.json`` y ``services.json`` y construye
+    índices para resolver en O(1) las ECUs por nombre y los métodos por ``ID`` y por
+    la pareja (``ServID``, ``MethodID``). Los registros devueltos son inmutables y se
+    precalculan en la carga, por lo que se pueden compartir entre hilos sin copias.
+
+    Los ficheros solo se vuelven a leer cuando cambia su ``mtime``. Para no hacer un
+    ``stat`` en cada consulta del bucle de envío, la comprobación se realiza como
+    mucho una vez cada ``CHECK_INTERVAL`` segundos. Si al recargar un fichero ha
+    desaparecido o no se puede leer, se mantiene el último estado válido y se vuelve a
+    intentar en la siguiente comprobación. ``version`` se incrementa en cada recarga.
+    """
+    # Intervalo mínimo (en segundos) entre dos comprobaciones del mtime de los ficheros
+    CHECK_INTERVAL = 1.0
+
+    _registries: Dict[Tuple[str, str], "ConfigRegistry"] = {}
+    _registries_lock = threading.Lock()
+
+    def __init__(self, ecu_path: str, services_path: str):
+        self.ecu_path = ecu_path
+        self.services_path = services_path
+        self._lock = threading.Lock()
+        self._mtimes: Tuple[float, float] = (-1.0, -1.0)
+        self._next_check = 0.0
+        # Último error de recarga, para avisar una sola vez mientras persista
+        self._reload_error: Optional[str] = None
+        self.version = 0
+        for path, kind in ((ecu_path, "ECU"), (services_path, "services")):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Missing {kind} file: {path}")
+        self._load()
+
+    @classmethod
+    def shared(cls, ecu_path: str, services_path: str) -> "ConfigRegistry":
+        """
+        Devuelve el registro asociado a la pareja de ficheros indicada, creándolo
+        la primera vez que se solicita.
+
+        :param ecu_path: Ruta del fichero de ECUs.
+        :type ecu_path: str
+
+        :param services_path: Ruta del fichero de servicios.
+        :type services_path: str
+
+        :return: Registro compartido.
+        :rtype: ConfigRegistry
+        """
+        key = (os.path.abspath(ecu_path), os.path.abspath(services_path))
+        registry = cls._registries.get(key)
+        if registry is None:
+            with cls._registries_lock:
+                registry = cls._registries.get(key)
+                if registry is None:
+                    registry = cls(*key)
+                    cls._registries[key] = registry
+        return registry
+
+    def _stat(self) -> Tuple[float, float]:
+        return (os.stat(self.ecu_path).st_mtime, os.stat(self.services_path).st_mtime)
+
+    def _load(self):
+        """
+        Lee los ficheros JSON y reconstruye todos los índices. Los nuevos índices se
+        publican de una sola vez para que los lectores nunca vean un estado a medias.
+
+        :raises OSError: Si algún fichero no existe o no se puede leer.
+        :raises ValueError: Si algún fichero no es JSON válido.
+        :raises KeyError: Si falta la lista ``ecus`` o ``services``.
+        """
+        mtimes = self._stat()
+        with open(self.ecu_path, "r") as f:
+            ecus = json.load(f)["ecus"]
+        with open(self.services_path, "r") as f:
+            services = json.load(f)["services"]
+
+        ecus_by_name = {}
+        ecus_by_ip = {}
+        for ecu in ecus:
+            record = ecus_by_name.setdefault(ecu["name"], _freeze(ecu))
+            ecus_by_ip.setdefault(ecu.get("ip"), record)
+
+        methods_by_id = {}
+        methods_by_someip_id = {}
+        for service in services:
+            for method in service.get("methods", []):
+                record = _freeze(self._method_record(service, method))
+                methods_by_id.setdefault(method.get("ID"), record)
+                someip = method.get("SOMEIP", {})
+                methods_by_someip_id.setdefault((someip.get("ServID"), someip.get("MethodID")), record)
+
+        # Publicación atómica del nuevo estado
+        self._state = _RegistryState(
+            ecus, services, ecus_by_name, ecus_by_ip, methods_by_id, methods_by_someip_id, {}, {}
+        )
+        self._mtimes = mtimes
+        self.version += 1
+
+    @staticmethod
+    def _method_record(service: Dict[str, Any], method: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Construye el registro de un método con la misma estructura que devolvía
+        históricamente ``Parser.get_service_data``.
+        """
+        find = method.get("FIND", {})
+        offer = method.get("OFFER", {})
+        subscribe = method.get("SUBSCRIBE", {})
+        someip = method.get("SOMEIP", {})
+        return {
+            "service_name": service.get("name"),
+            "method_name": method.get("name"),
+            "id": method.get("ID"),
+            "FIND": {
+                "Type": find.get("Type"),
+                "Major_Version": find.get("Major_Version"),
+                "Minor_Version": find.get("Minor_Version")
+            },
+            "OFFER": {
+                "Type": offer.get("Type"),
+                "Major_Version": offer.get("Major_Version"),
+                "Minor_Version": offer.get("Minor_Version")
+            },
+            "SUBSCRIBE": {
+                "Type": subscribe.get("Type"),
+                "EvengroupID": subscribe.get("EvengroupID")
+            },
+            "SOMEIP": {
+                "ServID": someip.get("ServID"),
+                "SubID": someip.get("SubID"),
+                "MethodID": someip.get("MethodID"),
+                "MessageType": someip.get("MessageType"),
+                "Cycle": someip.get("Cycle"),
+                "Plugin": someip.get("Plugin"),
+                "Event": someip.get("Event"),
+                "Payload": someip.get("Payload")
+            },
+            "Rep_Phase_Time": method.get("Rep_Phase_Time"),
+            "Rep_Phase_Cycle": method.get("Rep_Phase_Cycle"),
+            "Response": method.get("Response"),
+            "EcuOrigen": method.get("EcuOrigen"),
+        }
+
+    def _current(self) -> _RegistryState:
+        """
+        Devuelve el estado vigente, recargando los ficheros si su mtime ha cambiado.
+        """
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + ConfigRegistry.CHECK_INTERVAL
+                    try:
+                        if self._stat() != self._mtimes:
+                            self._load()
+                        self._reload_error = None
+                    except (OSError, ValueError, KeyError) as e:
+                        # Fichero borrado o a medio escribir: se sigue con el último estado válido
+                        if repr(e) != self._reload_error:
+                            self._reload_error = repr(e)
+                            log.warning("No se pudo recargar la configuración, se mantiene la anterior: %r", e)
+        return self._state
+
+    @property
+    def ecus(self) -> List[Dict[str, Any]]:
+        return self._current().ecus
+
+    @property
+    def services(self) -> List[Dict[str, Any]]:
+        return self._current().services
+
+    def ecu(self, name: str) -> Optional[Mapping[str, Any]]:
+        """
+        Devuelve la definición (inmutable) de una ECU a partir de su nombre.
+        """
+        return self._current().ecus_by_name.get(name)
+
+    def ecu_by_ip(self, ip: str) -> Optional[Mapping[str, Any]]:
+        """
+        Devuelve la definición (inmutable) de la ECU que tiene asignada la IP indicada.
+        """
+        return self._current().ecus_by_ip.get(ip)
+
+    def ecu_names(self) -> List[str]:
+        return list(self._current().ecus_by_name)
+
+    def method(self, method_id: int) -> Optional[Mapping[str, Any]]:
+        """
+        Devuelve el registro (inmutable) de un método a partir de su ``ID``.
+        """
+        return self._current().methods_by_id.get(method_id)
+
+    def method_by_someip_id(self, serv_id: int, method_id: int) -> Optional[Mapping[str, Any]]:
+        """
+        Devuelve el registro (inmutable) de un método a partir de (``ServID``, ``MethodID``).
+        """
+        return self._current().methods_by_someip_id.get((serv_id, method_id))
+
+    def ecu_pair(self, ecu_src: str, ecu_dst: str) -> Optional[Mapping[str, Any]]:
+        """
+        Devuelve los datos de red unicast entre dos ECUs. El resultado se calcula
+        la primera vez y queda cacheado hasta la siguiente recarga de los ficheros.
+        """
+        state = self._current()
+        cache = state.pairs
+        key = (ecu_src, ecu_dst)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+        ecu_src_data = state.ecus_by_name.get(ecu_src)
+        ecu_dst_data = state.ecus_by_name.get(ecu_dst)
+        if not ecu_src_data or not ecu_dst_data:
+            return None
+
+        record = MappingProxyType({
+            "mac_address": ecu_src_data["mac_address"],
+            "mac_dst": ecu_dst_data["mac_address"],
+            "ip_src": ecu_src_data["ip"],
+            "ip_dst": ecu_dst_data["ip"],
+            "udp_src": ecu_src_data["sd_port_src"],
+            "udp_dst": ecu_dst_data["sd_port_dst"],
+            "someip_port_src": ecu_src_data["someip_port_src"],
+            "someip_port_dst": ecu_dst_data["someip_port_dst"],
+            "vlan": ecu_src_data["vlan"],
+            "interface": ecu_src_data.get("interface", DEFAULT_INTERFACE)
+        })
+        cache[key] = record
+        return record
+
+    def multicast(self, ecu1: str) -> Optional[Mapping[str, Any]]:
+        """
+        Devuelve los datos de red multicast de una ECU, cacheados hasta la siguiente
+        recarga de los ficheros.
+        """
+        state = self._current()
+        cache = state.multicast
+        try:
+            return cache[ecu1]
+        except KeyError:
+            pass
+
+        ecu1_data = state.ecus_by_name.get(ecu1)
+        if not ecu1_data:
+            return None
+
+        record = MappingProxyType({
+            "mac_address": ecu1_data["mac_address"],
+            "MAC_1500_MULTICAST": ecu1_data["MAC_1500_MULTICAST"],
+            "ip": ecu1_data["ip"],
+            "IP_1500_MULTICAST": ecu1_data["IP_1500_MULTICAST"],
+            "sd_port_src": ecu1_data["sd_port_src"],
+            "sd_port_dst": ecu1_data["sd_port_dst"],
+            "vlan": ecu1_data["vlan"],
+            "option_sdport": ecu1_data["option_sdport"],
+            "option_sdprot": ecu1_data["option_sdprot"],
+            "interface": ecu1_data.get("interface", DEFAULT_INTERFACE),
+        })
+        cache[ecu1] = record
+        return record
 
 
 class Parser():
@@ -13,6 +311,10 @@ class Parser():
     Los ficheros que se cargan son:
     - ecu_data.json: contiene información de red y configuración de cada ECU.
     - services.json: contiene la definición de los servicios y métodos SOME/IP.
+
+    Todas las instancias comparten un mismo :class:`ConfigRegistry`, de modo que crear
+    un ``Parser`` no vuelve a leer los ficheros y las consultas se resuelven mediante
+    índices precalculados. Los registros devueltos son de solo lectura.
     """
     # Se incluyen las rutas relatativas de los fichero que contienen la información
     # de las ECUs y de los servicios asociados a las mismas.
@@ -21,27 +323,28 @@ class Parser():
 
     def __init__(self):
         """
-        Constructor de la clase. Carga en memoria las definiciones de ECUs y servicios
-        a partir de los ficheros JSON correspondientes. Lanza un error si alguno
-        de los ficheros no existe.
+        Constructor de la clase. Obtiene el registro compartido con las definiciones
+        de ECUs y servicios, que solo se carga (y se comprueba que existen los
+        ficheros) la primera vez.
 
         :raises FileNotFoundError: Si no se encuentran los ficheros JSON necesarios.
         """
-        if not os.path.isfile(Parser.ECU_DATA_PATH):
-            raise FileNotFoundError(f"Missing ECU file: {Parser.ECU_DATA_PATH}")
-        if not os.path.isfile(Parser.SERVICES_DATA_PATH):
-            raise FileNotFoundError(f"Missing services file: {Parser.SERVICES_DATA_PATH}")
+        self.registry = ConfigRegistry.shared(Parser.ECU_DATA_PATH, Parser.SERVICES_DATA_PATH)
+
+    @property
+    def ecus(self) -> List[Dict[str, Any]]:
+        return self.registry.ecus
 
-        with open(Parser.ECU_DATA_PATH, "r") as f:
-            self.ecus = json.load(f)["ecus"]
-        with open(Parser.SERVICES_DATA_PATH, "r") as f:
-            self.services = json.load(f)["services"]  
+    @property
+    def services(self) -> List[Dict[str, Any]]:
+        return self.registry.services
 
     def data_by_key(self, ecu_definitions: List[Dict[str, Any]], key: str) -> Optional[Dict[str, Any]]:
         """
         Devuelve la definición de una ECU a partir de su nombre.
 
-        :param ecu_definitions: Lista de definiciones de ECUs.
+        :param ecu_definitions: Lista de definiciones de ECUs. Se mantiene por
+            compatibilidad; la búsqueda se hace sobre el índice del registro.
         :type ecu_definitions: List[Dict[str, Any]]
 
         :param key: Nombre de la ECU a buscar.
@@ -50,13 +353,7 @@ class Parser():
         :return: Diccionario con la definición de la ECU si se encuentra, None en caso contrario.
         :rtype: Optional[Dict[str, Any]]
         """
-        # Check if the key is in the ecu_definitions
-        for ecu_definition in self.ecus:
-            if ecu_definition["name"] == key:
-                return ecu_definition
-        
-        # Si no se encuentra la clave en el diccionario se devuelve None
-        return None
+        return self.registry.ecu(key)
     
     def ecu1_to_ecu2(self, ecu_src: str, ecu_dst: str) -> Dict[str, Any]:
         """
@@ -69,31 +366,13 @@ class Parser():
         :param ecu_dst: Nombre de la ECU destino.
         :type ecu_dst: str
 
-        :return: Diccionario con direcciones MAC, IP, puertos UDP/SOMEIP y VLAN.
+        :return: Diccionario con direcciones MAC, IP, puertos UDP/SOMEIP, VLAN e interfaz
+            de red de la ECU origen.
         :rtype: Dict[str, Any]
 
         :raises None: Devuelve None si alguna de las ECUs no se encuentra.
         """
-        # Check if the ecu_src and ecu_dst are in the ecu_definitions
-        ecu_src_data = self.data_by_key(self.ecus, ecu_src)
-        ecu_dst_data = self.data_by_key(self.ecus, ecu_dst)
-
-        # If the ecu_src or ecu_dst is not found, return None
-        if not ecu_src_data or not ecu_dst_data:
-            return None
-        
-        # Return the data
-        return {
-            "mac_address": ecu_src_data["mac_address"],
-            "mac_dst": ecu_dst_data["mac_address"],
-            "ip_src": ecu_src_data["ip"],
-            "ip_dst": ecu_dst_data["ip"],
-            "udp_src": ecu_src_data["sd_port_src"],
-            "udp_dst": ecu_dst_data["sd_port_dst"],
-            "someip_port_src": ecu_src_data["someip_port_src"],
-            "someip_port_dst": ecu_dst_data["someip_port_dst"],
-            "vlan": ecu_src_data["vlan"]
-        }
+        return self.registry.ecu_pair(ecu_src, ecu_dst)
     
     def multicast(self, ecu1: str) -> Dict[str, Any]:
         """
@@ -103,37 +382,20 @@ class Parser():
         :param ecu1: Nombre de la ECU que emite el mensaje multicast.
         :type ecu1: str
 
-        :return: Diccionario con direcciones MAC, IP, puertos y opciones de configuración.
+        :return: Diccionario con direcciones MAC, IP, puertos, opciones de configuración
+            e interfaz de red.
         :rtype: Dict[str, Any]
 
         :raises None: Devuelve None si la ECU no se encuentra.
         """
-        # Check if the ecu1 is in the ecu_definitions
-        ecu1_data = self.data_by_key(self.ecus, ecu1)
-
-        # If the ecu1 is not found, return None
-        if not ecu1_data:
-            return None
-        
-        # Devuelve los datos origen/destino para un envíon multicast
-        return {
-            "mac_address": ecu1_data["mac_address"],
-            "MAC_1500_MULTICAST": ecu1_data["MAC_1500_MULTICAST"],
-            "ip": ecu1_data["ip"],
-            "IP_1500_MULTICAST": ecu1_data["IP_1500_MULTICAST"],
-            "sd_port_src": ecu1_data["sd_port_src"],
-            "sd_port_dst": ecu1_data["sd_port_dst"],
-            "vlan": ecu1_data["vlan"],
-            "option_sdport": ecu1_data["option_sdport"],
-            "option_sdprot": ecu1_data["option_sdprot"],
-        }
+        return self.registry.multicast(ecu1)
 
     def get_service_data(self, service_id: int) -> Optional[Dict[str, Any]]:
         """
         Obtiene la definición completa de un servicio/método SOME/IP a partir de su ID.
 
-        El método busca en la estructura de servicios y devuelve una copia del método 
-        junto con la información de configuración de tipo FIND, OFFER, SUBSCRIBE y SOME/IP.
+        Devuelve el registro precalculado del método junto con la información de
+        configuración de tipo FIND, OFFER, SUBSCRIBE y SOME/IP.
 
         :param service_id: Identificador del método de servicio.
         :type service_id: int
@@ -141,41 +403,22 @@ class Parser():
         :return: Diccionario con la estructura del servicio, o None si no se encuentra.
         :rtype: Optional[Dict[str, Any]]
         """
-        for service in self.services:
-            for method in service.get("methods", []):
-                if method.get("ID") == service_id:
-                    return {
-                        "service_name": service.get("name"),
-                        "method_name": method.get("name"),
-                        "id": method.get("ID"),
-                        "FIND": {
-                            "Type": method.get("FIND", {}).get("Type"),
-                            "Major_Version": method.get("FIND", {}).get("Major_Version"),
-                            "Minor_Version": method.get("FIND", {}).get("Minor_Version")
-                        },
-                        "OFFER": {
-                            "Type": method.get("OFFER", {}).get("Type"),
-                            "Major_Version": method.get("OFFER", {}).get("Major_Version"),
-                            "Minor_Version": method.get("OFFER", {}).get("Minor_Version")
-                        },
-                        "SUBSCRIBE": {
-                            "Type": method.get("SUBSCRIBE", {}).get("Type"),
-                            "EvengroupID": method.get("SUBSCRIBE", {}).get("EvengroupID")
-                        },
-                        "SOMEIP": {
-                            "ServID": method.get("SOMEIP", {}).get("ServID"),
-                            "SubID": method.get("SOMEIP", {}).get("SubID"),
-                            "MethodID": method.get("SOMEIP", {}).get("MethodID"),
-                            "MessageType": method.get("SOMEIP", {}).get("MessageType"),
-                            "Cycle": method.get("SOMEIP", {}).get("Cycle"),
-                            "Payload": method.get("SOMEIP", {}).get("Payload")
-                        },
-                        "Rep_Phase_Time": method.get("Rep_Phase_Time"),
-                        "Rep_Phase_Cycle": method.get("Rep_Phase_Cycle"),
-                        "Response": method.get("Response"),
-                        "EcuOrigen": method.get("EcuOrigen"),
-                    }
-        return None
+        return self.registry.method(service_id)
+
+    def get_service_by_someip_id(self, serv_id: int, method_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene la definición de un método a partir de su Service ID y Method ID SOME/IP.
+
+        :param serv_id: Service ID SOME/IP.
+        :type serv_id: int
+
+        :param method_id: Method ID (o Event ID) SOME/IP.
+        :type method_id: int
+
+        :return: Diccionario con la estructura del servicio, o None si no se encuentra.
+        :rtype: Optional[Dict[str, Any]]
+        """
+        return self.registry.method_by_someip_id(serv_id, method_id)
     
     def get_ecus(self) -> List[str]:
         """
@@ -184,4 +427,4 @@ class Parser():
         :return: Lista con nombres de ECUs.
         :rtype: List[str]
         """
-        return [ecu["name"] for ecu in self.ecus]
+        return self.registry.ecu_names()
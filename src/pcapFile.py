@@ -0,0 +1,333 @@
+import mmap
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Tipos de bloque pcapng
+BLOCK_SHB = 0x0A0D0D0A
+BLOCK_IDB = 0x00000001
+BLOCK_SPB = 0x00000003
+BLOCK_EPB = 0x00000006
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# Ficheros pcap clásicos: magic en microsegundos y en nanosegundos
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+
+# Códigos de opción pcapng
+OPT_END = 0
+SHB_USERAPPL = 4
+IF_NAME = 2
+IF_TSRESOL = 9
+
+LINKTYPE_ETHERNET = 1
+
+_U32 = struct.Struct("<I")
+# Enhanced Packet Block sin datos: tipo, longitud, interfaz, timestamp (alto, bajo),
+# longitud capturada y longitud original
+_EPB_HEADER = struct.Struct("<IIIIIII")
+_OPTION_HEADER = struct.Struct("<HH")
+_PADDING = tuple(b"\x00" * n for n in range(4))
+
+
+def _pad(length: int) -> int:
+    return -length & 3
+
+
+def _option(code: int, value: bytes) -> bytes:
+    return _OPTION_HEADER.pack(code, len(value)) + value + _PADDING[_pad(len(value))]
+
+
+def _block(block_type: int, body: bytes) -> bytes:
+    total = 12 + len(body)
+    return _U32.pack(block_type) + _U32.pack(total) + body + _U32.pack(total)
+
+
+class PcapngWriter():
+    """
+    Escritor de ficheros pcapng en streaming.
+
+    Cada trama se escribe como un Enhanced Packet Block con timestamp en nanosegundos
+    (``if_tsresol`` = 9) sobre un fichero con buffer grande, por lo que no se mantiene
+    nada en memoria y el coste por trama se reduce a empaquetar una cabecera fija.
+    Cada interfaz de red distinta se registra con su propio Interface Description Block
+    la primera vez que se usa.
+
+    :ivar path: Ruta del fichero.
+    :ivar clock: Fuente de timestamps en nanosegundos desde epoch.
+    :ivar frames: Número de tramas escritas.
+    :ivar bytes: Número de bytes de trama escritos.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        snaplen: int = 65535,
+        buffer_size: int = 1 << 20,
+        clock: Callable[[], int] = time.time_ns,
+        application: str = "toolTFG"
+    ):
+        """
+        :param path: Ruta del fichero pcapng a crear (se sobrescribe si existe).
+        :type path: str
+
+        :param snaplen: Longitud máxima de captura anunciada en cada interfaz.
+        :type snaplen: int
+
+        :param buffer_size: Tamaño del buffer de escritura.
+        :type buffer_size: int
+
+        :param clock: Fuente de timestamps en nanosegundos desde epoch.
+        :type clock: Callable[[], int]
+
+        :param application: Nombre de la aplicación que se guarda en la cabecera.
+        :type application: str
+        """
+        self.path = path
+        self.snaplen = snaplen
+        self.clock = clock
+        self.frames = 0
+        self.bytes = 0
+        self._interfaces: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._file = open(path, "wb", buffering=buffer_size)
+        self._file.write(_block(
+            BLOCK_SHB,
+            struct.pack("<IHHq", BYTE_ORDER_MAGIC, 1, 0, -1) +
+            _option(SHB_USERAPPL, application.encode()) + _option(OPT_END, b"")
+        ))
+
+    def interface_id(self, name: str) -> int:
+        """
+        Devuelve el identificador pcapng de una interfaz, escribiendo su Interface
+        Description Block la primera vez.
+
+        :param name: Nombre de la interfaz.
+        :type name: str
+
+        :return: Índice de la interfaz dentro del fichero.
+        :rtype: int
+        """
+        interface_id = self._interfaces.get(name)
+        if interface_id is None:
+            with self._lock:
+                interface_id = self._interfaces.get(name)
+                if interface_id is None:
+                    interface_id = len(self._interfaces)
+                    self._file.write(_block(
+                        BLOCK_IDB,
+                        struct.pack("<HHI", LINKTYPE_ETHERNET, 0, self.snaplen) +
+                        _option(IF_NAME, name.encode()) +
+                        _option(IF_TSRESOL, b"\x09") +
+                        _option(OPT_END, b"")
+                    ))
+                    self._interfaces[name] = interface_id
+        return interface_id
+
+    def write(self, frame: Buffer, interface_id: int = 0, timestamp_ns: Optional[int] = None) -> int:
+        """
+        Escribe una trama como Enhanced Packet Block.
+
+        :param frame: Trama completa desde la cabecera Ethernet.
+        :type frame: bytes | bytearray | memoryview
+
+        :param interface_id: Interfaz devuelta por :meth:`interface_id`.
+        :type interface_id: int
+
+        :param timestamp_ns: Timestamp en nanosegundos desde epoch. Por defecto ``clock()``.
+        :type timestamp_ns: int
+
+        :return: Longitud de la trama.
+        :rtype: int
+        """
+        length = len(frame)
+        captured = min(length, self.snaplen)
+        if timestamp_ns is None:
+            timestamp_ns = self.clock()
+        pad = _pad(captured)
+        total = 32 + captured + pad
+        with self._lock:
+            write = self._file.write
+            write(_EPB_HEADER.pack(
+                BLOCK_EPB, total, interface_id, timestamp_ns >> 32, timestamp_ns & 0xFFFFFFFF, captured, length
+            ))
+            write(frame if captured == length else frame[:captured])
+            write(_PADDING[pad] + _U32.pack(total))
+            self.frames += 1
+            self.bytes += length
+        return length
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self) -> "PcapngWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Ventana que se mantiene mapeada por detrás de la posición de lectura antes de
+# devolver las páginas al sistema (debe cubrir cualquier lote de tramas pendiente)
+RELEASE_WINDOW = 128 << 20
+
+
+class CaptureReader():
+    """
+    Lector de ficheros pcap y pcapng mediante ``mmap``.
+
+    El fichero no se carga en memoria: cada trama se entrega como un ``memoryview``
+    sobre el propio mapeo. El mapeo es privado (copia en escritura), de forma que las
+    tramas se pueden modificar en el sitio sin tocar el fichero, y las páginas ya
+    recorridas se devuelven al sistema con ``madvise``, por lo que la memoria usada no
+    crece con el tamaño de la captura.
+
+    Solo se admiten capturas Ethernet.
+
+    :ivar path: Ruta del fichero.
+    :ivar frames: Número de tramas leídas.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Ruta del fichero pcap o pcapng.
+        :type path: str
+
+        :raises ValueError: Si el fichero no es un pcap/pcapng válido.
+        """
+        self.path = path
+        self.frames = 0
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self._view = memoryview(self._mmap)
+        self._released = 0
+        if len(self._view) < 4:
+            raise ValueError(f"{path}: fichero demasiado corto")
+        magic = _U32.unpack_from(self._view, 0)[0]
+        if magic == BLOCK_SHB:
+            self._iter = self._iter_pcapng
+        elif magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC) or \
+                int.from_bytes(self._view[:4], "big") in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self._iter = self._iter_pcap
+        else:
+            raise ValueError(f"{path}: formato de captura no reconocido")
+
+    def __iter__(self) -> Iterator[Tuple[int, memoryview]]:
+        """
+        Recorre las tramas de la captura.
+
+        :return: Generador de ``(timestamp_ns, trama)``. La trama es una vista sobre el
+            mapeo del fichero.
+        :rtype: Iterator[Tuple[int, memoryview]]
+        """
+        return self._iter()
+
+    def _release(self, offset: int):
+        """
+        Devuelve al sistema las páginas que quedan más de ``RELEASE_WINDOW`` bytes por
+        detrás de ``offset``.
+        """
+        limit = (offset - RELEASE_WINDOW) & ~(mmap.PAGESIZE - 1)
+        if limit - self._released >= RELEASE_WINDOW and hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_DONTNEED, self._released, limit - self._released)
+            self._released = limit
+
+    def _iter_pcap(self):
+        view = self._view
+        order = "<" if _U32.unpack_from(view, 0)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC) else ">"
+        magic, _, _, _, _, _, linktype = struct.unpack_from(order + "IHHiIII", view, 0)
+        if linktype != LINKTYPE_ETHERNET:
+            raise ValueError(f"{self.path}: linktype {linktype} no soportado (solo Ethernet)")
+        frac_ns = 1 if magic == PCAP_MAGIC_NSEC else 1000
+        record = struct.Struct(order + "IIII")
+        pos = 24
+        end = len(view)
+        while pos + 16 <= end:
+            ts_sec, ts_frac, captured, _ = record.unpack_from(view, pos)
+            start = pos + 16
+            pos = start + captured
+            if pos > end:
+                raise ValueError(f"{self.path}: registro truncado en el offset {start - 16}")
+            self.frames += 1
+            yield ts_sec * 1_000_000_000 + ts_frac * frac_ns, view[start:pos]
+            self._release(pos)
+
+    def _iter_pcapng(self):
+        view = self._view
+        end = len(view)
+        pos = 0
+        order = "<"
+        # Resolución (unidades por segundo) y linktype de cada interfaz de la sección
+        interfaces = []
+        timestamp = 0
+        while pos + 12 <= end:
+            block_type = struct.unpack_from(order + "I", view, pos)[0]
+            if block_type == BLOCK_SHB:
+                order = "<" if _U32.unpack_from(view, pos + 8)[0] == BYTE_ORDER_MAGIC else ">"
+                interfaces = []
+            total = struct.unpack_from(order + "I", view, pos + 4)[0]
+            if total < 12 or pos + total > end:
+                raise ValueError(f"{self.path}: bloque truncado en el offset {pos}")
+            body = pos + 8
+            if block_type == BLOCK_IDB:
+                linktype = struct.unpack_from(order + "H", view, body)[0]
+                interfaces.append((linktype, self._tsresol(view, body + 8, pos + total - 4, order)))
+            elif block_type == BLOCK_EPB:
+                interface_id, ts_high, ts_low, captured, _ = struct.unpack_from(order + "IIIII", view, body)
+                linktype, units = interfaces[interface_id]
+                if linktype != LINKTYPE_ETHERNET:
+                    raise ValueError(f"{self.path}: linktype {linktype} no soportado (solo Ethernet)")
+                timestamp = ((ts_high << 32) | ts_low) * 1_000_000_000 // units
+                start = body + 20
+                self.frames += 1
+                yield timestamp, view[start:start + captured]
+            elif block_type == BLOCK_SPB:
+                # Simple Packet Block: sin timestamp, se reutiliza el anterior
+                length = struct.unpack_from(order + "I", view, body)[0]
+                captured = min(length, total - 16)
+                self.frames += 1
+                yield timestamp, view[body + 4:body + 4 + captured]
+            pos += total
+            self._release(pos)
+
+    @staticmethod
+    def _tsresol(view: memoryview, pos: int, end: int, order: str) -> int:
+        """
+        Lee la opción ``if_tsresol`` de un IDB y devuelve las unidades por segundo
+        (por defecto microsegundos).
+        """
+        option = struct.Struct(order + "HH")
+        while pos + 4 <= end:
+            code, length = option.unpack_from(view, pos)
+            if code == OPT_END:
+                break
+            if code == IF_TSRESOL and length >= 1:
+                value = view[pos + 4]
+                return 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+            pos += 4 + length + _pad(length)
+        return 1_000_000
+
+    def close(self):
+        """
+        Libera el mapeo. Si quedan vistas de tramas vivas se libera al recolectarlas.
+        """
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,231 @@
+import functools
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+from importlib.metadata import EntryPoint, entry_points
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+from logger import get_logger
+
+log = get_logger("plugins")
+
+# Directorio de plugins incluido en el repositorio
+PLUGINS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'plugins'))
+# Grupo de entry points con el que paquetes externos pueden registrar plugins
+ENTRY_POINT_GROUP = "tooltfg.plugins"
+# Plugin y evento que se usan para los métodos que no indican ``Plugin``/``Event``
+# en su apartado SOMEIP de services.json
+DEFAULT_PLUGIN = "VehicleDynamicsPlugin"
+DEFAULT_EVENT = "VehicleSpeed"
+
+
+class EventEncoder():
+    """
+    Codificador de la payload de un evento, ligado a una instancia de plugin de larga
+    duración. Se resuelve una única vez por método, de forma que en cada ciclo solo
+    se llama a funciones ya enlazadas.
+
+    :ivar plugin: Instancia del plugin.
+    :ivar event: Nombre del evento dentro del plugin.
+    :ivar size: Longitud fija de la payload.
+    :ivar write: ``write(buffer, offset)`` codifica la payload sobre un buffer.
+    :ivar encode: ``encode()`` devuelve la payload como bytes.
+    """
+    __slots__ = ("plugin", "event", "size", "write", "encode")
+
+    def __init__(self, plugin: Any, event: str):
+        self.plugin = plugin
+        self.event = event
+        self.size = plugin.get_codec(event).size
+        self.write = functools.partial(plugin.write_payload, event)
+        self.encode = functools.partial(plugin.get_payload, event)
+
+
+class MethodHandler():
+    """
+    Manejador de un método SOME/IP de tipo REQUEST o REQUEST_NO_RETURN, ligado a una
+    instancia de plugin de larga duración. Se resuelve una única vez por método.
+
+    ``handle(payload)`` recibe la payload de la petición y devuelve la de la respuesta
+    (bytes, o None para una respuesta vacía) o un awaitable que la devuelve, para los
+    métodos que responden más tarde. Debe lanzar ``ValueError`` si la petición está mal
+    formada.
+
+    :ivar plugin: Instancia del plugin.
+    :ivar method: Nombre del método dentro del plugin (campo ``Response``).
+    :ivar handle: Función enlazada que atiende las peticiones.
+    """
+    __slots__ = ("plugin", "method", "handle")
+
+    def __init__(self, plugin: Any, method: str):
+        self.plugin = plugin
+        self.method = method
+        self.handle = plugin.get_method(method)
+
+
+class PluginRegistry():
+    """
+    Registro de plugins de payload.
+
+    Descubre los plugins disponibles sin importarlos: los módulos ``<Nombre>.py`` del
+    directorio ``plugins/`` (que deben definir la clase ``<Nombre>``) y los entry points
+    del grupo ``tooltfg.plugins``. Cada plugin se importa e instancia la primera vez
+    que se ofrece uno de sus servicios y la instancia se mantiene durante todo el
+    proceso, de modo que conserva su estado entre eventos.
+
+    Los codificadores se indexan por (``ServID``, ``MethodID``): una vez enlazado un
+    método, resolver su codificador es una consulta a un diccionario.
+    """
+
+    def __init__(self, plugins_dir: str = PLUGINS_DIR, group: str = ENTRY_POINT_GROUP):
+        """
+        :param plugins_dir: Directorio con los módulos de plugins.
+        :type plugins_dir: str
+
+        :param group: Grupo de entry points de plugins externos.
+        :type group: str
+        """
+        self.plugins_dir = plugins_dir
+        self.group = group
+        self._lock = threading.RLock()
+        self._sources: Optional[Dict[str, Union[str, EntryPoint]]] = None
+        self._instances: Dict[str, Any] = {}
+        self._encoders: Dict[Tuple[int, int], EventEncoder] = {}
+        self._handlers: Dict[Tuple[int, int], MethodHandler] = {}
+
+    def available(self) -> Dict[str, Union[str, EntryPoint]]:
+        """
+        Devuelve los plugins descubiertos (nombre -> ruta del módulo o entry point)
+        sin importar ninguno. Los del directorio ``plugins/`` tienen prioridad.
+        """
+        if self._sources is None:
+            sources: Dict[str, Union[str, EntryPoint]] = {}
+            try:
+                eps = entry_points(group=self.group)
+            except TypeError:
+                # Python < 3.10
+                eps = entry_points().get(self.group, [])
+            for ep in eps:
+                sources[ep.name] = ep
+            if os.path.isdir(self.plugins_dir):
+                for filename in sorted(os.listdir(self.plugins_dir)):
+                    name, ext = os.path.splitext(filename)
+                    if ext == ".py" and name[0].isupper():
+                        sources[name] = os.path.join(self.plugins_dir, filename)
+            self._sources = sources
+        return self._sources
+
+    def plugin(self, name: str) -> Any:
+        """
+        Devuelve la instancia compartida de un plugin, importándolo la primera vez.
+
+        :param name: Nombre del plugin.
+        :type name: str
+
+        :return: Instancia del plugin.
+        :rtype: Any
+
+        :raises KeyError: Si el plugin no se ha descubierto.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                source = self.available().get(name)
+                if source is None:
+                    raise KeyError(f"Plugin '{name}' no encontrado en {self.plugins_dir} ni en '{self.group}'")
+                if isinstance(source, EntryPoint):
+                    cls = source.load()
+                else:
+                    cls = getattr(self._import_local(name), name)
+                instance = cls()
+                self._instances[name] = instance
+                log.info("Plugin %s cargado", name)
+        return instance
+
+    def _import_local(self, name: str):
+        """
+        Importa ``plugins.<name>`` desde ``plugins_dir``. El paquete ``plugins`` se
+        registra a partir de su ruta, sin modificar ``sys.path``.
+        """
+        if "plugins" not in sys.modules:
+            spec = importlib.util.spec_from_file_location(
+                "plugins", os.path.join(self.plugins_dir, "__init__.py"),
+                submodule_search_locations=[self.plugins_dir]
+            )
+            package = importlib.util.module_from_spec(spec)
+            sys.modules["plugins"] = package
+            spec.loader.exec_module(package)
+        return importlib.import_module(f"plugins.{name}")
+
+    def bind(self, method_data: Mapping[str, Any]) -> EventEncoder:
+        """
+        Enlaza un método con su plugin y evento (campos ``SOMEIP.Plugin`` y
+        ``SOMEIP.Event``), cargando el plugin si es necesario.
+
+        :param method_data: Datos del método devueltos por ``Parser.get_service_data``.
+        :type method_data: Mapping[str, Any]
+
+        :return: Codificador de la payload del método.
+        :rtype: EventEncoder
+        """
+        someip_data = method_data["SOMEIP"]
+        key = (someip_data["ServID"], someip_data["MethodID"])
+        encoder = self._encoders.get(key)
+        if encoder is None:
+            with self._lock:
+                encoder = self._encoders.get(key)
+                if encoder is None:
+                    plugin = self.plugin(someip_data.get("Plugin") or DEFAULT_PLUGIN)
+                    encoder = EventEncoder(plugin, someip_data.get("Event") or DEFAULT_EVENT)
+                    self._encoders[key] = encoder
+        return encoder
+
+    def bind_method(self, method_data: Mapping[str, Any]) -> MethodHandler:
+        """
+        Enlaza un método REQUEST/REQUEST_NO_RETURN con el manejador que indica su campo
+        ``Response`` en el plugin ``SOMEIP.Plugin``, cargando el plugin si es necesario.
+
+        :param method_data: Datos del método devueltos por ``Parser.get_service_data``.
+        :type method_data: Mapping[str, Any]
+
+        :return: Manejador del método.
+        :rtype: MethodHandler
+
+        :raises ValueError: Si el método no define ``Response`` o el plugin no lo implementa.
+        """
+        someip_data = method_data["SOMEIP"]
+        key = (someip_data["ServID"], someip_data["MethodID"])
+        handler = self._handlers.get(key)
+        if handler is None:
+            name = method_data.get("Response")
+            if not name or name == "NA":
+                raise ValueError(f"El método {method_data.get('method_name')} no define el campo Response")
+            with self._lock:
+                handler = self._handlers.get(key)
+                if handler is None:
+                    plugin = self.plugin(someip_data.get("Plugin") or DEFAULT_PLUGIN)
+                    handler = self._handlers[key] = MethodHandler(plugin, name)
+        return handler
+
+    def encoder(self, serv_id: int, method_id: int) -> Optional[EventEncoder]:
+        """
+        Devuelve el codificador de un método ya enlazado con :meth:`bind`.
+        """
+        return self._encoders.get((serv_id, method_id))
+
+
+_registry: Optional[PluginRegistry] = None
+
+
+def get_plugin_registry() -> PluginRegistry:
+    """
+    Devuelve el registro de plugins compartido por todo el proceso.
+    """
+    global _registry
+    if _registry is None:
+        _registry = PluginRegistry()
+    return _registry
@@ -0,0 +1,320 @@
+import ipaddress
+import struct
+import time
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Union
+from packetTemplate import SOMEIP_HEADER_LEN, SOMEIP_SESSION_OFFSET, finish_checksum, ones_complement_sum
+from pcapFile import CaptureReader
+
+Frame = Union[bytearray, memoryview]
+
+ETHERTYPE_VLAN = 0x8100
+ETHERTYPE_IPV4 = 0x0800
+IPPROTO_UDP = 17
+
+# Prioridad 802.1Q de las etiquetas que se insertan en tramas sin VLAN (la misma que
+# usan las tramas generadas por el simulador)
+VLAN_PRIORITY = 5
+
+# Margen final de la espera que se hace en espera activa para no depender de la
+# granularidad de ``time.sleep``
+SPIN_SECONDS = 0.0005
+
+_U16 = struct.Struct("!H")
+
+
+def _mac(address: str) -> bytes:
+    return bytes.fromhex(address.replace(":", "").replace("-", ""))
+
+
+def _ip(address: str) -> bytes:
+    return ipaddress.IPv4Address(address).packed
+
+
+class FrameRewriter():
+    """
+    Reescribe en el sitio las tramas de una captura para reproducirlas como si las
+    enviara una ECU de ``ecu_data.json``: MAC e IP de origen y destino, VLAN y Session
+    ID de SOME/IP.
+
+    Las tramas se modifican sobre el propio buffer (un ``memoryview`` escribible del
+    mapeo de la captura) y los checksums IPv4 y UDP se recalculan. Solo cuando hay que
+    añadir una etiqueta VLAN a una trama que no la tiene se crea un buffer nuevo.
+
+    Las tramas multicast conservan su destino salvo que se indiquen los datos multicast
+    de la ECU, en cuyo caso se llevan a su grupo (``MAC_1500_MULTICAST`` e
+    ``IP_1500_MULTICAST``).
+
+    Los Session ID se renumeran con un contador por Message ID que empieza en 1 y pasa
+    de 0xFFFF a 1, de modo que cada servicio de la captura mantiene una secuencia
+    continua aunque se reproduzca en bucle.
+
+    :ivar frames: Número de tramas reescritas.
+    """
+
+    def __init__(
+        self,
+        data_dst: Mapping[str, Any],
+        multicast: Optional[Mapping[str, Any]] = None,
+        rewrite_vlan: bool = True,
+        rewrite_session: bool = True
+    ):
+        """
+        :param data_dst: Datos de red entre las dos ECUs (``ConfigRegistry.ecu_pair``).
+        :type data_dst: Mapping[str, Any]
+
+        :param multicast: Datos multicast de la ECU origen (``ConfigRegistry.multicast``).
+        :type multicast: Mapping[str, Any]
+
+        :param rewrite_vlan: Si es True se fija el VLAN ID de ``data_dst``.
+        :type rewrite_vlan: bool
+
+        :param rewrite_session: Si es True se renumeran los Session ID.
+        :type rewrite_session: bool
+        """
+        self.mac_src = _mac(data_dst["mac_address"])
+        self.mac_dst = _mac(data_dst["mac_dst"])
+        self.ip_src = _ip(data_dst["ip_src"])
+        self.ip_dst = _ip(data_dst["ip_dst"])
+        self.vlan = data_dst.get("vlan") if rewrite_vlan else None
+        self.mac_multicast = _mac(multicast["MAC_1500_MULTICAST"]) if multicast else None
+        self.ip_multicast = _ip(multicast["IP_1500_MULTICAST"]) if multicast else None
+        self.rewrite_session = rewrite_session
+        self.frames = 0
+        self._sessions: Dict[bytes, int] = {}
+
+    def next_session_id(self, message_id: bytes) -> int:
+        """
+        Devuelve el siguiente Session ID del Message ID indicado (1..0xFFFF).
+        """
+        session_id = self._sessions.get(message_id, 0) % 0xFFFF + 1
+        self._sessions[message_id] = session_id
+        return session_id
+
+    def rewrite(self, frame: Frame) -> Frame:
+        """
+        Reescribe una trama.
+
+        :param frame: Trama completa desde la cabecera Ethernet. Debe ser escribible.
+        :type frame: bytearray | memoryview
+
+        :return: La misma trama modificada, o un buffer nuevo si se ha insertado la
+            etiqueta VLAN.
+        :rtype: bytearray | memoryview
+        """
+        if len(frame) < 14:
+            return frame
+        self.frames += 1
+        multicast = frame[0] & 1
+        if not multicast:
+            frame[0:6] = self.mac_dst
+        elif self.mac_multicast is not None and frame[0:6] != b"\xff" * 6:
+            frame[0:6] = self.mac_multicast
+        frame[6:12] = self.mac_src
+
+        l3 = 14
+        ethertype = _U16.unpack_from(frame, 12)[0]
+        if ethertype == ETHERTYPE_VLAN and len(frame) >= 18:
+            if self.vlan is not None:
+                tci = _U16.unpack_from(frame, 14)[0]
+                _U16.pack_into(frame, 14, (tci & 0xF000) | self.vlan)
+            ethertype = _U16.unpack_from(frame, 16)[0]
+            l3 = 18
+        elif self.vlan is not None:
+            tagged = bytearray(len(frame) + 4)
+            tagged[0:12] = frame[0:12]
+            struct.pack_into("!HH", tagged, 12, ETHERTYPE_VLAN, (VLAN_PRIORITY << 13) | self.vlan)
+            tagged[16:] = frame[12:]
+            frame = tagged
+            l3 = 18
+
+        if ethertype == ETHERTYPE_IPV4 and len(frame) >= l3 + 20:
+            self._rewrite_ipv4(frame, l3)
+        return frame
+
+    def _rewrite_ipv4(self, frame: Frame, l3: int):
+        ihl = (frame[l3] & 0x0F) * 4
+        if ihl < 20 or len(frame) < l3 + ihl:
+            return
+        dst = frame[l3 + 16:l3 + 20]
+        if 224 <= dst[0] <= 239:
+            if self.ip_multicast is not None:
+                frame[l3 + 16:l3 + 20] = self.ip_multicast
+        elif dst != b"\xff\xff\xff\xff":
+            frame[l3 + 16:l3 + 20] = self.ip_dst
+        frame[l3 + 12:l3 + 16] = self.ip_src
+
+        _U16.pack_into(frame, l3 + 10, 0)
+        _U16.pack_into(frame, l3 + 10, finish_checksum(ones_complement_sum(frame[l3:l3 + ihl])))
+
+        # Solo primeros fragmentos UDP: el resto no lleva cabecera UDP
+        if frame[l3 + 9] != IPPROTO_UDP or _U16.unpack_from(frame, l3 + 6)[0] & 0x1FFF:
+            return
+        udp = l3 + ihl
+        if len(frame) < udp + 8:
+            return
+        udp_len = _U16.unpack_from(frame, udp + 4)[0]
+        payload = udp + 8
+        if self.rewrite_session and udp_len >= 8 + SOMEIP_HEADER_LEN and len(frame) >= payload + SOMEIP_HEADER_LEN:
+            message_id = bytes(frame[payload:payload + 4])
+            _U16.pack_into(frame, payload + SOMEIP_SESSION_OFFSET, self.next_session_id(message_id))
+
+        # Checksum UDP: si venía a 0 se deja así. Si no se puede recalcular (trama
+        # capturada recortada o datagrama fragmentado) se pone a 0, que significa "sin checksum"
+        if _U16.unpack_from(frame, udp + 6)[0] == 0:
+            return
+        _U16.pack_into(frame, udp + 6, 0)
+        if len(frame) < udp + udp_len or _U16.unpack_from(frame, l3 + 6)[0] & 0x2000:
+            return
+        partial = (
+            ones_complement_sum(frame[l3 + 12:l3 + 20]) + IPPROTO_UDP + udp_len +
+            ones_complement_sum(frame[udp:udp + udp_len])
+        )
+        _U16.pack_into(frame, udp + 6, finish_checksum(partial))
+
+
+class ReplayStats(NamedTuple):
+    """
+    Resultado de una reproducción.
+    """
+    frames: int
+    bytes: int
+    sent: int
+    dropped: int
+    elapsed: float
+    max_lateness: float
+
+
+class Replayer():
+    """
+    Reproduce una captura pcap/pcapng sobre un transmisor (``Transmitter`` o
+    ``PcapTransmitter``).
+
+    La captura se recorre con :class:`CaptureReader`, sin cargarla en memoria, y las
+    tramas se entregan al transmisor en lotes (``send_batch``) sin copiarlas. Modos:
+
+    - ``speed`` = 1: se respeta el tiempo entre tramas de la captura.
+    - ``speed`` = N: el tiempo entre tramas se divide entre N.
+    - ``speed`` = None (o <= 0): tan rápido como sea posible.
+
+    En los modos temporizados se espera con ``sleep`` hasta poco antes del instante de
+    cada trama y el resto en espera activa. Las tramas cuyo instante ya ha pasado (por
+    un retraso o porque varias comparten timestamp) se agrupan en un único lote, de
+    forma que la reproducción recupera el ritmo en lugar de acumular retraso.
+
+    :ivar tx: Transmisor de salida.
+    :ivar rewriter: Reescritor de tramas opcional.
+    """
+
+    def __init__(
+        self,
+        tx: Any,
+        rewriter: Optional[FrameRewriter] = None,
+        speed: Optional[float] = 1.0,
+        batch_size: int = 256,
+        clock: Callable[[], float] = time.perf_counter,
+        spin: float = SPIN_SECONDS
+    ):
+        """
+        :param tx: Transmisor con ``send_batch``.
+        :type tx: Transmitter | PcapTransmitter
+
+        :param rewriter: Reescritor de tramas. Si es None se envían tal cual.
+        :type rewriter: FrameRewriter
+
+        :param speed: Factor de velocidad, o None para enviar tan rápido como sea posible.
+        :type speed: float
+
+        :param batch_size: Número máximo de tramas por lote.
+        :type batch_size: int
+
+        :param clock: Reloj monótono en segundos.
+        :type clock: Callable[[], float]
+
+        :param spin: Tiempo final de cada espera que se hace en espera activa.
+        :type spin: float
+        """
+        if batch_size < 1:
+            raise ValueError(f"Tamaño de lote no válido: {batch_size}")
+        self.tx = tx
+        self.rewriter = rewriter
+        self.scale = 1.0 / speed if speed and speed > 0 else None
+        self.batch_size = batch_size
+        self.clock = clock
+        self.spin = spin
+        self._sent = 0
+        self._dropped = 0
+
+    def _flush(self, batch: List[Frame]):
+        if batch:
+            result = self.tx.send_batch(batch)
+            self._sent += result.sent
+            self._dropped += result.dropped
+            batch.clear()
+
+    def _wait(self, target: float):
+        clock = self.clock
+        remaining = target - clock() - self.spin
+        if remaining > 0:
+            time.sleep(remaining)
+        while clock() < target:
+            pass
+
+    def replay(self, path: str, loops: int = 1, is_alive: Callable[[], bool] = lambda: True) -> ReplayStats:
+        """
+        Reproduce la captura.
+
+        :param path: Ruta del fichero pcap o pcapng.
+        :type path: str
+
+        :param loops: Número de veces que se reproduce la captura.
+        :type loops: int
+
+        :param is_alive: Se consulta entre lotes; si devuelve False se detiene la reproducción.
+        :type is_alive: Callable[[], bool]
+
+        :return: Estadísticas de la reproducción.
+        :rtype: ReplayStats
+        """
+        self._sent = self._dropped = 0
+        frames = total_bytes = 0
+        max_lateness = 0.0
+        scale = self.scale
+        rewrite = self.rewriter.rewrite if self.rewriter is not None else None
+        clock = self.clock
+        batch: List[Frame] = []
+        start = clock()
+
+        for _ in range(loops):
+            with CaptureReader(path) as reader:
+                loop_start = clock()
+                ts0 = None
+                frame = None
+                for timestamp, frame in reader:
+                    if scale is not None:
+                        if ts0 is None:
+                            ts0 = timestamp
+                        target = loop_start + (timestamp - ts0) * 1e-9 * scale
+                        now = clock()
+                        if target > now:
+                            self._flush(batch)
+                            if not is_alive():
+                                break
+                            self._wait(target)
+                        elif now - target > max_lateness:
+                            max_lateness = now - target
+                    if rewrite is not None:
+                        frame = rewrite(frame)
+                    batch.append(frame)
+                    frames += 1
+                    total_bytes += len(frame)
+                    if len(batch) >= self.batch_size:
+                        self._flush(batch)
+                        if not is_alive():
+                            break
+                self._flush(batch)
+                # Se sueltan las vistas sobre el mapeo antes de cerrarlo
+                del frame
+            if not is_alive():
+                break
+
+        return ReplayStats(frames, total_bytes, self._sent, self._dropped, clock() - start, max_lateness)
@@ -0,0 +1,285 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class CyclicTask():
+    """
+    Tarea cíclica registrada en el planificador.
+
+    :ivar key: Identificador de la tarea (p. ej. el ID del método).
+    :ivar period: Periodo en segundos (campo ``SOMEIP.Cycle`` de services.json).
+    :ivar callback: Función a ejecutar en cada ciclo. Puede devolver una trama a enviar
+        o una lista de tramas.
+    :ivar deadline: Instante absoluto (reloj monotónico) de la próxima ejecución.
+    :ivar runs: Número de ejecuciones realizadas.
+    :ivar missed: Número de deadlines perdidos.
+    """
+    __slots__ = ("key", "period", "callback", "deadline", "runs", "missed", "active")
+
+    def __init__(self, key: Hashable, period: float, callback: Callable[["CyclicTask"], Any], deadline: float):
+        self.key = key
+        self.period = period
+        self.callback = callback
+        self.deadline = deadline
+        self.runs = 0
+        self.missed = 0
+        self.active = True
+
+
+class VirtualClock():
+    """
+    Reloj simulado para generar tráfico más rápido que en tiempo real (p. ej. hacia un
+    fichero pcapng). Avanza de golpe hasta cada deadline en lugar de esperar, pero
+    conserva la separación temporal entre eventos en los timestamps.
+
+    :ivar now: Instante actual del reloj, en la misma escala que ``time.monotonic``.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.now = time.monotonic() if start is None else start
+        # Desplazamiento para convertir el reloj simulado en nanosegundos desde epoch
+        self._epoch_offset_ns = time.time_ns() - int(self.now * 1e9)
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, instant: float):
+        """
+        Avanza el reloj hasta ``instant`` (nunca hacia atrás).
+        """
+        if instant > self.now:
+            self.now = instant
+
+    def time_ns(self) -> int:
+        """
+        Devuelve el instante actual en nanosegundos desde epoch.
+        """
+        return self._epoch_offset_ns + int(self.now * 1e9)
+
+
+class CyclicScheduler():
+    """
+    Planificador de eventos cíclicos basado en un único heap de deadlines absolutos.
+
+    Cada tarea se reprograma sumando su periodo al deadline anterior (no al instante
+    en que se ejecutó), de forma que los retrasos puntuales no se acumulan (compensación
+    de deriva). Si una tarea se ejecuta con un retraso superior a ``tolerance`` se
+    considera que ha perdido el deadline: se notifica mediante ``on_missed`` y, si el
+    retraso abarca varios periodos, se saltan los ciclos perdidos en lugar de enviarlos
+    en ráfaga.
+
+    Las tareas que vencen en el mismo tick se ejecutan juntas y las tramas que devuelven
+    se entregan de una vez a ``flush``, lo que permite enviarlas en un único lote.
+    """
+
+    def __init__(
+        self,
+        flush: Optional[Callable[[List[Any]], Any]] = None,
+        on_missed: Optional[Callable[[CyclicTask, float], Any]] = None,
+        on_run: Optional[Callable[[CyclicTask, float], Any]] = None,
+        tolerance: Optional[float] = None,
+        spin: float = 0.0005,
+        clock: Callable[[], float] = time.monotonic,
+        sleep_until: Optional[Callable[[float], Any]] = None
+    ):
+        """
+        :param flush: Función que recibe la lista de tramas generadas en un tick.
+        :type flush: Callable[[List[Any]], Any]
+
+        :param on_missed: Función a la que se notifica un deadline perdido con la tarea
+            y el retraso en segundos.
+        :type on_missed: Callable[[CyclicTask, float], Any]
+
+        :param on_run: Función a la que se notifica cada ejecución con la tarea y su
+            retraso respecto al deadline (p. ej. para medir el jitter).
+        :type on_run: Callable[[CyclicTask, float], Any]
+
+        :param tolerance: Retraso máximo admitido antes de considerar perdido un deadline.
+            Por defecto la mitad del periodo de cada tarea.
+        :type tolerance: float
+
+        :param spin: Tiempo final de espera activa antes de cada deadline, para reducir
+            el jitter introducido por ``time.sleep``.
+        :type spin: float
+
+        :param clock: Reloj monotónico a utilizar.
+        :type clock: Callable[[], float]
+
+        :param sleep_until: Función de espera hasta un deadline que sustituye a la espera
+            por defecto (p. ej. ``VirtualClock.advance_to``).
+        :type sleep_until: Callable[[float], Any]
+        """
+        self.flush = flush
+        self.on_missed = on_missed
+        self.on_run = on_run
+        self.tolerance = tolerance
+        self.spin = spin
+        self.clock = clock
+        self.sleep_until = sleep_until
+        self._heap: List[Any] = []
+        self._tasks: Dict[Hashable, CyclicTask] = {}
+        self._seq = itertools.count()
+        # Evento para despertar a run_async cuando se añade una tarea
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add(self, key: Hashable, period: float, callback: Callable[[CyclicTask], Any], start: Optional[float] = None) -> CyclicTask:
+        """
+        Registra una tarea cíclica. Si ya existía una tarea con la misma clave se sustituye.
+
+        :param key: Identificador de la tarea.
+        :type key: Hashable
+
+        :param period: Periodo en segundos.
+        :type period: float
+
+        :param callback: Función a ejecutar en cada ciclo.
+        :type callback: Callable[[CyclicTask], Any]
+
+        :param start: Instante absoluto de la primera ejecución. Por defecto, ahora.
+        :type start: float
+
+        :return: Tarea registrada.
+        :rtype: CyclicTask
+
+        :raises ValueError: Si el periodo no es positivo.
+        """
+        if not period or period <= 0:
+            raise ValueError(f"Periodo no válido para la tarea {key}: {period}")
+        self.remove(key)
+        task = CyclicTask(key, float(period), callback, self.clock() if start is None else start)
+        self._tasks[key] = task
+        heapq.heappush(self._heap, (task.deadline, next(self._seq), task))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return task
+
+    def remove(self, key: Hashable):
+        """
+        Elimina una tarea. La entrada del heap se descarta de forma perezosa.
+        """
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.active = False
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def tasks(self) -> List[CyclicTask]:
+        """
+        Devuelve las tareas registradas, con sus estadísticas.
+        """
+        return list(self._tasks.values())
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Devuelve el deadline más próximo, o None si no hay tareas.
+        """
+        heap = self._heap
+        while heap and not heap[0][2].active:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def run_due(self, now: Optional[float] = None) -> List[Any]:
+        """
+        Ejecuta todas las tareas cuyo deadline ha vencido y las reprograma.
+
+        :param now: Instante actual. Por defecto se consulta el reloj.
+        :type now: float
+
+        :return: Tramas devueltas por las tareas ejecutadas (las que no sean None).
+        :rtype: List[Any]
+        """
+        if now is None:
+            now = self.clock()
+        heap = self._heap
+        frames = []
+        while heap and heap[0][0] <= now:
+            deadline, _, task = heapq.heappop(heap)
+            if not task.active:
+                continue
+
+            lateness = now - deadline
+            if self.on_run is not None:
+                self.on_run(task, lateness)
+            tolerance = self.tolerance if self.tolerance is not None else task.period / 2
+            if lateness > tolerance:
+                task.missed += 1
+                if self.on_missed is not None:
+                    self.on_missed(task, lateness)
+                # Se saltan los ciclos completos perdidos en lugar de recuperarlos en ráfaga
+                deadline += int(lateness // task.period) * task.period
+
+            frame = task.callback(task)
+            task.runs += 1
+            if frame is not None:
+                if isinstance(frame, list):
+                    frames.extend(frame)
+                else:
+                    frames.append(frame)
+
+            if task.active:
+                task.deadline = deadline + task.period
+                heapq.heappush(heap, (task.deadline, next(self._seq), task))
+        if frames and self.flush is not None:
+            self.flush(frames)
+        return frames
+
+    def wait(self, deadline: float):
+        """
+        Espera hasta el instante indicado: duerme hasta ``spin`` segundos antes y
+        termina con espera activa.
+        """
+        if self.sleep_until is not None:
+            self.sleep_until(deadline)
+            return
+        clock = self.clock
+        remaining = deadline - clock() - self.spin
+        if remaining > 0:
+            time.sleep(remaining)
+        while clock() < deadline:
+            pass
+
+    def run(self, is_alive: Callable[[], bool] = lambda: True):
+        """
+        Bucle principal: ejecuta las tareas en sus deadlines mientras ``is_alive``
+        devuelva True y queden tareas registradas.
+
+        :param is_alive: Condición de continuidad (p. ej. que la suscripción siga viva).
+        :type is_alive: Callable[[], bool]
+        """
+        while is_alive():
+            deadline = self.next_deadline()
+            if deadline is None:
+                break
+            self.wait(deadline)
+            if not is_alive():
+                break
+            self.run_due()
+
+    async def run_async(self, is_alive: Callable[[], bool] = lambda: True):
+        """
+        Variante de :meth:`run` para asyncio: espera a cada deadline sin bloquear el
+        bucle, de forma que el resto de tareas siguen ejecutándose. La espera se
+        interrumpe si se añade una tarea nueva, para respetar su primer deadline.
+
+        :param is_alive: Condición de continuidad.
+        :type is_alive: Callable[[], bool]
+        """
+        self._wakeup = asyncio.Event()
+        try:
+            while is_alive():
+                deadline = self.next_deadline()
+                delay = 0.1 if deadline is None else deadline - self.clock()
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self.run_due()
+        finally:
+            self._wakeup = None
@@ -0,0 +1,419 @@
+import socket
+import struct
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Message ID de los mensajes SOME/IP-SD y puerto UDP de SOME/IP-SD
+SD_MESSAGE_ID = 0xFFFF8100
+SD_PORT = 30490
+
+# Tipos de entrada SD
+ENTRY_FIND_SERVICE = 0x00
+ENTRY_OFFER_SERVICE = 0x01
+ENTRY_SUBSCRIBE = 0x06
+ENTRY_SUBSCRIBE_ACK = 0x07
+
+# Tipos de opción SD con endpoint IPv4
+OPTION_IP4_ENDPOINT = 0x04
+OPTION_IP4_MULTICAST = 0x14
+OPTION_IP4_SD_ENDPOINT = 0x24
+
+# Flags SD: Reboot (0x80) y Unicast (0x40)
+SD_FLAG_REBOOT = 0x80
+SD_FLAG_UNICAST = 0x40
+
+SOMEIP_HEADER_LEN = 16
+SD_ENTRY_LEN = 16
+
+# Instance ID de los servicios ofrecidos (el mismo que anuncian los OFFER)
+INSTANCE_ID = 0x0001
+# TTL (segundos) por defecto de las entradas OfferService
+OFFER_TTL = 3
+
+# Tamaño máximo de un mensaje SD (carga UDP) para que quepa en una trama sin
+# fragmentar: MTU Ethernet de 1500 bytes menos las cabeceras IPv4 (20) y UDP (8)
+SD_MAX_MESSAGE = 1472
+# Bytes fijos de un mensaje SD: cabecera SOME/IP, flags + longitud de entradas y
+# longitud del array de opciones
+SD_MESSAGE_OVERHEAD = SOMEIP_HEADER_LEN + 8 + 4
+# Índice máximo de opción y opciones por entrada que admiten los campos de la entrada
+_SD_MAX_OPTION_INDEX = 0xFF
+_SD_MAX_ENTRY_OPTIONS = 0x0F
+
+# Tipos de mensaje SOME/IP
+MSG_REQUEST = 0x00
+MSG_REQUEST_NO_RETURN = 0x01
+MSG_NOTIFICATION = 0x02
+MSG_RESPONSE = 0x80
+MSG_ERROR = 0x81
+
+# Flag del tipo de mensaje que indica un segmento SOME/IP-TP
+MSG_TP_FLAG = 0x20
+
+# Cabecera SOME/IP-TP (tras la cabecera SOME/IP): offset del segmento en bytes (múltiplo
+# de 16, en los 28 bits altos), 3 bits reservados y el flag More Segments
+TP_HEADER = struct.Struct("!I")
+TP_HEADER_LEN = TP_HEADER.size
+TP_MORE_SEGMENTS = 0x01
+# Payload máxima de cada segmento (múltiplo de 16). Las payloads mayores se segmentan
+TP_MAX_SEGMENT = 1392
+
+# Versión del protocolo SOME/IP
+PROTOCOL_VERSION = 0x01
+
+# Códigos de retorno SOME/IP
+E_OK = 0x00
+E_NOT_OK = 0x01
+E_UNKNOWN_SERVICE = 0x02
+E_UNKNOWN_METHOD = 0x03
+E_NOT_READY = 0x04
+E_WRONG_PROTOCOL_VERSION = 0x07
+E_WRONG_INTERFACE_VERSION = 0x08
+E_MALFORMED_MESSAGE = 0x09
+E_WRONG_MESSAGE_TYPE = 0x0A
+
+# Timestamp de envío opcional que el servidor añade al final de la payload de cada
+# evento (nanosegundos desde epoch, big endian) para medir la latencia extremo a extremo
+EVENT_TIMESTAMP = struct.Struct("!Q")
+EVENT_TIMESTAMP_LEN = EVENT_TIMESTAMP.size
+
+# Cabecera SOME/IP: Message ID, Length, Client ID, Session ID, versiones, tipo y código
+_SOMEIP_HEADER = struct.Struct("!IIHHBBBB")
+# Cabecera SD: flags, reservado (3 bytes) y longitud del array de entradas
+_SD_HEADER = struct.Struct("!B3xI")
+# Entrada SD: tipo, índices, número de opciones, Service ID, Instance ID,
+# versión mayor + TTL (1 + 3 bytes) y los 4 bytes dependientes del tipo
+_SD_ENTRY = struct.Struct("!BBBBHHII")
+_U32 = struct.Struct("!I")
+# Cabecera de opción: longitud y tipo (más un byte reservado)
+_SD_OPTION_HEADER = struct.Struct("!HBx")
+# Opción IPv4: dirección, reservado, protocolo y puerto
+_SD_OPTION_IP4 = struct.Struct("!4sxBH")
+_ETHERTYPE = struct.Struct("!H")
+_U16 = struct.Struct("!H")
+
+
+class SomeipHeader(NamedTuple):
+    """
+    Cabecera SOME/IP decodificada.
+    """
+    msg_id: int
+    length: int
+    client_id: int
+    session_id: int
+    proto_ver: int
+    iface_ver: int
+    msg_type: int
+    retcode: int
+
+
+class Endpoint(NamedTuple):
+    """
+    Opción SD de tipo endpoint IPv4 (unicast, multicast o SD).
+    """
+    option_type: int
+    addr: str
+    l4_proto: int
+    port: int
+
+
+class SDEntry(NamedTuple):
+    """
+    Entrada SD decodificada con sus opciones ya resueltas.
+
+    Para las entradas de servicio (Find/Offer) se rellena ``minor_ver``; para las de
+    eventgroup (Subscribe/SubscribeAck) ``counter`` y ``eventgroup_id``.
+    """
+    type: int
+    srv_id: int
+    inst_id: int
+    major_ver: int
+    ttl: int
+    minor_ver: int
+    counter: int
+    eventgroup_id: int
+    options: Tuple[Endpoint, ...]
+
+
+def decode_someip_header(buf: Buffer, offset: int = 0) -> SomeipHeader:
+    """
+    Decodifica la cabecera SOME/IP que empieza en ``offset``.
+
+    :raises ValueError: Si el buffer no contiene una cabecera completa.
+    """
+    if len(buf) - offset < SOMEIP_HEADER_LEN:
+        raise ValueError("Cabecera SOME/IP truncada")
+    return SomeipHeader(*_SOMEIP_HEADER.unpack_from(buf, offset))
+
+
+def udp_payload(frame: Buffer) -> Optional[memoryview]:
+    """
+    Localiza la carga UDP de una trama Ethernet IPv4, con o sin etiqueta 802.1Q
+    (la etiqueta puede no estar si la tarjeta la ha extraído).
+
+    La vista se limita a la longitud del datagrama UDP, sin el relleno que se añade a
+    las tramas Ethernet cortas.
+
+    :return: Vista sobre la carga UDP, o None si la trama no es IPv4/UDP o está truncada.
+    :rtype: Optional[memoryview]
+    """
+    view = memoryview(frame)
+    if len(view) < 14:
+        return None
+    ip = 14
+    ethertype = _ETHERTYPE.unpack_from(view, 12)[0]
+    if ethertype == 0x8100:
+        if len(view) < 18:
+            return None
+        ip = 18
+        ethertype = _ETHERTYPE.unpack_from(view, 16)[0]
+    if ethertype != 0x0800 or len(view) < ip + 20 or view[ip + 9] != socket.IPPROTO_UDP:
+        return None
+    ip_end = ip + _U16.unpack_from(view, ip + 2)[0]
+    udp = ip + (view[ip] & 0x0F) * 4
+    if ip_end > len(view) or udp + 8 > ip_end:
+        return None
+    udp_end = udp + _U16.unpack_from(view, udp + 4)[0]
+    if udp_end > ip_end or udp_end < udp + 8:
+        return None
+    return view[udp + 8:udp_end]
+
+
+def _decode_options(view: memoryview, start: int, end: int) -> Tuple[Optional[Endpoint], ...]:
+    options = []
+    pos = start
+    while pos < end:
+        if pos + _SD_OPTION_HEADER.size > end:
+            raise ValueError("Cabecera de opción SD truncada")
+        length, option_type = _SD_OPTION_HEADER.unpack_from(view, pos)
+        # El campo longitud no incluye los 3 bytes de longitud y tipo
+        next_pos = pos + 3 + length
+        if next_pos > end:
+            raise ValueError("Opción SD truncada")
+        if length < 1:
+            raise ValueError("Opción SD sin byte reservado")
+        if option_type in (OPTION_IP4_ENDPOINT, OPTION_IP4_MULTICAST, OPTION_IP4_SD_ENDPOINT) and length >= 9:
+            addr, l4_proto, port = _SD_OPTION_IP4.unpack_from(view, pos + 4)
+            options.append(Endpoint(option_type, socket.inet_ntoa(addr), l4_proto, port))
+        else:
+            # Opciones no soportadas: se conserva su posición para no desplazar los índices
+            options.append(None)
+        pos = next_pos
+    return tuple(options)
+
+
+def iter_sd_entries(message: Buffer, offset: int = 0) -> Iterator[SDEntry]:
+    """
+    Recorre las entradas de un mensaje SOME/IP-SD sin construir objetos de Scapy.
+
+    :param message: Buffer que contiene el mensaje SOME/IP (cabecera incluida).
+    :type message: bytes | bytearray | memoryview
+
+    :param offset: Offset de la cabecera SOME/IP dentro del buffer.
+    :type offset: int
+
+    :return: Generador de entradas. No genera nada si el mensaje no es SD.
+    :rtype: Iterator[SDEntry]
+
+    :raises ValueError: Si el mensaje SD está truncado o mal formado.
+    """
+    view = memoryview(message)
+    if len(view) - offset < SOMEIP_HEADER_LEN + 8:
+        return
+    if _U32.unpack_from(view, offset)[0] != SD_MESSAGE_ID:
+        return
+
+    sd = offset + SOMEIP_HEADER_LEN
+    _, entries_len = _SD_HEADER.unpack_from(view, sd)
+    entries_start = sd + 8
+    entries_end = entries_start + entries_len
+    if entries_end + 4 > len(view):
+        raise ValueError("Array de entradas SD truncado")
+    options_len = _U32.unpack_from(view, entries_end)[0]
+    options_start = entries_end + 4
+    if options_start + options_len > len(view):
+        raise ValueError("Array de opciones SD truncado")
+
+    options = None
+    for pos in range(entries_start, entries_end - SD_ENTRY_LEN + 1, SD_ENTRY_LEN):
+        entry_type, index_1, index_2, n_opts, srv_id, inst_id, ver_ttl, last = _SD_ENTRY.unpack_from(view, pos)
+        resolved = ()
+        if n_opts:
+            # Las opciones solo se decodifican si alguna entrada las referencia
+            if options is None:
+                options = _decode_options(view, options_start, options_start + options_len)
+            n_opt_1, n_opt_2 = n_opts >> 4, n_opts & 0x0F
+            resolved = tuple(
+                opt for opt in options[index_1:index_1 + n_opt_1] + options[index_2:index_2 + n_opt_2]
+                if opt is not None
+            )
+        if entry_type in (ENTRY_FIND_SERVICE, ENTRY_OFFER_SERVICE):
+            minor_ver, counter, eventgroup_id = last, 0, 0
+        else:
+            minor_ver, counter, eventgroup_id = 0, (last >> 16) & 0x0F, last & 0xFFFF
+        yield SDEntry(
+            entry_type, srv_id, inst_id, ver_ttl >> 24, ver_ttl & 0xFFFFFF,
+            minor_ver, counter, eventgroup_id, resolved
+        )
+
+
+def iter_frame_sd_entries(frame: Buffer) -> Iterator[SDEntry]:
+    """
+    Igual que :func:`iter_sd_entries` pero partiendo de una trama Ethernet capturada.
+    """
+    payload = udp_payload(frame)
+    if payload is not None:
+        yield from iter_sd_entries(payload)
+
+
+def encode_someip_header(
+    msg_id: int, payload_len: int, session_id: int, msg_type: int,
+    client_id: int = 0x0000, proto_ver: int = 0x01, iface_ver: int = 0x01, retcode: int = 0x00
+) -> bytes:
+    """
+    Codifica una cabecera SOME/IP. El campo Length se calcula a partir de la longitud
+    de la payload (cubre los 8 últimos bytes de la cabecera más la payload).
+    """
+    return _SOMEIP_HEADER.pack(
+        msg_id, 8 + payload_len, client_id, session_id, proto_ver, iface_ver, msg_type, retcode
+    )
+
+
+def encode_service_entry(
+    entry_type: int, srv_id: int, inst_id: int, major_ver: int, ttl: int, minor_ver: int,
+    index_1: int = 0, n_opt_1: int = 0, index_2: int = 0, n_opt_2: int = 0
+) -> bytes:
+    """
+    Codifica una entrada SD de servicio (FindService/OfferService).
+    """
+    return _SD_ENTRY.pack(
+        entry_type, index_1, index_2, (n_opt_1 << 4) | n_opt_2, srv_id, inst_id,
+        (major_ver << 24) | (ttl & 0xFFFFFF), minor_ver
+    )
+
+
+def encode_eventgroup_entry(
+    entry_type: int, srv_id: int, inst_id: int, major_ver: int, ttl: int, eventgroup_id: int,
+    counter: int = 0, index_1: int = 0, n_opt_1: int = 0, index_2: int = 0, n_opt_2: int = 0
+) -> bytes:
+    """
+    Codifica una entrada SD de eventgroup (Subscribe/SubscribeAck).
+    """
+    return _SD_ENTRY.pack(
+        entry_type, index_1, index_2, (n_opt_1 << 4) | n_opt_2, srv_id, inst_id,
+        (major_ver << 24) | (ttl & 0xFFFFFF), ((counter & 0x0F) << 16) | eventgroup_id
+    )
+
+
+def encode_ip4_option(option_type: int, addr: str, l4_proto: int, port: int) -> bytes:
+    """
+    Codifica una opción SD de endpoint IPv4 (unicast, multicast o SD).
+    """
+    return _SD_OPTION_HEADER.pack(9, option_type) + _SD_OPTION_IP4.pack(socket.inet_aton(addr), l4_proto, port)
+
+
+def encode_sd_message(
+    session_id: int,
+    entries: Iterable[bytes],
+    options: Iterable[bytes] = (),
+    flags: int = SD_FLAG_REBOOT | SD_FLAG_UNICAST,
+    client_id: int = 0x0000
+) -> bytes:
+    """
+    Codifica un mensaje SOME/IP-SD completo (cabecera SOME/IP incluida) a partir de
+    entradas y opciones ya codificadas.
+
+    :param session_id: Session ID del mensaje.
+    :type session_id: int
+
+    :param entries: Entradas codificadas con ``encode_*_entry``.
+    :type entries: Iterable[bytes]
+
+    :param options: Opciones codificadas con ``encode_ip4_option``.
+    :type options: Iterable[bytes]
+
+    :param flags: Byte de flags SD.
+    :type flags: int
+
+    :param client_id: Client ID de la cabecera SOME/IP.
+    :type client_id: int
+
+    :return: Mensaje listo para enviarse como carga UDP.
+    :rtype: bytes
+    """
+    entries = b"".join(entries)
+    options = b"".join(options)
+    body = _SD_HEADER.pack(flags, len(entries)) + entries + _U32.pack(len(options)) + options
+    return encode_someip_header(SD_MESSAGE_ID, len(body), session_id, 0x02, client_id) + body
+
+
+def pack_sd_entries(
+    entries: Iterable[Tuple[bytes, Sequence[bytes]]],
+    max_size: int = SD_MAX_MESSAGE
+) -> List[Tuple[List[bytes], List[bytes]]]:
+    """
+    Agrupa entradas SD en el menor número de mensajes que quepan en ``max_size``
+    bytes, compartiendo las opciones idénticas.
+
+    Cada entrada se da codificada sin opciones (índice y número de opciones a cero)
+    junto con la secuencia de opciones que la acompañan. Dentro de un mensaje, las
+    entradas con la misma secuencia de opciones la referencian por índice en el primer
+    run de opciones, que solo se incluye una vez: p. ej. los OFFER de todos los
+    servicios de una ECU comparten la opción con su endpoint.
+
+    Se conserva el orden de las entradas. Las entradas se van añadiendo al mensaje en
+    curso y se abre uno nuevo cuando la entrada (y sus opciones, si son nuevas en el
+    mensaje) ya no caben o se agotan los índices de opción.
+
+    :param entries: Pares (entrada codificada, opciones codificadas).
+    :type entries: Iterable[Tuple[bytes, Sequence[bytes]]]
+
+    :param max_size: Tamaño máximo de cada mensaje, cabecera SOME/IP incluida.
+    :type max_size: int
+
+    :return: Lista de mensajes como pares (entradas con sus índices, opciones), listos
+        para :func:`encode_sd_message`.
+    :rtype: List[Tuple[List[bytes], List[bytes]]]
+
+    :raises ValueError: Si una entrada no cabe sola en un mensaje o lleva más opciones
+        de las que admite el formato.
+    """
+    messages: List[Tuple[List[bytes], List[bytes]]] = []
+    packed: List[bytes] = []
+    options: List[bytes] = []
+    # Índice del primer run de cada secuencia de opciones ya incluida en el mensaje
+    runs: Dict[Tuple[bytes, ...], int] = {}
+    size = SD_MESSAGE_OVERHEAD
+
+    for entry, entry_options in entries:
+        entry_options = tuple(entry_options)
+        if len(entry_options) > _SD_MAX_ENTRY_OPTIONS:
+            raise ValueError(f"Una entrada SD admite como máximo {_SD_MAX_ENTRY_OPTIONS} opciones")
+        run_len = sum(len(option) for option in entry_options)
+        if SD_MESSAGE_OVERHEAD + SD_ENTRY_LEN + run_len > max_size:
+            raise ValueError(f"La entrada SD no cabe en un mensaje de {max_size} bytes")
+
+        index = runs.get(entry_options) if entry_options else 0
+        needed = SD_ENTRY_LEN + (run_len if index is None else 0)
+        if packed and (size + needed > max_size or (index is None and len(options) > _SD_MAX_OPTION_INDEX)):
+            messages.append((packed, options))
+            packed, options, runs = [], [], {}
+            size = SD_MESSAGE_OVERHEAD
+            index = None if entry_options else 0
+            needed = SD_ENTRY_LEN + run_len
+        if index is None:
+            index = runs[entry_options] = len(options)
+            options.extend(entry_options)
+        size += needed
+
+        if entry_options:
+            entry = bytearray(entry)
+            entry[1] = index
+            entry[3] = (len(entry_options) << 4) | (entry[3] & 0x0F)
+            entry = bytes(entry)
+        packed.append(entry)
+
+    if packed:
+        messages.append((packed, options))
+    return messages
@@ -0,0 +1,215 @@
+import itertools
+import random
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Tuple
+from scheduler import CyclicScheduler, CyclicTask
+from logger import get_logger
+from sdCodec import OFFER_TTL
+
+log = get_logger("sd")
+
+# Espera inicial aleatoria (segundos) antes del primer OFFER
+INITIAL_DELAY_MIN = 0.01
+INITIAL_DELAY_MAX = 0.05
+# Fase de repetición por defecto, si services.json no define Rep_Phase_Time (ms) y
+# Rep_Phase_Cycle (repeticiones)
+REPETITIONS_BASE_DELAY = 0.1
+REPETITIONS_MAX = 3
+# Periodo de los OFFER en la fase principal
+CYCLIC_OFFER_DELAY = 1.0
+
+# Fases de una instancia de servicio ofrecida
+PHASE_DOWN = 0
+PHASE_INITIAL_WAIT = 1
+PHASE_REPETITION = 2
+PHASE_MAIN = 3
+
+# Construye las tramas que anuncian unos servicios con un TTL (0 para StopOffer)
+OfferBuilder = Callable[[Sequence[Hashable], int], Optional[List[Any]]]
+
+
+def offer_timing(method_data: Mapping[str, Any]) -> Tuple[float, int]:
+    """
+    Devuelve la temporización de la fase de repetición de un servicio a partir de los
+    campos ``Rep_Phase_Time`` (retardo base en milisegundos) y ``Rep_Phase_Cycle``
+    (número de repeticiones) de services.json, o los valores por defecto si no existen.
+
+    :param method_data: Datos del servicio devueltos por ``Parser.get_service_data``.
+    :type method_data: Mapping[str, Any]
+
+    :return: Retardo base en segundos y número de repeticiones.
+    :rtype: Tuple[float, int]
+    """
+    base_delay = method_data.get("Rep_Phase_Time")
+    repetitions = method_data.get("Rep_Phase_Cycle")
+    return (
+        REPETITIONS_BASE_DELAY if base_delay is None else base_delay / 1000,
+        REPETITIONS_MAX if repetitions is None else int(repetitions)
+    )
+
+
+class _OfferGroup():
+    """
+    Instancias ofrecidas a la vez y con la misma temporización, que comparten fase y
+    tarea del planificador para que sus OFFER salgan agregados en los mismos mensajes.
+    """
+    __slots__ = ("key", "instances", "base_delay", "repetitions", "phase", "sent")
+
+    def __init__(self, key: Hashable, instances: List[Hashable], base_delay: float, repetitions: int):
+        self.key = key
+        self.instances = instances
+        self.base_delay = base_delay
+        self.repetitions = repetitions
+        self.phase = PHASE_INITIAL_WAIT
+        # OFFER enviados en la fase de repetición
+        self.sent = 0
+
+
+class OfferPhaseEngine():
+    """
+    Ciclo de vida SOME/IP-SD de las instancias de servicio ofrecidas, sobre el
+    :class:`CyclicScheduler` del servidor y sin hilos por servicio:
+
+    - Espera inicial: retardo aleatorio entre ``initial_delay`` antes del primer OFFER.
+    - Fase de repetición: ``repetitions`` OFFER más, separados por el retardo base
+      multiplicado por 2 en cada repetición (``Rep_Phase_Time`` y ``Rep_Phase_Cycle``,
+      ver :func:`offer_timing`).
+    - Fase principal: un OFFER cada ``cyclic_delay`` segundos hasta la parada.
+    - StopOffer (OFFER con TTL 0) de las instancias ya anunciadas en :meth:`stop_offer`.
+
+    Las instancias que se ofrecen en la misma llamada a :meth:`offer` con la misma
+    temporización forman un grupo con una única tarea del planificador (clave
+    ``("sd", n)``) y una misma espera inicial, de modo que sus OFFER se construyen
+    juntos con ``build`` y pueden agregarse en un mismo mensaje SD. Las tramas que
+    devuelve ``build`` se envían en el lote del planificador.
+    """
+
+    def __init__(
+        self,
+        scheduler: CyclicScheduler,
+        build: OfferBuilder,
+        cyclic_delay: float = CYCLIC_OFFER_DELAY,
+        ttl: int = OFFER_TTL,
+        initial_delay: Tuple[float, float] = (INITIAL_DELAY_MIN, INITIAL_DELAY_MAX),
+        rng: Callable[[float, float], float] = random.uniform
+    ):
+        """
+        :param scheduler: Planificador que ejecuta las fases y envía las tramas.
+        :type scheduler: CyclicScheduler
+
+        :param build: Función que recibe las instancias a anunciar y el TTL y devuelve
+            las tramas a enviar.
+        :type build: Callable[[Sequence[Hashable], int], Optional[List[Any]]]
+
+        :param cyclic_delay: Periodo en segundos de los OFFER de la fase principal.
+        :type cyclic_delay: float
+
+        :param ttl: TTL en segundos de las entradas OfferService.
+        :type ttl: int
+
+        :param initial_delay: Mínimo y máximo de la espera inicial en segundos.
+        :type initial_delay: Tuple[float, float]
+
+        :param rng: Generador de la espera inicial a partir del mínimo y el máximo.
+        :type rng: Callable[[float, float], float]
+
+        :raises ValueError: Si el periodo, el TTL o la espera inicial no son válidos.
+        """
+        if cyclic_delay <= 0:
+            raise ValueError(f"Periodo de OFFER no válido: {cyclic_delay}")
+        if not 0 < ttl <= 0xFFFFFF:
+            raise ValueError(f"TTL de OFFER no válido: {ttl}")
+        if not 0 <= initial_delay[0] <= initial_delay[1]:
+            raise ValueError(f"Espera inicial no válida: {initial_delay}")
+        if ttl < cyclic_delay:
+            log.warning("El TTL de los OFFER (%d s) es menor que su periodo (%.3f s)", ttl, cyclic_delay)
+        self.scheduler = scheduler
+        self.build = build
+        self.cyclic_delay = cyclic_delay
+        self.ttl = ttl
+        self.initial_delay = initial_delay
+        self.rng = rng
+        self._groups: Dict[Hashable, _OfferGroup] = {}
+        self._group_of: Dict[Hashable, _OfferGroup] = {}
+        self._ids = itertools.count()
+
+    def offer(self, instances: Mapping[Hashable, Tuple[float, int]]):
+        """
+        Empieza a ofrecer instancias de servicio. Las que ya se estaban ofreciendo
+        continúan en su fase actual.
+
+        :param instances: Temporización (retardo base en segundos y repeticiones) de
+            cada instancia, p. ej. la de :func:`offer_timing`.
+        :type instances: Mapping[Hashable, Tuple[float, int]]
+        """
+        by_timing: Dict[Tuple[float, int], List[Hashable]] = {}
+        for instance, timing in instances.items():
+            if instance not in self._group_of:
+                by_timing.setdefault(timing, []).append(instance)
+        if not by_timing:
+            return
+        start = self.scheduler.clock() + self.rng(*self.initial_delay)
+        for (base_delay, repetitions), members in by_timing.items():
+            if base_delay <= 0 and repetitions > 0:
+                raise ValueError(f"Retardo de la fase de repetición no válido: {base_delay}")
+            group = _OfferGroup(("sd", next(self._ids)), members, base_delay, repetitions)
+            self._groups[group.key] = group
+            for instance in members:
+                self._group_of[instance] = group
+            self.scheduler.add(group.key, self.cyclic_delay, self._run_phase, start=start)
+
+    def phase(self, instance: Hashable) -> int:
+        """
+        Devuelve la fase actual (``PHASE_*``) de una instancia.
+        """
+        group = self._group_of.get(instance)
+        return PHASE_DOWN if group is None else group.phase
+
+    def stop_offer(self, instances: Optional[Iterable[Hashable]] = None) -> List[Any]:
+        """
+        Deja de ofrecer instancias de servicio y devuelve las tramas StopOffer (TTL 0)
+        de las que ya se habían anunciado, para que el llamante las envíe.
+
+        :param instances: Instancias a retirar. None para retirarlas todas.
+        :type instances: Iterable[Hashable]
+
+        :return: Tramas StopOffer.
+        :rtype: List[Any]
+        """
+        if instances is None:
+            instances = list(self._group_of)
+        announced = []
+        for instance in instances:
+            group = self._group_of.pop(instance, None)
+            if group is None:
+                continue
+            if group.phase != PHASE_INITIAL_WAIT:
+                announced.append(instance)
+            group.instances.remove(instance)
+            if not group.instances:
+                del self._groups[group.key]
+                self.scheduler.remove(group.key)
+        if not announced:
+            return []
+        return self.build(announced, 0) or []
+
+    def _run_phase(self, task: CyclicTask) -> Optional[List[Any]]:
+        """
+        Envía los OFFER de un grupo y fija el periodo hasta el siguiente según su fase.
+        """
+        group = self._groups.get(task.key)
+        if group is None:
+            self.scheduler.remove(task.key)
+            return None
+        if group.phase == PHASE_INITIAL_WAIT:
+            group.phase = PHASE_REPETITION if group.repetitions else PHASE_MAIN
+        elif group.phase == PHASE_REPETITION:
+            group.sent += 1
+            if group.sent >= group.repetitions:
+                group.phase = PHASE_MAIN
+
+        # El planificador calcula el siguiente deadline con el periodo fijado aquí
+        if group.phase == PHASE_REPETITION:
+            task.period = group.base_delay * (1 << group.sent)
+        else:
+            task.period = self.cyclic_delay
+        return self.build(group.instances, self.ttl)
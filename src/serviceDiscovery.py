@@ -1,7 +1,14 @@
-from scapy.all import Ether, Dot1Q, IP, sendp
-from scapy.contrib.automotive.someip import *
+from scapy.layers.l2 import Ether, Dot1Q
+from scapy.layers.inet import IP, UDP
+from scapy.packet import Raw
 from parser import Parser
-from typing import Dict, Any
+from transmit import get_transmitter
+from sessions import get_session_manager
+from sdCodec import (
+    ENTRY_OFFER_SERVICE, ENTRY_SUBSCRIBE_ACK, OFFER_TTL, OPTION_IP4_ENDPOINT,
+    encode_eventgroup_entry, encode_ip4_option, encode_sd_message, encode_service_entry, pack_sd_entries
+)
+from typing import Dict, Any, List, Sequence, Tuple
 
 class someipSD():
     """
@@ -9,68 +16,77 @@ class someipSD():
     principalmente de tipo OFFER y ACK.
 
     Encapsula la lógica necesaria para construir correctamente los mensajes 
-    SOME/IP con sus respectivas entradas y opciones, así como la gestión 
-    del Session ID para cada instancia.
+    SOME/IP con sus respectivas entradas y opciones. Cada mensaje toma el Session ID y
+    el flag Reboot del contador SD de su pareja emisor/destino (ver
+    :meth:`sessions.SessionManager.sd_counter`), por lo que un mismo objeto sirve para
+    construir todos los mensajes. El mensaje SD se codifica con ``struct``
+    (ver ``sdCodec``) y Scapy solo aporta las capas Ethernet, VLAN, IP y UDP, por lo
+    que no se carga el módulo SOME/IP de Scapy.
 
-    :ivar header: Cabecera SOME/IP configurada por instancia.
-    :ivar s: Objeto SD para encapsular las entradas y opciones del paquete.
     :ivar myParser: Instancia del parser de servicios y configuración.
     """
-    # Se crea un atributo privado de clase para que en cada instanciación
-    # se incremente el session id
-    __session_id = 0
-    
+
     def __init__(self, ):
         self.myParser = Parser()
-        # La cabacera es SOMEIP y es la misma para todos los paquetes
-        self.header = SOMEIP()
-        # Se establece el message ID, formado por (Service ID / Method ID)
-        self.header.srv_id = SD.SOMEIP_MSGID_SRVID
-        self.header.method_id = 0x8100
-        someipSD.__session_id += 1
-        self.header.session_id = someipSD.__session_id
-        # Se establece el message type a 0x02, ya que los mensajes SD son de tipo notification
-        self.header.msg_type = SD.SOMEIP_MSG_TYPE
-
-        # Se inicializa la parte de sd
-        self.s = SD()
-        self.s.flags = 0x03
-
-    def _setSDEntry(self, method_data: Dict[str, Any], option: str, data_dst: Dict[str, Any]):
+        self.sessions = get_session_manager()
+        # Mensajes OFFER agregados por (ECU origen, servicios, TTL), ver craft_offer_packets.
+        # Se descartan cuando el registro de configuración se recarga
+        self._offer_batches: Dict[Tuple[str, Tuple[int, ...], int], List[Tuple[List[bytes], List[bytes]]]] = {}
+        self._offer_batches_version = self.myParser.registry.version
+
+    def _offer_entry(self, method_data: Dict[str, Any], data_dst: Dict[str, Any], ttl: int = OFFER_TTL) -> Tuple[bytes, Tuple[bytes]]:
         """
-        Establece las entradas (entry) y opciones (option) del paquete SD según el tipo especificado.
+        Codifica la entrada OfferService de un servicio y la opción con el endpoint
+        IPv4 en el que se ofrece, sin índices de opción (ver ``pack_sd_entries``).
 
         :param method_data: Diccionario con la información del servicio.
         :type method_data: Dict[str, Any]
 
-        :param option: Tipo de operación SD (e.g., "OFFER").
-        :type option: str
+        :param data_dst: Información de destino de red como IP, MAC y puertos.
+        :type data_dst: Dict[str, Any]
+
+        :param ttl: TTL de la entrada en segundos (0 para StopOffer).
+        :type ttl: int
+
+        :return: Entrada y opciones codificadas.
+        :rtype: Tuple[bytes, Tuple[bytes]]
+        """
+        entry = encode_service_entry(
+            ENTRY_OFFER_SERVICE,
+            method_data["SOMEIP"]["ServID"],
+            0x0001,
+            int(method_data["OFFER"]["Major_Version"], 16),
+            ttl,
+            int(method_data["OFFER"]["Minor_Version"], 16)
+        )
+        # El option array describe cómo acceder al servicio mencionado en el entry array
+        option = encode_ip4_option(
+            OPTION_IP4_ENDPOINT, data_dst["ip"], int(data_dst["option_sdprot"], 16), data_dst["option_sdport"]
+        )
+        return entry, (option,)
+
+    def _offer_message(self, method_data: Dict[str, Any], data_dst: Dict[str, Any], ttl: int = OFFER_TTL) -> bytes:
+        """
+        Codifica el mensaje SD de un OFFER: una entrada OfferService y la opción con el
+        endpoint IPv4 en el que se ofrece el servicio.
+
+        :param method_data: Diccionario con la información del servicio.
+        :type method_data: Dict[str, Any]
 
         :param data_dst: Información de destino de red como IP, MAC y puertos.
         :type data_dst: Dict[str, Any]
+
+        :param ttl: TTL de la entrada en segundos (0 para StopOffer).
+        :type ttl: int
+
+        :return: Mensaje SOME/IP-SD (cabecera SOME/IP incluida).
+        :rtype: bytes
         """
-        aux_entry = []
-        entry = SDEntry_Service()
-        if option == "OFFER":
-            entry.type = 1
-            # int(method_data["OFFER"]["Type"], 16)
-            entry.srv_id = method_data["SOMEIP"]["ServID"]
-            entry.major_ver = int(method_data["OFFER"]["Major_Version"], 16)
-            entry.minor_ver = int(method_data["OFFER"]["Minor_Version"], 16)
-            entry.n_opt_1 = 0x01
-            entry.inst_id = 0x0001
-            entry.ttl = 3
-            aux_entry.append(entry)
-            # Ahora hay que crear el option array
-            option_array = SDOption_IP4_EndPoint()
-            option_array.addr = data_dst["ip"]
-            option_array.l4_proto = int(data_dst["option_sdprot"], 16)
-            option_array.port = data_dst["option_sdport"]
-            
-            self.s.set_entryArray(aux_entry)
-            self.s.set_optionArray(option_array)
-    
-    def craft_offer_packet(self, sender: str, destino: str, service: int) -> Ether:
+        [(entries, options)] = pack_sd_entries([self._offer_entry(method_data, data_dst, ttl)])
+        session_id, flags = self.sessions.sd_counter(data_dst["ip"], data_dst["IP_1500_MULTICAST"]).next_sd()
+        return encode_sd_message(session_id, entries, options, flags)
+
+    def craft_offer_packet(self, sender: str, destino: str, service: int, ttl: int = OFFER_TTL) -> Ether:
         """
         Construye un paquete SOME/IP-SD de tipo OFFER listo para ser enviado.
 
@@ -83,6 +99,9 @@ class someipSD():
         :param service: ID del servicio SOME/IP a anunciar.
         :type service: int
 
+        :param ttl: TTL de la entrada en segundos (0 para StopOffer).
+        :type ttl: int
+
         :return: Paquete Ethernet completo con encabezados VLAN, IP, UDP y SOME/IP.
         :rtype: Ether
         """
@@ -91,14 +110,6 @@ class someipSD():
         # Busco con mi instancia parser el servicio que quiero ofrecer y obtengo los datos
         myDic = self.myParser.get_service_data(service)
 
-        # Creo un nuevo objeto para que se incremente el session id. De no ser así cada offer
-        # no sería una nueva instancia de la clase y no podría ser tratada de forma independiente.
-        new = someipSD()
-        # Con esos datos creo el entry value y el option array con una funcion privada
-        new._setSDEntry(myDic, "OFFER", data_dst)
-
-        # Cabecera SOMEIP y la payload es la parte de SD
-        new.header.payload = new.s
         # Capa de red con VLAN    
         packetSD = (
             # Aqui va a a tener una mac origen y una mac destino
@@ -110,10 +121,59 @@ class someipSD():
             # Direccion UDP fuente y destino
             UDP(sport=data_dst["sd_port_src"], dport=data_dst["sd_port_dst"]) /
             # La gestion de SD la hace la clase someipSD
-            new.header
+            Raw(load=self._offer_message(myDic, data_dst, ttl))
         )
         return packetSD
 
+    def craft_offer_packets(self, sender: str, services: Sequence[int], ttl: int = OFFER_TTL) -> List[Ether]:
+        """
+        Construye los paquetes SOME/IP-SD que anuncian a la vez varios servicios: las
+        entradas OfferService se agrupan en el menor número de mensajes que caben en la
+        MTU y el endpoint, común a todos los servicios de la ECU, se envía una sola vez
+        por mensaje (ver ``pack_sd_entries``).
+
+        Las entradas y opciones se codifican en la primera llamada y se reutilizan en
+        las siguientes con los mismos servicios hasta que cambia la configuración (ver
+        :class:`parser.ConfigRegistry`); cada paquete lleva su propio Session ID.
+
+        :param sender: ECU origen que genera los paquetes.
+        :type sender: str
+
+        :param services: IDs de los servicios SOME/IP a anunciar.
+        :type services: Sequence[int]
+
+        :param ttl: TTL de las entradas en segundos (0 para StopOffer).
+        :type ttl: int
+
+        :return: Paquetes Ethernet completos, uno por mensaje SD.
+        :rtype: List[Ether]
+        """
+        data_dst = self.myParser.multicast(sender)
+        # La consulta anterior ya ha recargado el registro si los ficheros han cambiado
+        version = self.myParser.registry.version
+        if version != self._offer_batches_version:
+            self._offer_batches.clear()
+            self._offer_batches_version = version
+        key = (sender, tuple(services), ttl)
+        messages = self._offer_batches.get(key)
+        if messages is None:
+            messages = self._offer_batches[key] = pack_sd_entries(
+                self._offer_entry(self.myParser.get_service_data(service), data_dst, ttl) for service in services
+            )
+
+        sessions = self.sessions.sd_counter(data_dst["ip"], data_dst["IP_1500_MULTICAST"])
+        packets = []
+        for entries, options in messages:
+            session_id, flags = sessions.next_sd()
+            packets.append(
+                Ether(src=data_dst["mac_address"], dst=data_dst["MAC_1500_MULTICAST"]) /
+                Dot1Q(vlan=data_dst["vlan"], prio=5) /
+                IP(src=data_dst["ip"], dst=data_dst["IP_1500_MULTICAST"]) /
+                UDP(sport=data_dst["sd_port_src"], dport=data_dst["sd_port_dst"]) /
+                Raw(load=encode_sd_message(session_id, entries, options, flags))
+            )
+        return packets
+
     # El entry_array contiene objetos como SDEntry_Service en el caso de FindService y OfferService
     # En el caso de offer, el entry_array define qué servicios se ofrecen, y qué instancias del mismo
     # El option array describe cómo acceder al servicio mencionado en el entry array
@@ -123,30 +183,30 @@ class someipSD():
     # el service id, el instance id y el flags. El flags es un entero que contiene la información
     # de si el servicio es multicast o unicast, y si es unicast, la dirección IP de destino.
 
-    def _SDEntry_EventGroup(self, method_data):
+    def _SDEntry_EventGroup(self, method_data, data_dst) -> bytes:
         """
-        Agrega una entrada de tipo EventGroup al array de entradas del paquete SD.
+        Codifica el mensaje SD con una entrada de tipo SubscribeEventgroupAck.
 
         :param method_data: Diccionario con información del servicio y EventGroup.
         :type method_data: dict
+
+        :param data_dst: Datos de red entre la ECU que responde y la suscrita.
+        :type data_dst: dict
+
+        :return: Mensaje SOME/IP-SD (cabecera SOME/IP incluida).
+        :rtype: bytes
         """
-        aux = []
-        entry = SDEntry_EventGroup()
-        entry.type = 0x07
-        entry.index_1 = 0x00
-        entry.index_2 = 0x00
-        entry.n_opt_1 = 0x0
-        entry.n_opt_2 = 0x0
-        entry.srv_id = method_data["SOMEIP"]["ServID"]
-        entry.inst_id = 0x0001
-        entry.major_ver = int(method_data["OFFER"]["Major_Version"], 16)
-        entry.ttl = 3
-        entry.res = 0x000000
-        entry.cnt = 0x0
-        entry.eventgroup_id = 0x0001
-        #int(method_data["SUBSCRIBE"]["EventgroupID"], 16)
-        aux.append(entry)
-        self.s.set_entryArray(aux)
+        entry = encode_eventgroup_entry(
+            ENTRY_SUBSCRIBE_ACK,
+            method_data["SOMEIP"]["ServID"],
+            0x0001,
+            int(method_data["OFFER"]["Major_Version"], 16),
+            3,
+            0x0001
+            #int(method_data["SUBSCRIBE"]["EventgroupID"], 16)
+        )
+        session_id, flags = self.sessions.sd_counter(data_dst["ip_src"], data_dst["ip_dst"]).next_sd()
+        return encode_sd_message(session_id, [entry], flags=flags)
         
     def craft_subscribeEventGroupACK_packet(self, sender, destino, service: int) -> Ether:
         """
@@ -167,9 +227,6 @@ class someipSD():
         data_dst = self.myParser.ecu1_to_ecu2(sender, destino)
         method_data = self.myParser.get_service_data(service)
 
-        self._SDEntry_EventGroup(method_data)
-
-        self.header.payload = self.s
         packetACKSD = (
         # Aqui va a a tener una mac origen y una mac destino
         Ether(src=data_dst["mac_address"], dst=data_dst["mac_dst"]) /  # La de la SA
@@ -180,20 +237,22 @@ class someipSD():
         # Direccion UDP fuente y destino
         UDP(sport=data_dst["udp_src"], dport=data_dst["udp_dst"]) /
         # La gestion de SD la hace la clase someipSD
-        self.header
+        Raw(load=self._SDEntry_EventGroup(method_data, data_dst))
         )
         return packetACKSD
     
-    def sendSDpacket(self, pk, interface='eth1'):
+    def sendSDpacket(self, pk, interface: str = None):
         """
-        Envía un paquete SOME/IP-SD por la interfaz de red especificada.
+        Envía un paquete SOME/IP-SD por la interfaz de red especificada, usando el
+        socket raw compartido de la interfaz.
 
         :param pk: Paquete Ethernet ya construido.
         :type pk: Ether
 
-        :param interface: Interfaz de red por la que se enviará el paquete.
+        :param interface: Interfaz de red por la que se enviará el paquete. Si es None
+            se usa la interfaz por defecto.
         :type interface: str
 
         :return: None
         """
-        sendp(x=pk, verbose=False, iface=interface)
+        get_transmitter(interface).send(pk)
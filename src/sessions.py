@@ -0,0 +1,118 @@
+import itertools
+from typing import Dict, Hashable, Optional, Tuple
+from sdCodec import SD_FLAG_REBOOT, SD_FLAG_UNICAST
+
+# Session ID máximo: tras 0xFFFF se vuelve a 1 (el 0 indica que no se usa Session ID)
+SESSION_ID_MAX = 0xFFFF
+
+
+class SessionCounter():
+    """
+    Contador de Session ID de un emisor: devuelve 1, 2, ..., 0xFFFF, 1, ... sin pasar
+    nunca por 0.
+
+    El incremento es un ``next`` sobre ``itertools.count``, que en CPython se ejecuta
+    de forma atómica con el GIL, por lo que varios hilos pueden pedir Session IDs del
+    mismo contador sin locks y sin repetir ninguno. El estado es del proceso: emisores
+    en procesos distintos deben usar claves (p. ej. Client IDs) distintas.
+    """
+    __slots__ = ("_count",)
+
+    def __init__(self):
+        self._count = itertools.count()
+
+    def next(self) -> int:
+        """
+        Devuelve el siguiente Session ID.
+        """
+        return next(self._count) % SESSION_ID_MAX + 1
+
+    def next_sd(self) -> Tuple[int, int]:
+        """
+        Devuelve el siguiente Session ID y el byte de flags de un mensaje SD: el flag
+        Reboot se mantiene hasta que el Session ID da la vuelta por primera vez.
+
+        :return: Session ID y flags SD (Reboot y Unicast).
+        :rtype: Tuple[int, int]
+        """
+        count = next(self._count)
+        flags = SD_FLAG_UNICAST | (SD_FLAG_REBOOT if count < SESSION_ID_MAX else 0)
+        return count % SESSION_ID_MAX + 1, flags
+
+
+class SessionManager():
+    """
+    Contadores de Session ID por clave, en lugar de un contador global por clase.
+
+    - Mensajes SOME/IP (eventos y peticiones): un contador por (Service ID,
+      Method ID, Client ID), ver :meth:`event_counter`.
+    - Mensajes SD: un contador por (IP del emisor, IP del destino), de modo que la
+      multicast y cada destino unicast tienen su propia secuencia y su flag Reboot,
+      ver :meth:`sd_counter`.
+
+    Los objetos de larga vida (plantillas, segmentadores, servidores) resuelven su
+    :class:`SessionCounter` una vez y después solo llaman a ``next``. Tanto el alta de
+    contadores como los incrementos son seguros entre hilos.
+    """
+
+    def __init__(self):
+        self._counters: Dict[Hashable, SessionCounter] = {}
+
+    def counter(self, key: Hashable) -> SessionCounter:
+        """
+        Devuelve el contador de una clave, creándolo si no existe.
+
+        :param key: Clave del emisor.
+        :type key: Hashable
+
+        :return: Contador de la clave.
+        :rtype: SessionCounter
+        """
+        counter = self._counters.get(key)
+        if counter is None:
+            # setdefault es atómico: si dos hilos crean el contador a la vez, ambos
+            # se quedan con el mismo
+            counter = self._counters.setdefault(key, SessionCounter())
+        return counter
+
+    def event_counter(self, srv_id: int, method_id: int, client_id: int) -> SessionCounter:
+        """
+        Devuelve el contador de los mensajes de un método con un Client ID.
+        """
+        return self.counter(("someip", srv_id, method_id, client_id))
+
+    def sd_counter(self, sender_ip: str, peer_ip: str) -> SessionCounter:
+        """
+        Devuelve el contador de los mensajes SD de un emisor hacia un destino (unicast o
+        la dirección multicast).
+        """
+        return self.counter(("sd", sender_ip, peer_ip))
+
+    def next(self, key: Hashable) -> int:
+        """
+        Devuelve el siguiente Session ID de una clave.
+        """
+        return self.counter(key).next()
+
+    def reset(self, key: Optional[Hashable] = None):
+        """
+        Reinicia un contador (o todos, con ``key`` None), como tras un reinicio de la
+        ECU: la secuencia vuelve a 1 y los mensajes SD vuelven a llevar el flag Reboot.
+        Los objetos que guardasen el contador anterior deben volver a pedirlo.
+        """
+        if key is None:
+            self._counters.clear()
+        else:
+            self._counters.pop(key, None)
+
+
+# Se crea al importar el módulo (no en la primera llamada) para que dos hilos no
+# puedan crear gestores distintos
+_manager = SessionManager()
+
+
+def get_session_manager() -> SessionManager:
+    """
+    Devuelve el gestor de Session IDs compartido por todo el proceso.
+    """
+    return _manager
@@ -1,16 +1,21 @@
-from scapy.all import *
 from parser import Parser
 from serviceDiscovery import someipSD
-import socket
-from scapy.contrib.automotive.someip import *
+from transmit import DEFAULT_INTERFACE
+from capture import SDCaptureSocket
+from sdCodec import ENTRY_SUBSCRIBE, iter_frame_sd_entries
+from logger import PacketDump, get_logger
+import logging, socket, time
+
+log = get_logger("socket")
 
 class socketHandler():
     """
     El objetivo de esta clase es proporcionar los métodos necesarios para abrir un socket
     en el puerto indicado por nuestra ECU simulada. Que recibirá en mensaje SOME/IP de tipo
     SubscribeEventGroup. Para ello hago bind sobre el puerto y escucho los paquetes que 
-    lleguen de la interfaz eth1 con unos parámetros determinados por un filtro. Esto introduce
-    una pequeña latencia por parte de la función sniff, que es considerada en la simulación.
+    lleguen de la interfaz eth1 con unos parámetros determinados por un filtro. El filtro
+    (VLAN, puerto SD y Message ID de SD) se compila a BPF y se ejecuta en el kernel, de
+    modo que solo las tramas candidatas llegan a Python.
     """
     def bind_udp_socket(self, ip, port):
         """
@@ -33,15 +38,16 @@ class socketHandler():
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.bind((ip, port))
         s.setblocking(False)
-        print(f"[INFO] Socket UDP escuchando en {ip}:{port}")
+        log.info("Socket UDP escuchando en %s:%d", ip, port)
         return s
 
     # Aqui el service id no esta bien
-    def escuchar_subscribe_eventgroup(self, ack, interface="eth1", timeout=5):
+    def escuchar_subscribe_eventgroup(self, ack, interface=DEFAULT_INTERFACE, timeout=5, vlan=None):
         """
         Escucha en la interfaz de red la llegada de un mensaje SOME/IP de tipo 
-        SubscribeEventGroup. Se utiliza un filtro en `sniff` para identificar 
-        y detener la captura cuando se detecta un paquete válido.
+        SubscribeEventGroup. La captura se hace sobre un socket con un filtro BPF
+        (ver :class:`capture.SDCaptureSocket`), por lo que solo se diseccionan las
+        tramas SD candidatas, y no se almacena ninguna trama capturada.
 
         Además, se envía de forma anticipada un mensaje ACK usando un paquete
         construido previamente, asumiendo que el cliente enviará una suscripción.
@@ -55,29 +61,47 @@ class socketHandler():
         :param timeout: Tiempo máximo de espera (en segundos) para la captura.
         :type timeout: int
 
+        :param vlan: VLAN en la que se espera la suscripción. None para no filtrar por VLAN.
+        :type vlan: int
+
         :return: Paquete SOME/IP recibido que cumple con las condiciones del filtro,
                 o `None` si no se detecta ninguno en el tiempo especificado.
         :rtype: scapy.packet.Packet | None
         """
-        print("[INFO] Esperando SubscribeEventGroup...")
+        log.info("Esperando SubscribeEventGroup...")
+        # Se abre la captura antes de enviar el ACK para no perder la suscripción
+        capture = SDCaptureSocket(interface, vlan)
         # Se envia el ACK de forma anticipada dando por hecho que habra subscribe por parte del cliente.
         # De no haberlo se producira un error, ya que no encontrará el mensaje con el type indicado ni 
         # el service id.
-        someipSD().sendSDpacket(ack)
+        someipSD().sendSDpacket(ack, interface)
 
-        def filtro(pkt):
-            if pkt.haslayer(SOMEIP):
-                someip = pkt.getlayer(SOMEIP)
-                if hasattr(someip, "entry_array"):
-                    for entry in someip.entry_array:
-                        if entry.type == 0x06:
-                            print("[OK] SubscribeEventGroup recibido:")
-                            print("[INFO] Enviando ACK...")
-                            print("[OK] ACK enviado.")
-                            # Muestra el paquete
-                            pkt.show()
-                            return True
+        def filtro(frame):
+            # Decodificación directa de la trama, sin diseccionar con Scapy
+            try:
+                for entry in iter_frame_sd_entries(frame):
+                    if entry.type == ENTRY_SUBSCRIBE:
+                        log.info("SubscribeEventGroup recibido, ACK enviado")
+                        return True
+            except ValueError:
+                pass
             return False
 
-        pkt = sniff(iface=interface, timeout=timeout, stop_filter=filtro, store=1)
-        return pkt[0] if pkt else None
\ No newline at end of file
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                frame = capture.recv(deadline - time.monotonic())
+                if frame is None:
+                    return None
+                if filtro(frame):
+                    # Solo se construye el paquete de Scapy para la trama aceptada. El
+                    # módulo SOME/IP de Scapy se carga aquí, cuando hay algo que diseccionar
+                    from scapy.layers.l2 import Ether
+                    import scapy.contrib.automotive.someip  # noqa: F401
+                    pkt = Ether(bytes(frame))
+                    # El volcado completo del paquete (y su copia) solo se genera en nivel DEBUG
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("SubscribeEventGroup:\n%s", PacketDump(pkt))
+                    return pkt
+        finally:
+            capture.close()
@@ -1,42 +1,68 @@
-from scapy.contrib.automotive.someip import *
-from scapy.all import Ether, Dot1Q, IP, sendp
-from typing import Any, Dict
+from scapy.layers.l2 import Ether, Dot1Q
+from scapy.layers.inet import IP, UDP
+from scapy.packet import Raw
+from typing import Any, Dict, List, Optional
+import time
 from parser import Parser
-import sys, os
-# Agrega el directorio raíz del proyecto al path para importar los plugins
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from plugins.VehicleDynamicsPlugin import VehicleDynamicsPlugin
+from packetTemplate import TemplateCache
+from transmit import get_transmitter
+from pluginRegistry import get_plugin_registry
+from sdCodec import EVENT_TIMESTAMP, EVENT_TIMESTAMP_LEN, TP_MAX_SEGMENT
+from someipTP import SegmentFrame, TPSegmenter
+from sessions import get_session_manager
+
+# Client ID de los eventos que envía la ECU simulada
+CLIENT_ID = 0x0701
 
 class Someip():
     """
-    Clase empleada para la creación y envío de paquetes SOME/IP estándar, utilizando
-    una estructura definida por el plugin `VehicleDynamicsPlugin` para las payload.
+    Clase empleada para la creación y envío de paquetes SOME/IP estándar. La payload
+    de cada método la genera el plugin asociado en services.json (ver
+    :class:`pluginRegistry.PluginRegistry`).
 
-    Esta clase gestiona el Session ID de forma incremental por instancia y permite
-    la construcción de paquetes con datos codificados en la payload para un servicio
-    SOME/IP simulado.
+    Permite la construcción de paquetes con datos codificados en la payload para un
+    servicio SOME/IP simulado. Cada paquete toma el siguiente Session ID del contador
+    de su método en el gestor compartido (ver :class:`sessions.SessionManager`), por
+    lo que un mismo objeto puede construir cualquier número de paquetes, también desde
+    varios hilos. Para enviar un mismo evento a varios suscriptores se pide el Session
+    ID una vez con :meth:`next_session_id` y se pasa a cada llamada.
 
-    :ivar some: Objeto SOMEIP configurado con cabecera y payload.
+    :ivar some: Objeto SOMEIP configurado con cabecera y payload. Solo se crea en
+        :meth:`craft_someip_pk`, para no cargar el módulo SOME/IP de Scapy en modo plantilla.
     :ivar myParser: Instancia del parser que obtiene la configuración del servicio.
     """
-    __session_id = 0
+    # Plantillas compartidas por todas las instancias para el modo plantilla
+    templates = TemplateCache()
+    # Segmentadores SOME/IP-TP por (datos de red, servicio, tamaño de segmento)
+    segmenters: Dict[tuple, TPSegmenter] = {}
 
     def __init__(self,):
+        self.some = None
+        self.myParser = Parser()
+        self.plugins = get_plugin_registry()
+        self.sessions = get_session_manager()
+
+    def next_session_id(self, service: int) -> int:
         """
-        Inicializa una nueva instancia de un paquete SOME/IP, incrementando
-        automáticamente el Session ID para asegurar unicidad en cada mensaje.
+        Devuelve el siguiente Session ID de los eventos de un método.
+
+        :param service: ID del servicio SOME/IP.
+        :type service: int
+
+        :return: Session ID.
+        :rtype: int
         """
-        self.some = SOMEIP()
-        self.myParser = Parser()
-        Someip.__session_id += 1
-        self.some.session_id = Someip.__session_id
+        data = self.myParser.get_service_data(service)
+        return self._next_session_id(data)
+
+    def _next_session_id(self, data: Dict[str, Any]) -> int:
+        return self.sessions.event_counter(data["SOMEIP"]["ServID"], data["SOMEIP"]["MethodID"], CLIENT_ID).next()
 
-    def craft_someip_pk(self, service: int, data_dst: Dict[str, Any]) -> Ether:
+    def craft_someip_pk(self, service: int, data_dst: Dict[str, Any], session_id: Optional[int] = None) -> Ether:
         """
         Construye un paquete SOME/IP con payload dada por el plugin.
 
-        El contenido de la carga útil es generado dinámicamente por el plugin
-        'VehicleDynamicsPlugin'.
+        El contenido de la carga útil lo genera dinámicamente el plugin del método.
 
         :param service: ID del servicio SOME/IP a simular.
         :type service: int
@@ -44,50 +70,142 @@ class Someip():
         :param data_dst: Diccionario con datos de red como MAC, IPs, puertos y VLAN.
         :type data_dst: Dict[str, Any]
 
-        :return: Paquete Ethernet completo con todas las capas (Ethernet, VLAN, IP, UDP, SOMEIP, Raw).
+        :param session_id: Session ID del evento. Si es None se toma el siguiente del método.
+        :type session_id: int
+
+        :return: Paquete Ethernet completo con todas las capas (Ethernet, VLAN, IP, UDP, SOMEIP y payload).
         :rtype: Ether
         """
+        from scapy.contrib.automotive.someip import SOMEIP
+
+        if self.some is None:
+            self.some = SOMEIP()
         data = self.myParser.get_service_data(service)
-        # Antes esto:
-        #payload = data["SOMEIP"]["Payload"]
-        #new = Someip()
-        # Creamos la instancia del servicio a simular con la payload
-        plugin = VehicleDynamicsPlugin()
-        payload = plugin.get_payload("VehicleSpeed")
-        # payload = struct.pack(
-        #     "<BfBBBfBB",  # estructura
-        #     1,            # vehicleSpeedValueState (VALID)
-        #     12.34,        # vehicleSpeed (float32)
-        #     1,            # vehicleSpeedSignValueState (VALID)
-        #     1,            # vehicleSpeedSign (FORWARD)
-        #     1,            # vehicleLowSpeedValueState (VALID)
-        #     0.12,         # vehicleLowSpeed (float32)
-        #     1,            # standStillSupposedValueState (VALID)
-        #     1             # standStillSupposed (STANDSTILL)
-        # )
-        self.some.srv_id = 568
-        self.some.sub_id = 32908
-        self.some.client_id = 0x0701
+        payload = self.plugins.bind(data).encode()
+        self.some.srv_id = data["SOMEIP"]["ServID"]
+        self.some.sub_id = data["SOMEIP"]["MethodID"]
+        self.some.client_id = CLIENT_ID
+        self.some.session_id = self._next_session_id(data) if session_id is None else session_id
         self.some.proto_ver = 0x01
         self.some.iface_ver = 0x01
         self.some.msg_type = 0x02
         self.some.retcode = 0x00
 
-        # Se añade la payload para que SOMEIP tenga su campo data correctamente rellenado
-        self.some.add_payload(payload)
-        #self.some.len = len(payload) + 8
-        
+        # La payload va una sola vez, como carga de la capa SOMEIP (que calcula su campo
+        # Length a partir de ella). Se sustituye la del paquete anterior de esta instancia
+        self.some.remove_payload()
+        self.some.add_payload(Raw(load=payload))
+
         pk = (
             Ether(src=data_dst["mac_address"], dst=data_dst["mac_dst"]) /
             Dot1Q(vlan=data_dst["vlan"], prio=5) /
             IP(src=data_dst["ip_src"], dst=data_dst["ip_dst"]) /
             UDP(sport=data_dst["someip_port_src"], dport=data_dst["someip_port_dst"]) /
-            self.some /
-            # Se fuerza a que realmente se envíe la carga útil
-            Raw(load=payload)
+            self.some
         )
         return pk
     
-    def send_someip(self, pk):
-        sendp(x=pk, verbose=False, iface='eth1')
+    def craft_someip_frame(
+        self,
+        service: int,
+        data_dst: Dict[str, Any],
+        timestamp: bool = False,
+        session_id: Optional[int] = None
+    ) -> memoryview:
+        """
+        Construye la trama de un evento SOME/IP en modo plantilla.
+
+        La trama completa se genera con Scapy una única vez por pareja de ECUs y servicio
+        (ver :class:`packetTemplate.EventTemplate`); en cada llamada solo se parchean el
+        Session ID, la payload (codificada por el plugin directamente sobre el buffer) y
+        el checksum UDP. Si no se indica ``session_id`` cada llamada consume un nuevo
+        Session ID del método, por lo que el objeto puede reutilizarse.
+
+        :param service: ID del servicio SOME/IP a simular.
+        :type service: int
+
+        :param data_dst: Diccionario con datos de red como MAC, IPs, puertos y VLAN.
+        :type data_dst: Dict[str, Any]
+
+        :param timestamp: Añadir tras la payload el timestamp de envío en nanosegundos
+            (``sdCodec.EVENT_TIMESTAMP``).
+        :type timestamp: bool
+
+        :param session_id: Session ID del evento. Si es None se toma el siguiente del método.
+        :type session_id: int
+
+        :return: Trama lista para enviar. Apunta al buffer de la plantilla, por lo que
+            debe enviarse antes de construir el siguiente evento del mismo servicio.
+        :rtype: memoryview
+        """
+        data = self.myParser.get_service_data(service)
+        encoder = self.plugins.bind(data)
+        template = Someip.templates.get(data_dst, data, encoder.size + (EVENT_TIMESTAMP_LEN if timestamp else 0))
+        # La payload se codifica directamente sobre el buffer de la plantilla
+        encoder.write(template.buffer, template.payload_offset)
+        if timestamp:
+            EVENT_TIMESTAMP.pack_into(template.buffer, template.payload_offset + encoder.size, time.time_ns())
+        if session_id is None:
+            session_id = self._next_session_id(data)
+        return template.finalize(session_id)
+
+    def craft_someip_tp_frames(
+        self,
+        service: int,
+        data_dst: Dict[str, Any],
+        timestamp: bool = False,
+        max_segment: int = TP_MAX_SEGMENT,
+        session_id: Optional[int] = None
+    ) -> List[SegmentFrame]:
+        """
+        Construye un evento cuya payload no cabe en un datagrama como segmentos
+        SOME/IP-TP (ver :class:`someipTP.TPSegmenter`).
+
+        La payload se codifica una vez sobre un buffer propio del mensaje y los segmentos
+        la referencian sin copiarla, por lo que pueden enviarse más tarde (p. ej.
+        espaciados con :class:`someipTP.TPPacer`) aunque se construyan otros eventos.
+
+        :param service: ID del servicio SOME/IP a simular.
+        :type service: int
+
+        :param data_dst: Diccionario con datos de red como MAC, IPs, puertos y VLAN.
+        :type data_dst: Dict[str, Any]
+
+        :param timestamp: Añadir tras la payload el timestamp de envío en nanosegundos.
+        :type timestamp: bool
+
+        :param max_segment: Longitud máxima de payload por segmento.
+        :type max_segment: int
+
+        :param session_id: Session ID del mensaje. Si es None se toma el siguiente del método.
+        :type session_id: int
+
+        :return: Segmentos ``(cabeceras, trozo de payload)`` en orden.
+        :rtype: List[Tuple[bytearray, memoryview]]
+        """
+        data = self.myParser.get_service_data(service)
+        encoder = self.plugins.bind(data)
+        key = (tuple(data_dst.values()), data["id"], max_segment)
+        segmenter = Someip.segmenters.get(key)
+        if segmenter is None:
+            segmenter = Someip.segmenters[key] = TPSegmenter(data_dst, data, max_segment, CLIENT_ID)
+        payload = bytearray(encoder.size + (EVENT_TIMESTAMP_LEN if timestamp else 0))
+        encoder.write(payload, 0)
+        if timestamp:
+            EVENT_TIMESTAMP.pack_into(payload, encoder.size, time.time_ns())
+        if session_id is None:
+            session_id = self._next_session_id(data)
+        return segmenter.segments(session_id, payload)
+
+    def send_someip(self, pk, interface: str = None):
+        """
+        Envía un evento SOME/IP por el socket raw compartido de la interfaz.
+
+        :param pk: Paquete de Scapy o trama ya serializada (modo plantilla).
+        :type pk: Ether | bytes | memoryview
+
+        :param interface: Interfaz de red. Si es None se usa la interfaz por defecto.
+        :type interface: str
+        """
+        get_transmitter(interface).send(pk)
 
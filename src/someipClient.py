@@ -0,0 +1,386 @@
+import select
+import socket
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from parser import Parser
+from capture import UDPCaptureSocket
+from someipTP import TPReassembler
+from sessions import get_session_manager
+from logger import get_logger
+from sdCodec import (
+    ENTRY_FIND_SERVICE, ENTRY_SUBSCRIBE, ENTRY_SUBSCRIBE_ACK, EVENT_TIMESTAMP, EVENT_TIMESTAMP_LEN,
+    INSTANCE_ID, MSG_NOTIFICATION, MSG_TP_FLAG, OPTION_IP4_ENDPOINT, SOMEIP_HEADER_LEN,
+    decode_someip_header, encode_eventgroup_entry, encode_ip4_option, encode_sd_message,
+    encode_service_entry, iter_sd_entries, udp_payload
+)
+
+log = get_logger("client")
+
+# TTL (segundos) de las suscripciones; se renuevan a mitad de TTL
+SUBSCRIBE_TTL = 3
+# Tamaño del buffer de recepción del socket de eventos
+RCVBUF_SIZE = 4 << 20
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class ServiceStats():
+    """
+    Estadísticas de recepción de los eventos de un servicio (un Message ID).
+
+    - Pérdidas: se deducen de los huecos en la secuencia de Session ID (que pasa de
+      0xFFFF a 1); los Session ID repetidos o que retroceden se cuentan aparte.
+    - Jitter: desviación del tiempo entre llegadas respecto al ``Cycle`` del método.
+    - Latencia: solo si los eventos llevan el timestamp de envío del servidor
+      (``--timestamps``); servidor y cliente deben compartir reloj (misma máquina o PTP).
+
+    :ivar msg_id: Message ID (Service ID y Method ID).
+    :ivar cycle: Periodo nominal en segundos, o None si no se conoce.
+    :ivar received: Eventos recibidos.
+    :ivar lost: Eventos perdidos según los Session ID.
+    :ivar reordered: Eventos duplicados o fuera de orden.
+    """
+    __slots__ = (
+        "msg_id", "cycle", "received", "bytes", "lost", "reordered", "first_ns", "last_ns",
+        "_last_session", "_interarrival", "_latency"
+    )
+
+    def __init__(self, msg_id: int, cycle: Optional[float] = None):
+        self.msg_id = msg_id
+        self.cycle = cycle
+        self.received = 0
+        self.bytes = 0
+        self.lost = 0
+        self.reordered = 0
+        self.first_ns = 0
+        self.last_ns = 0
+        self._last_session = 0
+        self._interarrival = array("d")
+        self._latency = array("d")
+
+    def record(self, session_id: int, length: int, recv_ns: int, sent_ns: Optional[int] = None):
+        """
+        Registra un evento recibido.
+
+        :param session_id: Session ID del evento (0 si el emisor no lo usa).
+        :type session_id: int
+
+        :param length: Longitud del mensaje SOME/IP.
+        :type length: int
+
+        :param recv_ns: Instante de recepción (``time.time_ns``).
+        :type recv_ns: int
+
+        :param sent_ns: Timestamp de envío embebido por el servidor, si lo hay.
+        :type sent_ns: int
+        """
+        if self.received:
+            self._interarrival.append((recv_ns - self.last_ns) * 1e-9)
+        else:
+            self.first_ns = recv_ns
+        self.received += 1
+        self.bytes += length
+        self.last_ns = recv_ns
+        if sent_ns is not None:
+            self._latency.append((recv_ns - sent_ns) * 1e-9)
+
+        last = self._last_session
+        if session_id and last:
+            gap = (session_id - last - 1) % 0xFFFF
+            if gap:
+                # Un hueco de más de media secuencia se interpreta como un retroceso
+                if gap < 0x8000:
+                    self.lost += gap
+                else:
+                    self.reordered += 1
+                    return
+        if session_id:
+            self._last_session = session_id
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Devuelve las estadísticas calculadas (tiempos en milisegundos).
+        """
+        span = (self.last_ns - self.first_ns) * 1e-9
+        interarrival = sorted(self._interarrival)
+        mean = sum(interarrival) / len(interarrival) if interarrival else 0.0
+        # Sin periodo nominal el jitter se mide respecto a la media
+        nominal = self.cycle or mean
+        deviation = sorted(abs(value - nominal) for value in interarrival)
+        latency = sorted(self._latency)
+        expected = self.received + self.lost
+        result = {
+            "msg_id": f"0x{self.msg_id:08X}",
+            "received": self.received,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "loss_pct": 100.0 * self.lost / expected if expected else 0.0,
+            "events_per_s": (self.received - 1) / span if span > 0 else 0.0,
+            "bytes_per_s": self.bytes / span if span > 0 else 0.0,
+            "interarrival_mean_ms": mean * 1000,
+            "jitter_p50_ms": _percentile(deviation, 0.50) * 1000,
+            "jitter_p99_ms": _percentile(deviation, 0.99) * 1000,
+            "jitter_max_ms": deviation[-1] * 1000 if deviation else 0.0,
+        }
+        if latency:
+            result.update({
+                "latency_p50_ms": _percentile(latency, 0.50) * 1000,
+                "latency_p99_ms": _percentile(latency, 0.99) * 1000,
+                "latency_max_ms": latency[-1] * 1000,
+            })
+        return result
+
+
+class SomeipClient():
+    """
+    Cliente (consumidor) SOME/IP para comprobar que los eventos llegan a tiempo.
+
+    Toma el papel de la ECU destino del par ``(origen, destino)``, con los mismos datos
+    de red que usa el servidor (``Parser.ecu1_to_ecu2``): envía FindService y
+    SubscribeEventgroup por unicast al socket SD del servidor, renueva las
+    suscripciones a mitad de TTL y recibe los eventos drenando en lotes, sin bloquear,
+    un socket UDP con buffer de recepción grande (o, con ``capture_interface``, un
+    socket de captura con filtro BPF, útil en loopback o veth cuando la IP de la ECU
+    destino no está configurada en la máquina). Al terminar envía StopSubscribe.
+
+    :ivar data_dst: Datos de red entre la ECU servidora y la cliente.
+    :ivar stats: Estadísticas por Message ID.
+    :ivar acks: SubscribeEventgroupAck recibidos.
+    :ivar nacks: SubscribeEventgroupNack recibidos.
+    :ivar reassembler: Reensamblador de los eventos segmentados con SOME/IP-TP.
+    """
+
+    def __init__(
+        self,
+        origen: str,
+        destino: str,
+        service_ids: Iterable[int],
+        server_ip: Optional[str] = None,
+        bind_ip: Optional[str] = None,
+        endpoint_ip: Optional[str] = None,
+        capture_interface: Optional[str] = None,
+        timestamps: bool = False,
+        ttl: int = SUBSCRIBE_TTL
+    ):
+        """
+        :param origen: ECU que ofrece los servicios (la simulada por el servidor).
+        :type origen: str
+
+        :param destino: ECU cliente, cuyo papel toma este cliente.
+        :type destino: str
+
+        :param service_ids: IDs de los métodos a los que suscribirse.
+        :type service_ids: Iterable[int]
+
+        :param server_ip: IP del socket SD del servidor. Por defecto la de ``origen``.
+        :type server_ip: str
+
+        :param bind_ip: IP local de los sockets. Por defecto todas ("0.0.0.0").
+        :type bind_ip: str
+
+        :param endpoint_ip: IP anunciada en el Subscribe para recibir los eventos. Por
+            defecto la de ``destino``.
+        :type endpoint_ip: str
+
+        :param capture_interface: Si se indica, los eventos se capturan en esta interfaz
+            en lugar de recibirse por el socket UDP.
+        :type capture_interface: str
+
+        :param timestamps: Leer el timestamp de envío al final de cada evento.
+        :type timestamps: bool
+
+        :param ttl: TTL de las suscripciones en segundos.
+        :type ttl: int
+        """
+        self.myParser = Parser()
+        self.data_dst = self.myParser.ecu1_to_ecu2(origen, destino)
+        if self.data_dst is None:
+            raise ValueError(f"ECUs no encontradas: {origen} -> {destino}")
+        self.server = (server_ip or self.data_dst["ip_src"], self.data_dst["udp_dst"])
+        self.bind_ip = bind_ip or "0.0.0.0"
+        self.endpoint = (endpoint_ip or self.data_dst["ip_dst"], self.data_dst["someip_port_dst"])
+        self.capture_interface = capture_interface
+        self.timestamps = timestamps
+        self.ttl = ttl
+        self.acks = 0
+        self.nacks = 0
+
+        self.stats: Dict[int, ServiceStats] = {}
+        self._subscribe_entries: List[Tuple[int, int, int]] = []
+        self._find_entries: List[bytes] = []
+        for service_id in service_ids:
+            data = self.myParser.get_service_data(service_id)
+            if data is None:
+                raise ValueError(f"Servicio {service_id} no definido en services.json")
+            if data["SUBSCRIBE"]["EvengroupID"] is None:
+                raise ValueError(f"El método {service_id} no pertenece a ningún eventgroup (falta SUBSCRIBE)")
+            someip = data["SOMEIP"]
+            msg_id = (someip["ServID"] << 16) | someip["MethodID"]
+            self.stats[msg_id] = ServiceStats(msg_id, someip.get("Cycle"))
+            major = int(data["OFFER"]["Major_Version"], 16)
+            self._find_entries.append(encode_service_entry(
+                ENTRY_FIND_SERVICE, someip["ServID"], 0xFFFF, 0xFF, ttl, 0xFFFFFFFF
+            ))
+            self._subscribe_entries.append((
+                someip["ServID"], major, int(data["SUBSCRIBE"]["EvengroupID"], 16)
+            ))
+        # Session ID y flag Reboot de los mensajes SD hacia el servidor
+        self._sd_sessions = get_session_manager().sd_counter(self.endpoint[0], self.server[0])
+        # Reensamblado de los eventos segmentados con SOME/IP-TP
+        self.reassembler = TPReassembler()
+        self.sd_sock: Optional[socket.socket] = None
+        self.rx = None
+
+    def _send_sd(self, entries: List[bytes], options: Iterable[bytes] = ()):
+        session_id, flags = self._sd_sessions.next_sd()
+        self.sd_sock.sendto(encode_sd_message(session_id, entries, options, flags), self.server)
+
+    def find(self):
+        """
+        Envía un FindService por cada servicio.
+        """
+        self._send_sd(self._find_entries)
+
+    def subscribe(self, ttl: Optional[int] = None):
+        """
+        Envía (o renueva) las suscripciones de todos los eventgroups, anunciando el
+        endpoint UDP en el que se reciben los eventos. Con ``ttl`` 0 es un StopSubscribe.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        option = encode_ip4_option(OPTION_IP4_ENDPOINT, self.endpoint[0], socket.IPPROTO_UDP, self.endpoint[1])
+        entries = [
+            encode_eventgroup_entry(ENTRY_SUBSCRIBE, srv_id, INSTANCE_ID, major, ttl, eventgroup, n_opt_1=1)
+            for srv_id, major, eventgroup in self._subscribe_entries
+        ]
+        self._send_sd(entries, [option])
+
+    def open(self):
+        """
+        Abre el socket SD y el receptor de eventos.
+        """
+        self.sd_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sd_sock.bind((self.bind_ip, 0))
+        self.sd_sock.setblocking(False)
+        if self.capture_interface:
+            self.rx = UDPCaptureSocket(self.capture_interface, port=self.endpoint[1])
+        else:
+            self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.rx.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+            self.rx.bind((self.bind_ip, self.endpoint[1]))
+            self.rx.setblocking(False)
+        log.info("Cliente escuchando eventos en %s:%d (%s)", self.bind_ip, self.endpoint[1],
+                 f"captura en {self.capture_interface}" if self.capture_interface else "UDP")
+
+    def close(self):
+        if self.sd_sock is not None:
+            self.sd_sock.close()
+            self.sd_sock = None
+        if self.rx is not None:
+            self.rx.close()
+            self.rx = None
+
+    def _drain_sd(self):
+        while True:
+            try:
+                data = self.sd_sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                for entry in iter_sd_entries(data):
+                    if entry.type == ENTRY_SUBSCRIBE_ACK:
+                        if entry.ttl:
+                            self.acks += 1
+                        else:
+                            self.nacks += 1
+                            log.warning("SubscribeEventgroupNack del servicio 0x%04X, eventgroup %d",
+                                        entry.srv_id, entry.eventgroup_id)
+            except ValueError:
+                log.warning("Mensaje SD mal formado recibido del servidor")
+
+    def _record(self, message: memoryview, recv_ns: int):
+        if len(message) < SOMEIP_HEADER_LEN:
+            return
+        header = decode_someip_header(message)
+        stats = self.stats.get(header.msg_id)
+        if stats is None:
+            return
+        if header.msg_type == MSG_NOTIFICATION | MSG_TP_FLAG:
+            # Evento segmentado: se mide cuando llega su último segmento
+            try:
+                reassembled = self.reassembler.feed(message)
+            except ValueError:
+                return
+            if reassembled is None:
+                return
+            header, payload = reassembled
+        elif header.msg_type == MSG_NOTIFICATION:
+            payload = message[SOMEIP_HEADER_LEN:8 + header.length]
+        else:
+            return
+        sent_ns = None
+        if self.timestamps and len(payload) >= EVENT_TIMESTAMP_LEN:
+            sent_ns = EVENT_TIMESTAMP.unpack_from(payload, len(payload) - EVENT_TIMESTAMP_LEN)[0]
+        stats.record(header.session_id, SOMEIP_HEADER_LEN + len(payload), recv_ns, sent_ns)
+
+    def _drain_events(self, buffer: bytearray, view: memoryview):
+        clock = time.time_ns
+        if self.capture_interface:
+            while True:
+                frame = self.rx.recv_nowait()
+                if frame is None:
+                    return
+                recv_ns = clock()
+                payload = udp_payload(frame)
+                if payload is not None:
+                    self._record(payload, recv_ns)
+        recv_into = self.rx.recv_into
+        while True:
+            try:
+                n = recv_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._record(view[:n], clock())
+
+    def run(self, duration: float) -> Dict[int, Dict[str, Any]]:
+        """
+        Se suscribe, recibe eventos durante ``duration`` segundos y cancela las
+        suscripciones.
+
+        :param duration: Duración de la medida en segundos.
+        :type duration: float
+
+        :return: Estadísticas por Message ID (ver :meth:`ServiceStats.summary`).
+        :rtype: Dict[int, Dict[str, Any]]
+        """
+        self.open()
+        buffer = bytearray(65535)
+        view = memoryview(buffer)
+        try:
+            self.find()
+            self.subscribe()
+            renew_every = max(self.ttl / 2, 0.1)
+            now = time.monotonic()
+            end = now + duration
+            next_renew = now + renew_every
+            while now < end:
+                timeout = min(end, next_renew) - now
+                readable, _, _ = select.select([self.sd_sock, self.rx], [], [], max(timeout, 0))
+                if self.rx in readable:
+                    self._drain_events(buffer, view)
+                if self.sd_sock in readable:
+                    self._drain_sd()
+                now = time.monotonic()
+                if now >= next_renew:
+                    self.subscribe()
+                    next_renew += renew_every
+            self.subscribe(ttl=0)
+        finally:
+            self.close()
+        return {msg_id: stats.summary() for msg_id, stats in self.stats.items()}
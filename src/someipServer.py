@@ -0,0 +1,485 @@
+import asyncio
+import socket
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+from parser import Parser
+from serviceDiscovery import someipSD
+from someip import Someip
+from socketUDP import socketHandler
+from methodServer import MethodServer
+from someipTP import TP_SEPARATION, TPPacer
+from sessions import get_session_manager
+from sdPhases import CYCLIC_OFFER_DELAY, OFFER_TTL, OfferPhaseEngine, offer_timing
+from scheduler import CyclicScheduler, CyclicTask
+from transmit import get_transmitter
+from pluginRegistry import get_plugin_registry
+from metrics import (
+    MISSED_DEADLINES, SD_ACKS, SD_OFFERS, SUBSCRIBES, TX_ERRORS,
+    SentFramesCounter, observe_lateness
+)
+from sdCodec import (
+    ENTRY_SUBSCRIBE, ENTRY_SUBSCRIBE_ACK, EVENT_TIMESTAMP_LEN, INSTANCE_ID, OPTION_IP4_ENDPOINT,
+    OPTION_IP4_MULTICAST, TP_MAX_SEGMENT, SDEntry, encode_eventgroup_entry, encode_ip4_option, encode_sd_message, iter_sd_entries,
+    pack_sd_entries
+)
+from subscriptions import EventgroupKey, SubscriberEndpoint, SubscriptionKey, SubscriptionTable
+from logger import get_logger
+
+log = get_logger("server")
+# Mensajes por paquete (OFFER, suscripciones, deadlines), con limitación de tasa
+packet_log = get_logger("packet")
+
+
+class AsyncSomeipServer():
+    """
+    Núcleo del servidor SOME/IP basado en asyncio.
+
+    Todas las actividades del servidor se ejecutan como tareas concurrentes de un
+    único bucle de eventos, sin hilos por servicio:
+
+    - Ciclo de vida SD de los servicios ofrecidos con :class:`OfferPhaseEngine`:
+      espera inicial aleatoria, fase de repetición (``Rep_Phase_Time`` y
+      ``Rep_Phase_Cycle``), OFFER cíclicos cada ``offer_cycle`` segundos con TTL
+      ``offer_ttl`` y StopOffer al parar. Los OFFER de los servicios que comparten
+      temporización se agregan en los mismos mensajes SD.
+    - Recepción de datagramas en el socket UDP de la ECU simulada (el mismo que se
+      abre con ``socketHandler.bind_udp_socket``), que se drena de forma no bloqueante
+      cada vez que el bucle indica que es legible.
+    - Gestión de las suscripciones en una :class:`SubscriptionTable`: cada
+      SubscribeEventgroup se responde con su ACK (o NACK si el eventgroup no se
+      ofrece) y mantiene viva la suscripción de ese suscriptor durante su TTL.
+    - Envío de eventos cíclicos mediante :class:`CyclicScheduler` a todos los
+      suscriptores vivos del eventgroup. Un método solo se planifica mientras su
+      eventgroup tenga al menos un suscriptor.
+    - Métodos REQUEST/REQUEST_NO_RETURN opcionales (``method_ids``), atendidos por un
+      :class:`MethodServer` en el endpoint UDP que anuncian los OFFER.
+    - Entrega multicast opcional: con ``multicast_threshold`` los ACK anuncian el
+      endpoint multicast de la ECU simulada y, cuando un eventgroup alcanza ese número
+      de suscriptores, cada evento se envía una sola vez a la dirección multicast en
+      lugar de una copia unicast por suscriptor.
+    - Eventos grandes: si la payload de un método no cabe en un segmento
+      (``TP_MAX_SEGMENT``), cada evento se envía segmentado con SOME/IP-TP y sus
+      segmentos se espacian ``tp_separation`` segundos con :class:`TPPacer`.
+
+    :ivar data_dst: Datos de red entre la ECU simulada y la ECU destino.
+    :ivar service_ids: IDs de los métodos ofrecidos.
+    :ivar multicast_data: Datos de red de los eventos multicast, o None si no se usa multicast.
+    """
+
+    def __init__(
+        self,
+        origen: str,
+        destino: str,
+        service_ids: Iterable[int],
+        offer_cycle: float = CYCLIC_OFFER_DELAY,
+        offer_ttl: int = OFFER_TTL,
+        use_templates: bool = True,
+        multicast_threshold: Optional[int] = None,
+        timestamp_events: bool = False,
+        method_ids: Iterable[int] = (),
+        tp_separation: float = TP_SEPARATION
+    ):
+        """
+        :param origen: ECU simulada.
+        :type origen: str
+
+        :param destino: ECU real (cliente de los servicios).
+        :type destino: str
+
+        :param service_ids: IDs de los métodos a ofrecer.
+        :type service_ids: Iterable[int]
+
+        :param offer_cycle: Periodo en segundos entre OFFER en la fase principal.
+        :type offer_cycle: float
+
+        :param offer_ttl: TTL en segundos de las entradas OfferService.
+        :type offer_ttl: int
+
+        :param use_templates: Construir los eventos en modo plantilla.
+        :type use_templates: bool
+
+        :param multicast_threshold: Número de suscriptores de un eventgroup a partir del
+            cual sus eventos se envían por multicast. None para enviar siempre unicast.
+        :type multicast_threshold: int
+
+        :param timestamp_events: Añadir al final de cada evento su timestamp de envío
+            (ver ``sdCodec.EVENT_TIMESTAMP``) para que un cliente mida la latencia.
+            Solo en modo plantilla.
+        :type timestamp_events: bool
+
+        :param method_ids: IDs de los métodos REQUEST/REQUEST_NO_RETURN a atender.
+        :type method_ids: Iterable[int]
+
+        :param tp_separation: Segundos entre grupos de segmentos SOME/IP-TP de un mismo
+            evento y suscriptor.
+        :type tp_separation: float
+
+        :raises ValueError: Si un método de ``service_ids`` no existe o no pertenece a
+            ningún eventgroup (no tiene bloque SUBSCRIBE).
+        """
+        self.origen = origen
+        self.destino = destino
+        self.service_ids = list(service_ids)
+        self.offer_cycle = offer_cycle
+        self.offer_ttl = offer_ttl
+        self.use_templates = use_templates
+        self.timestamp_events = timestamp_events
+
+        self.myParser = Parser()
+        self.data_dst = self.myParser.ecu1_to_ecu2(origen, destino)
+        self.tx = get_transmitter(self.data_dst["interface"])
+        self.some = Someip()
+
+        # Eventgroup de cada método ofrecido y métodos de cada eventgroup
+        self._eventgroup_of: Dict[int, EventgroupKey] = {}
+        self._methods_by_group: Dict[EventgroupKey, List[int]] = {}
+        # Métodos cuyos eventos se envían segmentados con SOME/IP-TP
+        self._segmented = set()
+        for service_id in self.service_ids:
+            data = self.myParser.get_service_data(service_id)
+            if data is None:
+                raise ValueError(f"Método {service_id} no definido en services.json")
+            eventgroup_id = data["SUBSCRIBE"]["EvengroupID"]
+            if eventgroup_id is None:
+                raise ValueError(f"El método {service_id} no pertenece a ningún eventgroup (falta SUBSCRIBE)")
+            group = (data["SOMEIP"]["ServID"], INSTANCE_ID, int(eventgroup_id, 16))
+            self._eventgroup_of[service_id] = group
+            self._methods_by_group.setdefault(group, []).append(service_id)
+            # El plugin del método se carga al ofrecer el servicio, no en el primer evento
+            encoder = get_plugin_registry().bind(data)
+            if encoder.size + (EVENT_TIMESTAMP_LEN if timestamp_events else 0) > TP_MAX_SEGMENT:
+                self._segmented.add(service_id)
+        self.subscriptions = SubscriptionTable(on_expired=self._on_subscription_expired)
+        # Datos de red de cada suscriptor, derivados de data_dst
+        self._subscriber_data: Dict[SubscriberEndpoint, Mapping[str, Any]] = {}
+        self.sessions = get_session_manager()
+        # ACK pendientes de envío por emisor de la suscripción
+        self._pending_acks: Dict[Tuple[str, int], List[Tuple[bytes, Tuple[bytes, ...]]]] = {}
+
+        method_ids = list(method_ids)
+        self.methods = MethodServer(method_ids) if method_ids else None
+        # Un OFFER por Service ID, tanto de los eventos como de los métodos
+        self._offered: List[int] = []
+        offered_services = set()
+        for method_id in [*self.service_ids, *method_ids]:
+            srv_id = self.myParser.get_service_data(method_id)["SOMEIP"]["ServID"]
+            if srv_id not in offered_services:
+                offered_services.add(srv_id)
+                self._offered.append(method_id)
+
+        self.multicast_threshold = multicast_threshold
+        self.multicast_data: Optional[Mapping[str, Any]] = None
+        self._multicast_option = b""
+        if multicast_threshold is not None:
+            self._setup_multicast()
+
+        # Eventos enviados por servicio: se cuentan después de enviar cada lote
+        self._frames_sent = SentFramesCounter()
+        self.scheduler = CyclicScheduler(
+            flush=self._frames_sent.wrap(self.tx.send_batch), on_missed=self._on_missed_deadline, on_run=self._on_run
+        )
+        self.tp = TPPacer(
+            self.scheduler, tp_separation, on_frames=lambda key, n: self._frames_sent.add(key[0], n)
+        )
+        self.sd = someipSD()
+        self.offers = OfferPhaseEngine(self.scheduler, self._offer_frames, offer_cycle, offer_ttl)
+        # Contadores por servicio, resueltos una vez para no buscarlos en cada ciclo
+        self._missed = {service_id: MISSED_DEADLINES.labels(service_id) for service_id in self.service_ids}
+        self.udp_sock = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._running = False
+
+    def _setup_multicast(self):
+        """
+        Prepara los datos de red de los eventos multicast y la opción SD que los
+        anuncia en los ACK, a partir de los datos multicast de la ECU simulada.
+        """
+        try:
+            mc = self.myParser.multicast(self.origen)
+        except KeyError as e:
+            mc = None
+            log.warning("La ECU %s no define el dato multicast %s", self.origen, e)
+        if mc is None:
+            log.warning("Multicast deshabilitado: se enviarán los eventos por unicast")
+            self.multicast_threshold = None
+            return
+        data = dict(self.data_dst)
+        data["mac_dst"] = mc["MAC_1500_MULTICAST"]
+        data["ip_dst"] = mc["IP_1500_MULTICAST"]
+        data["someip_port_dst"] = self.myParser.registry.ecu(self.origen).get(
+            "option_sdport_dst", self.data_dst["someip_port_dst"]
+        )
+        self.multicast_data = MappingProxyType(data)
+        self._multicast_option = encode_ip4_option(
+            OPTION_IP4_MULTICAST, data["ip_dst"], int(mc["option_sdprot"], 16), data["someip_port_dst"]
+        )
+
+    async def serve(self, duration: Optional[float] = None):
+        """
+        Ejecuta el servidor hasta que se llame a :meth:`stop` o transcurra ``duration``.
+
+        :param duration: Duración máxima en segundos. None para ejecutar indefinidamente.
+        :type duration: float
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._running = True
+
+        self.udp_sock = socketHandler().bind_udp_socket(self.data_dst["ip_src"], self.data_dst["udp_dst"])
+        self._loop.add_reader(self.udp_sock.fileno(), self._on_readable)
+        if self.methods is not None:
+            # Las peticiones llegan al endpoint que anuncian los OFFER
+            self.methods.open(self.data_dst["ip_src"], self.data_dst["someip_port_src"])
+            self._loop.add_reader(self.methods.fileno(), self.methods.on_readable)
+
+        self.offers.offer({
+            method_id: offer_timing(self.myParser.get_service_data(method_id)) for method_id in self._offered
+        })
+        tasks = [
+            asyncio.create_task(self.scheduler.run_async(lambda: self._running)),
+        ]
+        stop_waiter = asyncio.create_task(self._stop_event.wait())
+        try:
+            done, _ = await asyncio.wait(
+                [stop_waiter, *tasks], timeout=duration, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            self._running = False
+            for task in [stop_waiter, *tasks]:
+                task.cancel()
+            await asyncio.gather(stop_waiter, *tasks, return_exceptions=True)
+            self._stop_offers()
+            self._loop.remove_reader(self.udp_sock.fileno())
+            self.udp_sock.close()
+            self.udp_sock = None
+            if self.methods is not None:
+                self._loop.remove_reader(self.methods.fileno())
+                self.methods.close()
+
+        # Si alguna tarea ha terminado por un error se propaga al llamante
+        for task in done:
+            if task is not stop_waiter and task.exception() is not None:
+                raise task.exception()
+
+    def stop(self):
+        """
+        Solicita la parada del servidor. Puede llamarse desde cualquier hilo.
+        """
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def _offer_frames(self, services: List[int], ttl: int) -> List[Any]:
+        """
+        Construye los OFFER (StopOffer con ``ttl`` 0) de unos servicios, agrupados en el
+        menor número de mensajes SD que caben en la MTU. Es el ``build`` de
+        :class:`OfferPhaseEngine`: las tramas se envían en el lote del planificador.
+        """
+        packet_log.debug("Enviando %s de los servicios %s", "OFFER" if ttl else "StopOffer", services)
+        packets = self.sd.craft_offer_packets(self.origen, services, ttl)
+        SD_OFFERS.inc(len(packets))
+        return packets
+
+    def _stop_offers(self):
+        """
+        Envía el StopOffer de los servicios ya anunciados.
+        """
+        for packet in self.offers.stop_offer():
+            try:
+                self.tx.send(packet)
+            except OSError as e:
+                TX_ERRORS.labels("sd").inc()
+                log.error("No se ha podido enviar el StopOffer: %s", e)
+
+    def _on_readable(self):
+        """
+        Drena todos los datagramas pendientes del socket UDP sin bloquear y después
+        envía los ACK acumulados, agrupados por suscriptor.
+        """
+        try:
+            while True:
+                try:
+                    data, addr = self.udp_sock.recvfrom(65535)
+                except (BlockingIOError, InterruptedError):
+                    return
+                self._handle_sd(data, addr)
+        finally:
+            self._flush_acks()
+
+    def handle_datagram(self, data: bytes, addr: Tuple[str, int]):
+        """
+        Procesa un datagrama SOME/IP recibido. Por ahora solo se atienden los
+        mensajes SD de tipo SubscribeEventgroup (incluido StopSubscribe, con TTL 0).
+
+        :param data: Contenido UDP del datagrama.
+        :type data: bytes
+
+        :param addr: Dirección (IP, puerto) del emisor.
+        :type addr: Tuple[str, int]
+        """
+        self._handle_sd(data, addr)
+        self._flush_acks()
+
+    def _handle_sd(self, data: bytes, addr: Tuple[str, int]):
+        try:
+            for entry in iter_sd_entries(data):
+                if entry.type == ENTRY_SUBSCRIBE:
+                    self._on_subscribe(entry, addr)
+        except ValueError:
+            packet_log.warning("Mensaje SD mal formado recibido de %s:%d", addr[0], addr[1])
+
+    def _on_subscribe(self, entry: SDEntry, addr: Tuple[str, int]):
+        """
+        Da de alta, renueva o cancela la suscripción de un suscriptor y responde con
+        el ACK (o NACK si el eventgroup no se ofrece).
+        """
+        SUBSCRIBES.inc()
+        group = (entry.srv_id, entry.inst_id, entry.eventgroup_id)
+        if group not in self._methods_by_group:
+            if entry.ttl:
+                self._send_subscribe_ack(entry, addr, ttl=0)
+            return
+
+        # Los eventos se envían al endpoint unicast que indique el Subscribe; si no
+        # incluye ninguno, al emisor en el puerto SOME/IP configurado
+        endpoint = (addr[0], self.data_dst["someip_port_dst"])
+        for option in entry.options:
+            if option.option_type == OPTION_IP4_ENDPOINT and option.l4_proto == socket.IPPROTO_UDP:
+                endpoint = (option.addr, option.port)
+                break
+
+        if entry.ttl == 0:
+            if self.subscriptions.unsubscribe(*group, endpoint):
+                packet_log.info("StopSubscribe de %s:%d", *endpoint)
+                self._stop_group_if_idle(group, endpoint)
+            return
+
+        first = self.subscriptions.count(*group) == 0
+        if self.subscriptions.subscribe(*group, endpoint, entry.ttl):
+            packet_log.info("SubscribeEventGroup recibido de %s:%d", *endpoint)
+        self._send_subscribe_ack(entry, addr, ttl=entry.ttl)
+        if first:
+            for service_id in self._methods_by_group[group]:
+                cycle = self.myParser.get_service_data(service_id)["SOMEIP"]["Cycle"]
+                self.scheduler.add(service_id, cycle, self._cyclic_event)
+
+    def _send_subscribe_ack(self, entry: SDEntry, addr: Tuple[str, int], ttl: int):
+        """
+        Deja pendiente de envío el SubscribeEventgroupAck (NACK si ``ttl`` es 0) de una
+        entrada Subscribe. Los ACK de un mismo emisor se envían juntos en
+        :meth:`_flush_acks`.
+        """
+        # Con multicast habilitado el ACK anuncia el endpoint multicast desde la primera
+        # suscripción, para que el cliente ya escuche en él cuando se supere el umbral
+        options = (self._multicast_option,) if ttl and self._multicast_option else ()
+        self._pending_acks.setdefault(addr, []).append((
+            encode_eventgroup_entry(
+                ENTRY_SUBSCRIBE_ACK, entry.srv_id, entry.inst_id, entry.major_ver, ttl,
+                entry.eventgroup_id, counter=entry.counter
+            ),
+            options
+        ))
+
+    def _flush_acks(self):
+        """
+        Envía los ACK pendientes: los de cada emisor se agrupan en el menor número de
+        mensajes SD que caben en la MTU, con la opción multicast compartida.
+        """
+        pending, self._pending_acks = self._pending_acks, {}
+        for addr, acks in pending.items():
+            # Cada suscriptor tiene su propia secuencia de Session ID y flag Reboot
+            sessions = self.sessions.sd_counter(self.data_dst["ip_src"], addr[0])
+            for entries, options in pack_sd_entries(acks):
+                session_id, flags = sessions.next_sd()
+                try:
+                    self.udp_sock.sendto(encode_sd_message(session_id, entries, options, flags), addr)
+                except OSError as e:
+                    TX_ERRORS.labels("sd").inc()
+                    log.error("No se ha podido enviar el ACK a %s:%d: %s", addr[0], addr[1], e)
+                    continue
+                for entry in entries:
+                    # El TTL ocupa los 3 últimos bytes del tercer campo de 32 bits
+                    SD_ACKS.labels("ack" if entry[9:12] != b"\0\0\0" else "nack").inc()
+
+    def _on_subscription_expired(self, key: SubscriptionKey):
+        srv_id, inst_id, eventgroup_id, endpoint = key
+        packet_log.info("Suscripción de %s:%d caducada", *endpoint)
+        self._stop_group_if_idle((srv_id, inst_id, eventgroup_id), endpoint)
+
+    def _stop_group_if_idle(self, group: EventgroupKey, endpoint: SubscriberEndpoint):
+        """
+        Descarta los segmentos SOME/IP-TP pendientes hacia un suscriptor que se ha ido y
+        deja de planificar los métodos de un eventgroup sin suscriptores.
+        """
+        idle = self.subscriptions.count(*group) == 0
+        for service_id in self._methods_by_group[group]:
+            self.tp.cancel((service_id, endpoint))
+            if idle:
+                # Flujo multicast, si lo hubiera
+                self.tp.cancel((service_id, None))
+                self.scheduler.remove(service_id)
+
+    def _data_for(self, endpoint: Optional[SubscriberEndpoint]) -> Mapping[str, Any]:
+        """
+        Devuelve los datos de red para enviar eventos a un suscriptor: los de
+        ``data_dst`` con la IP, el puerto y, si es una ECU conocida, la MAC del suscriptor.
+        Con ``endpoint`` None devuelve los datos multicast.
+        """
+        if endpoint is None:
+            return self.multicast_data
+        data = self._subscriber_data.get(endpoint)
+        if data is None:
+            data = dict(self.data_dst)
+            data["ip_dst"], data["someip_port_dst"] = endpoint
+            ecu = self.myParser.registry.ecu_by_ip(endpoint[0])
+            if ecu is not None:
+                data["mac_dst"] = ecu["mac_address"]
+            data = self._subscriber_data[endpoint] = MappingProxyType(data)
+        return data
+
+    def _cyclic_event(self, task: CyclicTask) -> Optional[List[bytes]]:
+        """
+        Construye el evento de un método para cada suscriptor vivo de su eventgroup, o
+        un único evento multicast si el eventgroup alcanza ``multicast_threshold``.
+        """
+        self.subscriptions.expire()
+        subscribers = self.subscriptions.subscribers(*self._eventgroup_of[task.key])
+        if not subscribers:
+            return None
+        if self.multicast_data is not None and len(subscribers) >= self.multicast_threshold:
+            subscribers = (None,)
+        # Todos los suscriptores reciben el mismo evento, con el mismo Session ID: si
+        # cada uno consumiese el suyo, todos verían huecos en la secuencia
+        session_id = self.some.next_session_id(task.key)
+        if task.key in self._segmented:
+            for ep in subscribers:
+                self.tp.submit(
+                    (task.key, ep),
+                    self.some.craft_someip_tp_frames(
+                        task.key, self._data_for(ep), self.timestamp_events, session_id=session_id
+                    )
+                )
+            return None
+        # Los segmentos SOME/IP-TP los anota el TPPacer cuando los entrega
+        self._frames_sent.add(task.key, len(subscribers))
+        if self.use_templates:
+            return [
+                bytes(self.some.craft_someip_frame(task.key, self._data_for(ep), self.timestamp_events, session_id))
+                for ep in subscribers
+            ]
+        return [bytes(self.some.craft_someip_pk(task.key, self._data_for(ep), session_id)) for ep in subscribers]
+
+    def _on_run(self, task: CyclicTask, lateness: float):
+        # El jitter solo se mide en los eventos cíclicos, no en el espaciado de segmentos
+        # ni en las fases de los OFFER
+        if task.key in self._missed:
+            observe_lateness(task, lateness)
+
+    def _on_missed_deadline(self, task: CyclicTask, lateness: float):
+        missed = self._missed.get(task.key)
+        if missed is None:
+            # Tareas de espaciado de segmentos SOME/IP-TP o de fases SD: un retraso no
+            # pierde datos
+            return
+        missed.inc()
+        packet_log.warning("Deadline perdido en el servicio %s: retraso de %.2f ms", task.key, lateness * 1000)
@@ -0,0 +1,448 @@
+import ipaddress
+import struct
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Mapping, NamedTuple, Optional, Tuple, Union
+from packetTemplate import SOMEIP_HEADER_LEN, finish_checksum, ones_complement_sum
+from scheduler import CyclicScheduler, CyclicTask
+from metrics import TP_DROPPED
+from sdCodec import (
+    MSG_TP_FLAG, TP_HEADER, TP_HEADER_LEN, TP_MAX_SEGMENT, TP_MORE_SEGMENTS, SomeipHeader,
+    decode_someip_header
+)
+
+Buffer = Union[bytes, bytearray, memoryview]
+# Segmento listo para enviar: cabeceras (Ethernet a SOME/IP-TP) y trozo de la payload
+SegmentFrame = Tuple[bytearray, memoryview]
+
+# Separación entre grupos de segmentos de un mismo mensaje y segmentos por grupo, para
+# no desbordar el buffer de recepción de la ECU destino
+TP_SEPARATION = 0.001
+TP_BURST = 4
+
+# Límites de la reasignación: tamaño máximo de un mensaje reensamblado, mensajes que
+# se reensamblan a la vez y tiempo máximo entre segmentos de un mismo mensaje
+TP_MAX_MESSAGE = 256 * 1024
+TP_MAX_SESSIONS = 8
+TP_RX_TIMEOUT = 1.0
+
+VLAN_PRIORITY = 5
+IP_TTL = 64
+
+# Ethernet con etiqueta 802.1Q: MAC destino, MAC origen, TPID, TCI y EtherType
+_ETH_VLAN = struct.Struct("!6s6sHHH")
+# IPv4 sin opciones
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_UDP = struct.Struct("!HHHH")
+_SOMEIP = struct.Struct("!IIHHBBBB")
+_U16 = struct.Struct("!H")
+
+_ETH_LEN = _ETH_VLAN.size
+_IP_LEN = _IPV4.size
+_UDP_OFFSET = _ETH_LEN + _IP_LEN
+_SOMEIP_OFFSET = _UDP_OFFSET + _UDP.size
+_SEGMENT_HEADERS_LEN = _SOMEIP_OFFSET + SOMEIP_HEADER_LEN + TP_HEADER_LEN
+
+
+def split_segments(payload_len: int, max_segment: int = TP_MAX_SEGMENT) -> List[Tuple[int, int, bool]]:
+    """
+    Divide una payload en segmentos SOME/IP-TP.
+
+    :param payload_len: Longitud de la payload completa.
+    :type payload_len: int
+
+    :param max_segment: Longitud máxima de cada segmento. Se redondea a múltiplo de 16,
+        ya que todos los segmentos salvo el último deben serlo.
+    :type max_segment: int
+
+    :return: ``(offset, longitud, more)`` de cada segmento.
+    :rtype: List[Tuple[int, int, bool]]
+
+    :raises ValueError: Si ``max_segment`` es menor que 16.
+    """
+    max_segment &= ~0x0F
+    if max_segment <= 0:
+        raise ValueError("El tamaño máximo de segmento debe ser de al menos 16 bytes")
+    segments = []
+    for offset in range(0, payload_len, max_segment):
+        length = min(max_segment, payload_len - offset)
+        segments.append((offset, length, offset + length < payload_len))
+    return segments
+
+
+class TPSegmenter():
+    """
+    Construye los segmentos SOME/IP-TP de un método para una pareja de ECUs.
+
+    Cada segmento es una tupla ``(cabeceras, trozo)``: las cabeceras (Ethernet con
+    VLAN, IPv4, UDP, SOME/IP con el flag TP y cabecera TP) se generan con ``struct``
+    sobre un buffer nuevo de 62 bytes, y el trozo es un ``memoryview`` sobre la payload
+    original, que nunca se copia. :class:`transmit.Transmitter` envía la tupla con
+    scatter/gather. Para que el envío por lotes no tenga que copiar los trozos, la
+    payload debe ser un ``bytearray`` (o una vista escribible).
+
+    El checksum UDP de cada segmento se calcula sumando la parte fija, las cabeceras
+    del segmento y el trozo de payload, sin unirlos.
+
+    :ivar max_segment: Longitud máxima de payload por segmento.
+    """
+
+    def __init__(
+        self,
+        data_dst: Mapping[str, Any],
+        method_data: Mapping[str, Any],
+        max_segment: int = TP_MAX_SEGMENT,
+        client_id: int = 0x0701
+    ):
+        """
+        :param data_dst: Datos de red devueltos por ``Parser.ecu1_to_ecu2``.
+        :type data_dst: Mapping[str, Any]
+
+        :param method_data: Datos del método devueltos por ``Parser.get_service_data``.
+        :type method_data: Mapping[str, Any]
+
+        :param max_segment: Longitud máxima de payload por segmento.
+        :type max_segment: int
+
+        :param client_id: Client ID de la cabecera SOME/IP.
+        :type client_id: int
+        """
+        someip = method_data["SOMEIP"]
+        msg_type = someip["MessageType"]
+        if isinstance(msg_type, str):
+            msg_type = int(msg_type, 16)
+        self.msg_id = (someip["ServID"] << 16) | someip["MethodID"]
+        self.msg_type = msg_type | MSG_TP_FLAG
+        self.client_id = client_id
+        self.max_segment = max_segment
+        self.sport = data_dst["someip_port_src"]
+        self.dport = data_dst["someip_port_dst"]
+        self.ip_src = ipaddress.IPv4Address(data_dst["ip_src"]).packed
+        self.ip_dst = ipaddress.IPv4Address(data_dst["ip_dst"]).packed
+        self._eth = _ETH_VLAN.pack(
+            bytes.fromhex(data_dst["mac_dst"].replace(":", "")),
+            bytes.fromhex(data_dst["mac_address"].replace(":", "")),
+            0x8100, (VLAN_PRIORITY << 13) | data_dst["vlan"], 0x0800
+        )
+        # Suma de las IPs y el protocolo de la pseudo-cabecera UDP
+        self._pseudo_sum = ones_complement_sum(self.ip_src + self.ip_dst) + 17
+        self._ip_id = 0
+
+    def segments(self, session_id: int, payload: Buffer) -> List[SegmentFrame]:
+        """
+        Segmenta un mensaje.
+
+        :param session_id: Session ID del mensaje (el mismo en todos sus segmentos).
+        :type session_id: int
+
+        :param payload: Payload completa. Debe mantenerse sin modificar hasta que se
+            hayan enviado todos los segmentos.
+        :type payload: bytes | bytearray | memoryview
+
+        :return: Segmentos ``(cabeceras, trozo)`` en orden.
+        :rtype: List[Tuple[bytearray, memoryview]]
+        """
+        view = memoryview(payload)
+        frames = []
+        for offset, length, more in split_segments(len(view), self.max_segment):
+            chunk = view[offset:offset + length]
+            headers = bytearray(_SEGMENT_HEADERS_LEN)
+            headers[:_ETH_LEN] = self._eth
+
+            udp_len = _UDP.size + SOMEIP_HEADER_LEN + TP_HEADER_LEN + length
+            self._ip_id = (self._ip_id + 1) & 0xFFFF
+            _IPV4.pack_into(
+                headers, _ETH_LEN, 0x45, 0, _IP_LEN + udp_len, self._ip_id, 0, IP_TTL, 17, 0,
+                self.ip_src, self.ip_dst
+            )
+            _U16.pack_into(
+                headers, _ETH_LEN + 10, finish_checksum(ones_complement_sum(headers[_ETH_LEN:_UDP_OFFSET]))
+            )
+            _UDP.pack_into(headers, _UDP_OFFSET, self.sport, self.dport, udp_len, 0)
+            _SOMEIP.pack_into(
+                headers, _SOMEIP_OFFSET, self.msg_id, 8 + TP_HEADER_LEN + length, self.client_id,
+                session_id, 0x01, 0x01, self.msg_type, 0x00
+            )
+            TP_HEADER.pack_into(headers, _SOMEIP_OFFSET + SOMEIP_HEADER_LEN, offset | (TP_MORE_SEGMENTS if more else 0))
+            # El trozo empieza 28 bytes después de la cabecera UDP: sus palabras de 16
+            # bits quedan alineadas con las del checksum
+            partial = (
+                self._pseudo_sum + udp_len + ones_complement_sum(headers[_UDP_OFFSET:]) +
+                ones_complement_sum(chunk)
+            )
+            _U16.pack_into(headers, _UDP_OFFSET + 6, finish_checksum(partial))
+            frames.append((headers, chunk))
+        return frames
+
+
+class TPPacer():
+    """
+    Reparte en el tiempo el envío de los segmentos SOME/IP-TP usando el
+    :class:`CyclicScheduler` del servidor: cada flujo en curso es una tarea que
+    entrega ``burst`` segmentos cada ``separation`` segundos y se elimina al terminar.
+    Así un mensaje grande no sale como una ráfaga que desborde a la ECU destino, y sus
+    segmentos se intercalan con los eventos cíclicos en los lotes del planificador.
+
+    La memoria de cada flujo está acotada: el mensaje que se está enviando termina
+    siempre (el receptor no recibe mensajes a medias) y detrás solo espera el mensaje
+    más reciente. Si los mensajes llegan más deprisa de lo que el ritmo permite enviar
+    (``burst / separation`` segmentos por segundo), el que esperaba se sustituye por el
+    nuevo y se cuenta como descartado.
+
+    :ivar dropped: Mensajes descartados sin llegar a enviarse.
+    """
+
+    def __init__(
+        self,
+        scheduler: CyclicScheduler,
+        separation: float = TP_SEPARATION,
+        burst: int = TP_BURST,
+        on_frames: Optional[Callable[[Hashable, int], Any]] = None
+    ):
+        """
+        :param scheduler: Planificador que envía los lotes de tramas.
+        :type scheduler: CyclicScheduler
+
+        :param separation: Segundos entre grupos de segmentos de un mismo destino.
+        :type separation: float
+
+        :param burst: Segmentos por grupo.
+        :type burst: int
+
+        :param on_frames: Función a la que se notifica, con la clave del flujo, cuántos
+            segmentos entrega en cada tick (p. ej. :meth:`metrics.SentFramesCounter.add`).
+        :type on_frames: Callable[[Hashable, int], Any]
+        """
+        if separation <= 0 or burst < 1:
+            raise ValueError(f"Ritmo de segmentos no válido: {burst} cada {separation} s")
+        self.scheduler = scheduler
+        self.separation = separation
+        self.burst = burst
+        self.on_frames = on_frames
+        self.dropped = 0
+        self._dropped = TP_DROPPED
+        # Segmentos pendientes del mensaje en curso y mensaje en espera de cada flujo
+        self._queues: Dict[Hashable, Deque[SegmentFrame]] = {}
+        self._waiting: Dict[Hashable, List[SegmentFrame]] = {}
+
+    def submit(self, key: Hashable, frames: List[SegmentFrame]):
+        """
+        Encola los segmentos de un mensaje. Si el flujo está libre, el primer grupo sale
+        en el siguiente tick del planificador; si no, el mensaje espera a que termine el
+        que está en curso y sustituye al que estuviese esperando.
+
+        :param key: Identificador del flujo (p. ej. método y suscriptor).
+        :type key: Hashable
+
+        :param frames: Segmentos del mensaje.
+        :type frames: List[Tuple[bytearray, memoryview]]
+        """
+        if key in self._queues:
+            if self._waiting.get(key) is not None:
+                self.dropped += 1
+                self._dropped.inc()
+            self._waiting[key] = frames
+            return
+        self._queues[key] = deque(frames)
+        self.scheduler.add(("tp", key), self.separation, self._send_next)
+
+    def pending(self) -> int:
+        """
+        Segmentos pendientes de envío.
+        """
+        return sum(len(queue) for queue in self._queues.values()) + sum(len(frames) for frames in self._waiting.values())
+
+    def _send_next(self, task: CyclicTask) -> Optional[List[SegmentFrame]]:
+        key = task.key[1]
+        queue = self._queues.get(key)
+        if queue is None:
+            self.scheduler.remove(task.key)
+            return None
+        frames = []
+        while len(frames) < self.burst:
+            if not queue:
+                # Mensaje terminado: sigue el que esperaba, si lo hay
+                waiting = self._waiting.pop(key, None)
+                if waiting is None:
+                    break
+                queue.extend(waiting)
+            frames.append(queue.popleft())
+        if not queue and key not in self._waiting:
+            del self._queues[key]
+            self.scheduler.remove(task.key)
+        if self.on_frames is not None:
+            self.on_frames(key, len(frames))
+        return frames
+
+    def cancel(self, key: Hashable):
+        """
+        Descarta los segmentos pendientes de un flujo, incluido el mensaje en curso.
+        """
+        self._waiting.pop(key, None)
+        if self._queues.pop(key, None) is not None:
+            self.scheduler.remove(("tp", key))
+
+
+class TPMessage(NamedTuple):
+    """
+    Mensaje reensamblado: cabecera del primer segmento (sin el flag TP y con la longitud
+    del mensaje completo) y vista sobre la payload.
+    """
+    header: SomeipHeader
+    payload: memoryview
+
+
+class _Session():
+    __slots__ = ("header", "buffer", "filled", "deadline")
+
+    def __init__(self, header: SomeipHeader, buffer: bytearray, deadline: float):
+        self.header = header
+        self.buffer = buffer
+        self.filled = 0
+        self.deadline = deadline
+
+
+class TPReassembler():
+    """
+    Reensambla mensajes SOME/IP-TP.
+
+    La memoria está acotada: se reservan al crear el objeto ``max_sessions`` buffers de
+    ``max_message`` bytes y cada mensaje en curso ocupa uno. Los segmentos se copian
+    directamente en su posición del buffer. Un mensaje se descarta si:
+
+    - pasa más de ``timeout`` segundos sin recibir ninguno de sus segmentos,
+    - llega un segmento que deja un hueco (se esperan en orden; los repetidos se ignoran),
+    - supera ``max_message`` o un segmento intermedio no es múltiplo de 16,
+    - no quedan buffers libres y es el mensaje en curso más antiguo.
+
+    Un segmento con offset 0 o con otro Session ID reinicia el mensaje de su flujo
+    (emisor, Message ID y Client ID).
+
+    :ivar completed: Mensajes reensamblados.
+    :ivar dropped: Mensajes descartados.
+    """
+
+    def __init__(
+        self,
+        max_message: int = TP_MAX_MESSAGE,
+        max_sessions: int = TP_MAX_SESSIONS,
+        timeout: float = TP_RX_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        :param max_message: Longitud máxima de la payload de un mensaje.
+        :type max_message: int
+
+        :param max_sessions: Mensajes que se pueden reensamblar a la vez.
+        :type max_sessions: int
+
+        :param timeout: Tiempo máximo entre segmentos de un mensaje, en segundos.
+        :type timeout: float
+
+        :param clock: Reloj monotónico.
+        :type clock: Callable[[], float]
+        """
+        if max_sessions < 1:
+            raise ValueError(f"Número de sesiones no válido: {max_sessions}")
+        self.max_message = max_message
+        self.timeout = timeout
+        self.clock = clock
+        self.completed = 0
+        self.dropped = 0
+        self._free: List[bytearray] = [bytearray(max_message) for _ in range(max_sessions)]
+        # Mensajes en curso por flujo, del que lleva más tiempo sin segmentos al más reciente
+        self._sessions: "OrderedDict[Hashable, _Session]" = OrderedDict()
+        # Buffer del último mensaje entregado, que se libera en la siguiente llamada
+        self._delivered: Optional[bytearray] = None
+
+    def _release(self, key: Hashable):
+        self._free.append(self._sessions.pop(key).buffer)
+        self.dropped += 1
+
+    def expire(self, now: Optional[float] = None):
+        """
+        Descarta los mensajes que han superado el timeout.
+        """
+        if now is None:
+            now = self.clock()
+        sessions = self._sessions
+        while sessions:
+            key, session = next(iter(sessions.items()))
+            if session.deadline > now:
+                break
+            self._release(key)
+
+    def in_progress(self) -> int:
+        return len(self._sessions)
+
+    def feed(self, message: Buffer, source: Hashable = None) -> Optional[TPMessage]:
+        """
+        Procesa un segmento SOME/IP-TP (mensaje SOME/IP completo, desde la cabecera).
+
+        :param message: Segmento recibido.
+        :type message: bytes | bytearray | memoryview
+
+        :param source: Emisor del segmento (p. ej. su dirección), para separar flujos.
+        :type source: Hashable
+
+        :return: El mensaje completo si este era su último segmento, o None. La vista de
+            la payload es válida hasta la siguiente llamada a ``feed``.
+        :rtype: Optional[TPMessage]
+
+        :raises ValueError: Si el segmento no es un mensaje SOME/IP-TP bien formado.
+        """
+        if self._delivered is not None:
+            self._free.append(self._delivered)
+            self._delivered = None
+        now = self.clock()
+        self.expire(now)
+
+        header = decode_someip_header(message)
+        if not header.msg_type & MSG_TP_FLAG:
+            raise ValueError("El mensaje no es un segmento SOME/IP-TP")
+        end = 8 + header.length
+        if header.length < 8 + TP_HEADER_LEN or end > len(message):
+            raise ValueError("Segmento SOME/IP-TP truncado")
+        tp = TP_HEADER.unpack_from(message, SOMEIP_HEADER_LEN)[0]
+        offset = tp & ~0x0F
+        more = tp & TP_MORE_SEGMENTS
+        chunk = memoryview(message)[SOMEIP_HEADER_LEN + TP_HEADER_LEN:end]
+
+        key = (source, header.msg_id, header.client_id)
+        session = self._sessions.get(key)
+        if session is not None and (offset == 0 or session.header.session_id != header.session_id):
+            # Empieza otro mensaje del mismo flujo: el anterior queda incompleto
+            self._release(key)
+            session = None
+        if session is None:
+            if offset != 0:
+                # Falta el principio del mensaje
+                return None
+            if not self._free:
+                self._release(next(iter(self._sessions)))
+            session = self._sessions[key] = _Session(header, self._free.pop(), now + self.timeout)
+        else:
+            self._sessions.move_to_end(key)
+            session.deadline = now + self.timeout
+
+        if offset < session.filled:
+            # Segmento repetido
+            return None
+        length = len(chunk)
+        if offset > session.filled or offset + length > self.max_message or (more and length & 0x0F):
+            self._release(key)
+            return None
+        session.buffer[offset:offset + length] = chunk
+        session.filled = offset + length
+        if more:
+            return None
+
+        # El buffer no vuelve a estar libre hasta la siguiente llamada
+        del self._sessions[key]
+        self._delivered = session.buffer
+        self.completed += 1
+        first = session.header
+        return TPMessage(
+            first._replace(msg_type=first.msg_type & ~MSG_TP_FLAG, length=8 + session.filled),
+            memoryview(session.buffer)[:session.filled]
+        )
@@ -0,0 +1,157 @@
+import heapq
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# TTL que indica una suscripción sin caducidad (0xFFFFFF en SOME/IP-SD)
+TTL_INFINITE = 0xFFFFFF
+
+# Endpoint del suscriptor: (IP, puerto UDP)
+SubscriberEndpoint = Tuple[str, int]
+# Eventgroup: (Service ID, Instance ID, Eventgroup ID)
+EventgroupKey = Tuple[int, int, int]
+# Suscripción: eventgroup + endpoint del suscriptor
+SubscriptionKey = Tuple[int, int, int, SubscriberEndpoint]
+
+
+class SubscriptionTable():
+    """
+    Tabla de suscripciones a eventgroups con caducidad por TTL.
+
+    Cada suscripción se identifica por (servicio, instancia, eventgroup, endpoint del
+    suscriptor). Los vencimientos se guardan en un heap con borrado perezoso: renovar
+    una suscripción solo añade una nueva entrada al heap y las entradas obsoletas se
+    descartan al llegar a la cima. Así, alta, renovación y caducidad son O(log n) y la
+    consulta de los suscriptores de un eventgroup es O(1).
+
+    :ivar on_expired: Función a la que se notifica cada suscripción caducada.
+    """
+
+    def __init__(
+        self,
+        on_expired: Optional[Callable[[SubscriptionKey], None]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.on_expired = on_expired
+        self.clock = clock
+        # Vencimiento vigente de cada suscripción (None si no caduca)
+        self._expiry: Dict[SubscriptionKey, Optional[float]] = {}
+        # Suscriptores vivos de cada eventgroup, en orden de alta
+        self._groups: Dict[EventgroupKey, Dict[SubscriberEndpoint, None]] = {}
+        self._heap: List[Tuple[float, SubscriptionKey]] = []
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def subscribe(
+        self, srv_id: int, inst_id: int, eventgroup_id: int,
+        endpoint: SubscriberEndpoint, ttl: int, now: Optional[float] = None
+    ) -> bool:
+        """
+        Da de alta o renueva una suscripción. Un TTL de 0 equivale a StopSubscribe.
+
+        :param srv_id: Service ID.
+        :type srv_id: int
+
+        :param inst_id: Instance ID.
+        :type inst_id: int
+
+        :param eventgroup_id: Eventgroup ID.
+        :type eventgroup_id: int
+
+        :param endpoint: Endpoint (IP, puerto) donde el suscriptor recibe los eventos.
+        :type endpoint: Tuple[str, int]
+
+        :param ttl: TTL de la entrada Subscribe en segundos.
+        :type ttl: int
+
+        :return: True si es una suscripción nueva, False si es una renovación o una baja.
+        :rtype: bool
+        """
+        if ttl == 0:
+            self.unsubscribe(srv_id, inst_id, eventgroup_id, endpoint)
+            return False
+
+        key = (srv_id, inst_id, eventgroup_id, endpoint)
+        is_new = key not in self._expiry
+        if ttl >= TTL_INFINITE:
+            expiry = None
+        else:
+            expiry = (self.clock() if now is None else now) + ttl
+            heapq.heappush(self._heap, (expiry, key))
+        self._expiry[key] = expiry
+        if is_new:
+            self._groups.setdefault((srv_id, inst_id, eventgroup_id), {})[endpoint] = None
+        self._compact()
+        return is_new
+
+    def unsubscribe(self, srv_id: int, inst_id: int, eventgroup_id: int, endpoint: SubscriberEndpoint) -> bool:
+        """
+        Elimina una suscripción (StopSubscribe).
+
+        :return: True si la suscripción existía.
+        :rtype: bool
+        """
+        key = (srv_id, inst_id, eventgroup_id, endpoint)
+        if self._expiry.pop(key, False) is False:
+            return False
+        group_key = (srv_id, inst_id, eventgroup_id)
+        group = self._groups[group_key]
+        del group[endpoint]
+        if not group:
+            del self._groups[group_key]
+        return True
+
+    def expire(self, now: Optional[float] = None) -> List[SubscriptionKey]:
+        """
+        Elimina las suscripciones cuyo TTL ha vencido.
+
+        :return: Suscripciones caducadas.
+        :rtype: List[SubscriptionKey]
+        """
+        heap = self._heap
+        if not heap:
+            return []
+        if now is None:
+            now = self.clock()
+        expired = []
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            # Entrada obsoleta por una renovación o una baja anterior
+            if self._expiry.get(key, -1.0) != expiry:
+                continue
+            self.unsubscribe(*key)
+            expired.append(key)
+            if self.on_expired is not None:
+                self.on_expired(key)
+        return expired
+
+    def next_expiry(self) -> Optional[float]:
+        """
+        Devuelve el próximo vencimiento (puede corresponder a una entrada obsoleta).
+        """
+        return self._heap[0][0] if self._heap else None
+
+    def subscribers(self, srv_id: int, inst_id: int, eventgroup_id: int) -> Tuple[SubscriberEndpoint, ...]:
+        """
+        Devuelve los endpoints suscritos a un eventgroup.
+        """
+        group = self._groups.get((srv_id, inst_id, eventgroup_id))
+        return tuple(group) if group else ()
+
+    def count(self, srv_id: int, inst_id: int, eventgroup_id: int) -> int:
+        """
+        Devuelve el número de suscriptores de un eventgroup.
+        """
+        group = self._groups.get((srv_id, inst_id, eventgroup_id))
+        return len(group) if group else 0
+
+    def _compact(self):
+        """
+        Reconstruye el heap cuando las entradas obsoletas superan a las vigentes,
+        para que las renovaciones frecuentes no lo hagan crecer sin límite.
+        """
+        if len(self._heap) > 2 * len(self._expiry) + 64:
+            self._heap = [
+                (expiry, key) for key, expiry in self._expiry.items() if expiry is not None
+            ]
+            heapq.heapify(self._heap)
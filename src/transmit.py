@@ -0,0 +1,346 @@
+import ctypes
+import ctypes.util
+import os
+import socket
+import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+from pcapFile import PcapngWriter
+
+# Interfaz por defecto si la ECU no define el campo "interface" en ecu_data.json
+DEFAULT_INTERFACE = "eth1"
+
+# Opción de socket de Linux (linux/if_packet.h) para saltarse la qdisc de la interfaz
+PACKET_QDISC_BYPASS = 20
+
+# Número máximo de mensajes por llamada a sendmmsg (UIO_MAXIOV en Linux)
+MAX_BATCH = 1024
+# Número máximo de fragmentos de una trama compuesta (ver ``Transmitter``)
+MAX_FRAME_PARTS = 4
+
+Buffer = Union[bytes, bytearray, memoryview]
+Frame = Union[Buffer, Tuple[Buffer, ...], Any]
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    """
+    Obtiene ``sendmmsg`` de la libc mediante ctypes. Devuelve None si la plataforma
+    no lo proporciona, en cuyo caso los lotes se envían trama a trama.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        func = libc.sendmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    func.restype = ctypes.c_int
+    return func
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class BatchResult(NamedTuple):
+    """
+    Resultado del envío de un lote de tramas.
+    """
+    sent: int
+    dropped: int
+
+
+class Transmitter():
+    """
+    Capa de transmisión basada en un socket ``AF_PACKET``/``SOCK_RAW`` de larga duración.
+
+    Sustituye a las llamadas a ``scapy.sendp``, que en cada envío abren un socket L2,
+    resuelven la interfaz, envían y cierran. Aquí el socket se abre una única vez por
+    interfaz (o subinterfaz VLAN) y se comparte entre el envío de SD y de eventos.
+
+    Acepta tanto tramas ya serializadas (``bytes``, ``bytearray``, ``memoryview``) como
+    paquetes de Scapy, que se serializan con ``bytes()``. Una trama también puede ser
+    una tupla de buffers (p. ej. cabeceras y un trozo de la payload, como los segmentos
+    SOME/IP-TP): se envía con scatter/gather, sin unir los fragmentos.
+
+    Si la interfaz es una subinterfaz VLAN (p. ej. ``eth1.1500``) el kernel añade la
+    etiqueta 802.1Q, por lo que las tramas etiquetadas se envían sin ella.
+
+    :ivar interface: Nombre de la interfaz de red.
+    :ivar sock: Socket raw asociado a la interfaz.
+    """
+    _pool: Dict[str, "Transmitter"] = {}
+    _pool_lock = threading.Lock()
+
+    def __init__(self, interface: str, qdisc_bypass: bool = False):
+        """
+        Abre el socket raw sobre la interfaz indicada.
+
+        :param interface: Nombre de la interfaz de red.
+        :type interface: str
+
+        :param qdisc_bypass: Si es True se envía directamente al driver sin pasar por
+            la qdisc (menor latencia, pero las tramas se descartan si la cola está llena).
+        :type qdisc_bypass: bool
+
+        :raises OSError: Si no se puede abrir el socket (interfaz inexistente o falta de
+            permisos CAP_NET_RAW).
+        """
+        self.interface = interface
+        # Protocolo 0: el socket solo transmite, el kernel no le entrega tramas recibidas
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        self.sock.bind((interface, 0))
+        if qdisc_bypass:
+            try:
+                self.sock.setsockopt(socket.SOL_PACKET, PACKET_QDISC_BYPASS, 1)
+            except OSError:
+                pass
+        self.strip_vlan = os.path.exists(f"/proc/net/vlan/{interface}")
+
+        # Vectores preasignados para sendmmsg: hasta MAX_FRAME_PARTS iovecs por mensaje
+        self._iov = (_IOVec * (MAX_BATCH * MAX_FRAME_PARTS))()
+        self._msgs = (_MMsgHdr * MAX_BATCH)()
+        for i in range(MAX_BATCH):
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iov[i * MAX_FRAME_PARTS])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+        self._batch_lock = threading.Lock()
+
+    @classmethod
+    def for_interface(cls, interface: str) -> "Transmitter":
+        """
+        Devuelve el transmisor compartido de la interfaz, creándolo la primera vez.
+
+        :param interface: Nombre de la interfaz de red.
+        :type interface: str
+
+        :return: Transmisor asociado a la interfaz.
+        :rtype: Transmitter
+        """
+        tx = cls._pool.get(interface)
+        if tx is None:
+            with cls._pool_lock:
+                tx = cls._pool.get(interface)
+                if tx is None:
+                    tx = cls(interface)
+                    cls._pool[interface] = tx
+        return tx
+
+    @classmethod
+    def close_all(cls):
+        """
+        Cierra todos los sockets abiertos del pool.
+        """
+        with cls._pool_lock:
+            for tx in cls._pool.values():
+                tx.close()
+            cls._pool.clear()
+
+    def _to_wire(self, frame: Frame) -> Union[Buffer, Tuple[Buffer, ...]]:
+        if isinstance(frame, tuple):
+            # La etiqueta VLAN va en el primer fragmento (las cabeceras)
+            return (self._to_wire(frame[0]),) + frame[1:]
+        if not isinstance(frame, (bytes, bytearray, memoryview)):
+            frame = bytes(frame)
+        if self.strip_vlan and frame[12:14] == b"\x81\x00":
+            frame = bytes(frame[:12]) + bytes(frame[16:])
+        return frame
+
+    def send(self, frame: Frame) -> int:
+        """
+        Envía una trama completa (desde la cabecera Ethernet).
+
+        :param frame: Trama serializada, tupla de fragmentos o paquete de Scapy.
+        :type frame: bytes | bytearray | memoryview | tuple | scapy.packet.Packet
+
+        :return: Número de bytes enviados.
+        :rtype: int
+
+        :raises OSError: Si el kernel rechaza el envío.
+        """
+        frame = self._to_wire(frame)
+        if isinstance(frame, tuple):
+            return self.sock.sendmsg(frame)
+        return self.sock.send(frame)
+
+    def send_batch(self, frames: Sequence[Frame]) -> BatchResult:
+        """
+        Envía un lote de tramas con el menor número posible de llamadas al sistema,
+        usando ``sendmmsg`` (hasta ``MAX_BATCH`` tramas por llamada).
+
+        Si el kernel rechaza una trama (p. ej. ``ENOBUFS`` con la cola llena) esa trama
+        se contabiliza como descartada y se continúa con el resto del lote.
+
+        Las tramas deben ser independientes entre sí: las vistas devueltas por una
+        misma plantilla comparten buffer, por lo que deben copiarse antes de agruparse.
+
+        :param frames: Tramas serializadas o paquetes de Scapy.
+        :type frames: Sequence[bytes | bytearray | memoryview | scapy.packet.Packet]
+
+        :return: Número de tramas enviadas y descartadas.
+        :rtype: BatchResult
+        """
+        if _sendmmsg is None:
+            return self._send_batch_fallback(frames)
+
+        sent = dropped = 0
+        fd = self.sock.fileno()
+        base = ctypes.addressof(self._msgs)
+        msg_size = ctypes.sizeof(_MMsgHdr)
+        with self._batch_lock:
+            for start in range(0, len(frames), MAX_BATCH):
+                chunk = frames[start:start + MAX_BATCH]
+                # Se mantienen las referencias a los buffers mientras dura la llamada
+                buffers = []
+                for i, frame in enumerate(chunk):
+                    frame = self._to_wire(frame)
+                    parts = frame if isinstance(frame, tuple) else (frame,)
+                    if len(parts) > MAX_FRAME_PARTS:
+                        parts = (b"".join(parts),)
+                    iov = i * MAX_FRAME_PARTS
+                    for part in parts:
+                        if isinstance(part, memoryview) and part.readonly:
+                            part = bytes(part)
+                        if isinstance(part, bytes):
+                            buf = ctypes.c_char_p(part)
+                        else:
+                            buf = (ctypes.c_char * len(part)).from_buffer(part)
+                        buffers.append(buf)
+                        self._iov[iov].iov_base = ctypes.cast(buf, ctypes.c_void_p)
+                        self._iov[iov].iov_len = len(part)
+                        iov += 1
+                    self._msgs[i].msg_hdr.msg_iovlen = len(parts)
+
+                pending = len(chunk)
+                offset = 0
+                while pending:
+                    msgs = ctypes.cast(base + offset * msg_size, ctypes.POINTER(_MMsgHdr))
+                    n = _sendmmsg(fd, msgs, pending, 0)
+                    if n < 0:
+                        # La primera trama pendiente ha fallado: se descarta y se sigue
+                        n = 1
+                        dropped += 1
+                    else:
+                        sent += n
+                    offset += n
+                    pending -= n
+        return BatchResult(sent, dropped)
+
+    def _send_batch_fallback(self, frames: Sequence[Frame]) -> BatchResult:
+        sent = dropped = 0
+        for frame in frames:
+            try:
+                self.send(frame)
+                sent += 1
+            except OSError:
+                dropped += 1
+        return BatchResult(sent, dropped)
+
+    def close(self):
+        self.sock.close()
+
+
+class PcapTransmitter():
+    """
+    Backend de salida que escribe las tramas en un fichero pcapng en lugar de enviarlas
+    por la red. Tiene la misma interfaz que :class:`Transmitter` (``send``,
+    ``send_batch`` y ``close``), por lo que OFFER, ACK y eventos cíclicos se escriben
+    exactamente como se habrían enviado, etiqueta VLAN incluida.
+
+    :ivar interface: Interfaz lógica con la que se registran las tramas.
+    :ivar writer: Escritor pcapng compartido.
+    """
+
+    def __init__(self, writer: PcapngWriter, interface: str):
+        self.interface = interface
+        self.writer = writer
+        self._interface_id = writer.interface_id(interface)
+
+    def send(self, frame: Frame) -> int:
+        if isinstance(frame, tuple):
+            frame = b"".join(frame)
+        elif not isinstance(frame, (bytes, bytearray, memoryview)):
+            frame = bytes(frame)
+        return self.writer.write(frame, self._interface_id)
+
+    def send_batch(self, frames: Sequence[Frame]) -> BatchResult:
+        for frame in frames:
+            self.send(frame)
+        return BatchResult(len(frames), 0)
+
+    def close(self):
+        self.writer.flush()
+
+
+# Salida pcapng activa (None para enviar por las interfaces de red)
+_pcap_writer: Optional[PcapngWriter] = None
+_pcap_transmitters: Dict[str, PcapTransmitter] = {}
+
+
+def set_pcap_output(path: str, clock: Optional[Callable[[], int]] = None) -> PcapngWriter:
+    """
+    Redirige todas las transmisiones a un fichero pcapng. A partir de esta llamada
+    :func:`get_transmitter` devuelve transmisores que escriben en el fichero, por lo
+    que el simulador puede ejecutarse sin tarjeta de red.
+
+    :param path: Ruta del fichero pcapng.
+    :type path: str
+
+    :param clock: Fuente de timestamps en nanosegundos desde epoch. Por defecto el
+        reloj del sistema en el momento de la escritura.
+    :type clock: Callable[[], int]
+
+    :return: Escritor del fichero.
+    :rtype: PcapngWriter
+    """
+    global _pcap_writer
+    close_pcap_output()
+    _pcap_writer = PcapngWriter(path) if clock is None else PcapngWriter(path, clock=clock)
+    return _pcap_writer
+
+
+def close_pcap_output():
+    """
+    Cierra el fichero pcapng activo y vuelve a enviar por las interfaces de red.
+    """
+    global _pcap_writer
+    if _pcap_writer is not None:
+        _pcap_writer.close()
+        _pcap_writer = None
+    _pcap_transmitters.clear()
+
+
+def get_transmitter(interface: str = None) -> Union[Transmitter, PcapTransmitter]:
+    """
+    Devuelve el transmisor compartido de una interfaz, o el que escribe en el fichero
+    pcapng si se ha activado con :func:`set_pcap_output`.
+
+    :param interface: Nombre de la interfaz. Si es None se usa ``DEFAULT_INTERFACE``.
+    :type interface: str
+
+    :return: Transmisor asociado a la interfaz.
+    :rtype: Transmitter | PcapTransmitter
+    """
+    interface = interface or DEFAULT_INTERFACE
+    if _pcap_writer is not None:
+        tx = _pcap_transmitters.get(interface)
+        if tx is None:
+            tx = _pcap_transmitters[interface] = PcapTransmitter(_pcap_writer, interface)
+        return tx
+    return Transmitter.for_interface(interface)
@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+
+# Los módulos de src/ se importan por su nombre (``from sdCodec import ...``), como
+# cuando la herramienta se ejecuta desde src/, y los plugins como ``plugins.<módulo>``
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(1, ROOT_DIR)
+
+
+@pytest.fixture
+def in_src(monkeypatch):
+    """
+    Ejecuta la prueba desde src/, donde el parser busca la configuración (``../data``).
+    """
+    monkeypatch.chdir(SRC_DIR)
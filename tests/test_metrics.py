@@ -0,0 +1,59 @@
+import pytest
+from metrics import FRAMES_SENT, SentFramesCounter
+from transmit import BatchResult
+
+
+def sent(service) -> int:
+    return FRAMES_SENT.labels(service).value
+
+
+def test_counts_after_send():
+    counter = SentFramesCounter()
+    batches = []
+
+    def send_batch(frames):
+        # Al enviar, las tramas anotadas aún no se han contado
+        batches.append(sent("m-a"))
+        return BatchResult(len(frames), 0)
+
+    before = sent("m-a")
+    flush = counter.wrap(send_batch)
+    counter.add("m-a", 2)
+    counter.add("m-b")
+    flush([b"1", b"2", b"3"])
+    assert batches == [before]
+    assert sent("m-a") == before + 2
+    # Las anotaciones se consumen con cada lote
+    flush([b"4"])
+    assert sent("m-a") == before + 2
+
+
+def test_failed_send_is_not_counted():
+    counter = SentFramesCounter()
+
+    def send_batch(frames):
+        raise OSError("interfaz caída")
+
+    before = sent("m-c")
+    counter.add("m-c", 3)
+    with pytest.raises(OSError):
+        counter.wrap(send_batch)([b"1", b"2", b"3"])
+    assert sent("m-c") == before
+
+
+def test_dropped_frames_are_discounted():
+    counter = SentFramesCounter()
+    before = sent("m-d"), sent("m-e")
+    counter.add("m-d", 2)
+    counter.add("m-e", 2)
+    counter.wrap(lambda frames: BatchResult(2, 2))([b"1", b"2", b"3", b"4"])
+    assert (sent("m-d"), sent("m-e")) == (before[0] + 1, before[1] + 1)
+
+
+def test_inc_reuses_child():
+    counter = SentFramesCounter()
+    before = sent("m-f")
+    counter.inc("m-f")
+    counter.inc("m-f", 2)
+    assert sent("m-f") == before + 3
+    assert counter._children["m-f"] is FRAMES_SENT.labels("m-f")
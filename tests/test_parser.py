@@ -0,0 +1,65 @@
+import os
+import shutil
+import pytest
+from parser import ConfigRegistry, Parser
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    # Comprobación del mtime en cada consulta
+    monkeypatch.setattr(ConfigRegistry, "CHECK_INTERVAL", 0.0)
+    ecu_path, services_path = tmp_path / "ecu_data.json", tmp_path / "services.json"
+    shutil.copy(os.path.join(DATA_DIR, "ecu_data.json"), ecu_path)
+    shutil.copy(os.path.join(DATA_DIR, "services.json"), services_path)
+    return str(ecu_path), str(services_path)
+
+
+def touch(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+    # mtime distinto aunque la escritura caiga en el mismo tick del reloj
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_lookups(files):
+    registry = ConfigRegistry(*files)
+    method = registry.method(140)
+    assert registry.method_by_someip_id(method["SOMEIP"]["ServID"], method["SOMEIP"]["MethodID"]) is method
+    ecu = registry.ecu("PCU_Proxy_Frontend")
+    assert registry.ecu_by_ip(ecu["ip"]) is ecu
+    assert registry.ecu_pair("PCU_Proxy_Frontend", "IVC")["ip_src"] == ecu["ip"]
+    assert registry.method(99999) is None
+
+
+def test_missing_file(files, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ConfigRegistry(files[0], str(tmp_path / "missing.json"))
+
+
+def test_reload_on_change(files):
+    registry = ConfigRegistry(*files)
+    pair = registry.ecu_pair("PCU_Proxy_Frontend", "IVC")
+    touch(files[1], '{"services": []}')
+    assert registry.method(140) is None
+    assert registry.version == 2
+    # Las cachés de datos de red se descartan con la recarga
+    assert registry.ecu_pair("PCU_Proxy_Frontend", "IVC") is not pair
+
+
+def test_keeps_last_state_when_file_is_removed(files):
+    registry = ConfigRegistry(*files)
+    os.remove(files[1])
+    assert registry.method(140)["id"] == 140
+    touch(files[1], "{")
+    assert registry.method(140)["id"] == 140
+    assert registry.version == 1
+    touch(files[1], open(os.path.join(DATA_DIR, "services.json")).read())
+    assert registry.method(140)["id"] == 140
+    assert registry.version == 2
+
+
+def test_parser_shares_registry(in_src):
+    assert Parser().registry is Parser().registry
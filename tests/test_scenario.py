@@ -0,0 +1,32 @@
+import numpy as np
+from plugins.scenario import KMH_TO_MS, STANDSTILL_DECELERATION, DriveScenario
+from plugins.VehicleDynamicsPlugin import SpeedSupposedStateT
+
+
+def accel(scenario: DriveScenario) -> np.ndarray:
+    return scenario.build().records["VehicleAccelAndYaw"]["longitudinalAccelCorrected"]
+
+
+def test_first_cycle_accel_from_initial_speed():
+    a = accel(DriveScenario(rate_hz=50.0, initial_speed=0.0).ramp(36.0, 2.0))
+    assert np.allclose(a, 36.0 * KMH_TO_MS / 2.0)
+
+
+def test_cruise_from_initial_speed_has_no_accel():
+    assert np.allclose(accel(DriveScenario(initial_speed=80.0).cruise(1.0)), 0.0)
+
+
+def test_standstill_ramps_down():
+    scenario = DriveScenario(rate_hz=50.0, initial_speed=50.0).cruise(1.0).standstill(1.0)
+    payloads = scenario.build()
+    a = payloads.records["VehicleAccelAndYaw"]["longitudinalAccelCorrected"]
+    assert a.min() >= -STANDSTILL_DECELERATION * 1.01
+    speed = payloads.records["VehicleSpeed"]
+    assert speed["vehicleSpeed"][-50:].max() == 0.0
+    assert (speed["standStillSupposed"][-50:] == SpeedSupposedStateT.STANDSTILL).all()
+
+
+def test_standstill_when_stopped():
+    scenario = DriveScenario().standstill(1.0)
+    assert len(scenario) == 50
+    assert np.allclose(accel(scenario), 0.0)
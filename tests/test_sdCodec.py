@@ -0,0 +1,195 @@
+import pytest
+from scapy.layers.l2 import Ether, Dot1Q
+from scapy.layers.inet import IP, UDP as UDPLayer
+from scapy.packet import Raw
+from sdCodec import (
+    ENTRY_OFFER_SERVICE, ENTRY_SUBSCRIBE, OPTION_IP4_ENDPOINT, OPTION_IP4_MULTICAST,
+    SD_ENTRY_LEN, SD_MAX_MESSAGE, SD_MESSAGE_OVERHEAD, Endpoint,
+    encode_eventgroup_entry, encode_ip4_option, encode_sd_message, encode_service_entry,
+    iter_frame_sd_entries, iter_sd_entries, pack_sd_entries, udp_payload
+)
+
+UDP = 0x11
+ECU_OPTION = encode_ip4_option(OPTION_IP4_ENDPOINT, "192.168.114.98", UDP, 30501)
+OPTION_LEN = len(ECU_OPTION)
+
+
+def offer(srv_id: int, options=(ECU_OPTION,)):
+    return encode_service_entry(ENTRY_OFFER_SERVICE, srv_id, 0x0001, 1, 3, 0), options
+
+
+def endpoint_option(host: int) -> bytes:
+    return encode_ip4_option(OPTION_IP4_ENDPOINT, f"10.0.{host >> 8}.{host & 0xFF}", UDP, 30501)
+
+
+def decode(messages):
+    """
+    Codifica los mensajes empaquetados y los decodifica de nuevo.
+    """
+    return [list(iter_sd_entries(encode_sd_message(1, entries, options))) for entries, options in messages]
+
+
+def message_size(entries, options) -> int:
+    return len(encode_sd_message(1, entries, options))
+
+
+def test_pack_empty():
+    assert pack_sd_entries([]) == []
+
+
+def test_pack_shares_identical_options():
+    messages = pack_sd_entries([offer(srv_id) for srv_id in range(1, 11)])
+    assert len(messages) == 1
+    entries, options = messages[0]
+    assert len(entries) == 10
+    assert options == [ECU_OPTION]
+    expected = Endpoint(OPTION_IP4_ENDPOINT, "192.168.114.98", UDP, 30501)
+    decoded = decode(messages)[0]
+    assert [entry.srv_id for entry in decoded] == list(range(1, 11))
+    assert all(entry.options == (expected,) for entry in decoded)
+
+
+def test_pack_entries_without_options():
+    messages = pack_sd_entries([offer(1, ()), offer(2), offer(3, ())])
+    entries, options = messages[0]
+    assert options == [ECU_OPTION]
+    # Las entradas sin opciones no se modifican
+    assert entries[0] == offer(1, ())[0]
+    expected = Endpoint(OPTION_IP4_ENDPOINT, "192.168.114.98", UDP, 30501)
+    assert [entry.options for entry in decode(messages)[0]] == [(), (expected,), ()]
+
+
+def test_pack_resolves_distinct_options():
+    multicast = encode_ip4_option(OPTION_IP4_MULTICAST, "239.0.0.1", UDP, 30490)
+    subscribe = encode_eventgroup_entry(ENTRY_SUBSCRIBE, 0x0238, 0x0001, 1, 3, 0x0001)
+    messages = pack_sd_entries([
+        offer(1, (endpoint_option(1),)),
+        (subscribe, (endpoint_option(2), multicast)),
+        offer(2, (endpoint_option(1),)),
+        offer(3, (endpoint_option(3),)),
+    ])
+    assert len(messages) == 1
+    assert len(messages[0][1]) == 4
+    decoded = decode(messages)[0]
+    assert [[option.addr for option in entry.options] for entry in decoded] == [
+        ["10.0.0.1"], ["10.0.0.2", "239.0.0.1"], ["10.0.0.1"], ["10.0.0.3"]
+    ]
+    assert decoded[1].eventgroup_id == 0x0001
+
+
+def test_pack_splits_on_size():
+    entries = [offer(srv_id, (endpoint_option(srv_id),)) for srv_id in range(1, 201)]
+    messages = pack_sd_entries(entries)
+    assert len(messages) > 1
+    assert all(message_size(*message) <= SD_MAX_MESSAGE for message in messages)
+    decoded = [entry for message in decode(messages) for entry in message]
+    assert [entry.srv_id for entry in decoded] == list(range(1, 201))
+    assert [entry.options[0].addr for entry in decoded] == [f"10.0.0.{i}" for i in range(1, 201)]
+
+
+def test_pack_fills_messages():
+    per_message = (SD_MAX_MESSAGE - SD_MESSAGE_OVERHEAD - OPTION_LEN) // SD_ENTRY_LEN
+    messages = pack_sd_entries([offer(srv_id) for srv_id in range(per_message + 1)])
+    assert [len(entries) for entries, _ in messages] == [per_message, 1]
+    # El mensaje nuevo vuelve a incluir la opción compartida
+    assert all(options == [ECU_OPTION] for _, options in messages)
+
+
+def test_pack_splits_on_option_index():
+    entries = [offer(host, (endpoint_option(host),)) for host in range(300)]
+    messages = pack_sd_entries(entries, max_size=0xFFFF)
+    assert [len(options) for _, options in messages] == [256, 44]
+    decoded = [entry for message in decode(messages) for entry in message]
+    assert [entry.options[0].addr for entry in decoded] == [f"10.0.{i >> 8}.{i & 0xFF}" for i in range(300)]
+
+
+def test_pack_rejects_too_many_options():
+    with pytest.raises(ValueError):
+        pack_sd_entries([offer(1, tuple(endpoint_option(i) for i in range(16)))], max_size=0xFFFF)
+
+
+def test_pack_rejects_oversized_entry():
+    max_size = SD_MESSAGE_OVERHEAD + SD_ENTRY_LEN + OPTION_LEN
+    assert len(pack_sd_entries([offer(1)], max_size)) == 1
+    with pytest.raises(ValueError):
+        pack_sd_entries([offer(1)], max_size - 1)
+
+
+# Decodificación
+
+SUBSCRIBE = encode_eventgroup_entry(ENTRY_SUBSCRIBE, 0x0238, 0x0001, 1, 3, 0x0001, index_1=0, n_opt_1=1)
+
+
+def sd_frame(message: bytes, vlan: bool = True) -> bytes:
+    layers = Ether(src="02:00:00:00:00:01", dst="02:00:00:00:00:02")
+    if vlan:
+        layers = layers / Dot1Q(vlan=1500)
+    return bytes(
+        layers / IP(src="192.168.114.3", dst="192.168.114.98") / UDPLayer(sport=30490, dport=30490) / Raw(message)
+    )
+
+
+def test_decode_subscribe():
+    [entry] = iter_sd_entries(encode_sd_message(1, [SUBSCRIBE], [ECU_OPTION]))
+    assert (entry.type, entry.srv_id, entry.eventgroup_id, entry.ttl) == (ENTRY_SUBSCRIBE, 0x0238, 0x0001, 3)
+    assert entry.options == (Endpoint(OPTION_IP4_ENDPOINT, "192.168.114.98", UDP, 30501),)
+
+
+def test_decode_ignores_non_sd_message():
+    message = bytearray(encode_sd_message(1, [SUBSCRIBE], [ECU_OPTION]))
+    message[0:4] = b"\x02\x38\x80\x8c"
+    assert list(iter_sd_entries(message)) == []
+    assert list(iter_sd_entries(message[:20])) == []
+
+
+@pytest.mark.parametrize("trailing", [b"\x00", b"\x00\x09", b"\x00\x09\x04"])
+def test_decode_rejects_truncated_option_header(trailing):
+    # Opciones con una cabecera incompleta al final del datagrama
+    message = encode_sd_message(1, [SUBSCRIBE], [trailing])
+    with pytest.raises(ValueError):
+        list(iter_sd_entries(message))
+
+
+def test_decode_rejects_truncated_option():
+    message = encode_sd_message(1, [SUBSCRIBE], [ECU_OPTION[:-2]])
+    with pytest.raises(ValueError):
+        list(iter_sd_entries(message))
+
+
+def test_decode_rejects_empty_option():
+    message = encode_sd_message(1, [SUBSCRIBE], [b"\x00\x00\x04"])
+    with pytest.raises(ValueError):
+        list(iter_sd_entries(message))
+
+
+@pytest.mark.parametrize("cut", [1, 4, OPTION_LEN + 4, OPTION_LEN + 10])
+def test_decode_rejects_truncated_message(cut):
+    message = encode_sd_message(1, [SUBSCRIBE], [ECU_OPTION])[:-cut]
+    with pytest.raises(ValueError):
+        list(iter_sd_entries(message))
+
+
+@pytest.mark.parametrize("vlan", [True, False])
+def test_udp_payload_strips_ethernet_padding(vlan):
+    message = encode_sd_message(1, [], [])
+    frame = sd_frame(message, vlan)
+    # Trama corta rellenada hasta el mínimo de Ethernet (60 bytes sin FCS)
+    padded = frame + bytes(max(0, 60 - len(frame))) + bytes(8)
+    assert bytes(udp_payload(padded)) == message
+
+
+def test_udp_payload_rejects_truncated_frame():
+    frame = sd_frame(encode_sd_message(1, [SUBSCRIBE], [ECU_OPTION]))
+    assert udp_payload(frame[:-1]) is None
+    assert udp_payload(frame[:20]) is None
+    assert udp_payload(frame[:12]) is None
+
+
+def test_udp_payload_rejects_non_udp_frame():
+    assert udp_payload(bytes(Ether() / IP(proto=6) / Raw(bytes(20)))) is None
+
+
+def test_decode_padded_frame():
+    frame = sd_frame(encode_sd_message(1, [SUBSCRIBE], [ECU_OPTION])) + b"\xff" * 16
+    [entry] = iter_frame_sd_entries(frame)
+    assert entry.eventgroup_id == 0x0001
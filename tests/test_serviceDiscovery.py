@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import pytest
+from parser import ConfigRegistry, Parser
+from sdCodec import OFFER_TTL, iter_frame_sd_entries
+from serviceDiscovery import someipSD
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SENDER = "PCU_Proxy_Frontend"
+
+
+@pytest.fixture
+def ecu_file(tmp_path, monkeypatch):
+    """
+    Copia de la configuración que la prueba puede modificar.
+    """
+    monkeypatch.setattr(ConfigRegistry, "CHECK_INTERVAL", 0.0)
+    ecu_path, services_path = tmp_path / "ecu_data.json", tmp_path / "services.json"
+    shutil.copy(os.path.join(DATA_DIR, "ecu_data.json"), ecu_path)
+    shutil.copy(os.path.join(DATA_DIR, "services.json"), services_path)
+    monkeypatch.setattr(Parser, "ECU_DATA_PATH", str(ecu_path))
+    monkeypatch.setattr(Parser, "SERVICES_DATA_PATH", str(services_path))
+    return str(ecu_path)
+
+
+def offered(packets):
+    return [entry for packet in packets for entry in iter_frame_sd_entries(bytes(packet))]
+
+
+def test_offer_packets_ttl(ecu_file):
+    sd = someipSD()
+    assert [entry.ttl for entry in offered(sd.craft_offer_packets(SENDER, [140]))] == [OFFER_TTL]
+    assert [entry.ttl for entry in offered(sd.craft_offer_packets(SENDER, [140], 0))] == [0]
+    assert [entry.ttl for entry in offered([sd.craft_offer_packet(SENDER, "IVC", 140, 7)])] == [7]
+
+
+def test_offer_packets_follow_config_reload(ecu_file):
+    sd = someipSD()
+    [entry] = offered(sd.craft_offer_packets(SENDER, [140]))
+    with open(ecu_file) as f:
+        config = json.load(f)
+    ecu = next(ecu for ecu in config["ecus"] if ecu["name"] == SENDER)
+    assert entry.options[0].addr == ecu["ip"]
+
+    ecu["ip"] = "10.1.2.3"
+    with open(ecu_file, "w") as f:
+        json.dump(config, f)
+    stat = os.stat(ecu_file)
+    os.utime(ecu_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    [packet] = sd.craft_offer_packets(SENDER, [140])
+    [entry] = offered([packet])
+    assert entry.options[0].addr == "10.1.2.3"
+    assert packet["IP"].src == "10.1.2.3"
@@ -0,0 +1,72 @@
+import threading
+from sdCodec import SD_FLAG_REBOOT, SD_FLAG_UNICAST
+from sessions import SESSION_ID_MAX, SessionCounter, SessionManager, get_session_manager
+
+
+def test_counter_starts_at_one():
+    counter = SessionCounter()
+    assert [counter.next() for _ in range(3)] == [1, 2, 3]
+
+
+def test_counter_wraps_to_one():
+    counter = SessionCounter()
+    ids = [counter.next() for _ in range(SESSION_ID_MAX + 2)]
+    assert ids[SESSION_ID_MAX - 1] == SESSION_ID_MAX
+    assert ids[SESSION_ID_MAX:] == [1, 2]
+    assert 0 not in ids
+
+
+def test_sd_counter_reboot_flag_until_wrap():
+    counter = SessionCounter()
+    first = [counter.next_sd() for _ in range(SESSION_ID_MAX)]
+    assert first[0] == (1, SD_FLAG_REBOOT | SD_FLAG_UNICAST)
+    assert first[-1] == (SESSION_ID_MAX, SD_FLAG_REBOOT | SD_FLAG_UNICAST)
+    # Tras la primera vuelta el flag Reboot no vuelve a activarse
+    after = [counter.next_sd() for _ in range(SESSION_ID_MAX + 1)]
+    assert after[0] == (1, SD_FLAG_UNICAST)
+    assert after[-1] == (1, SD_FLAG_UNICAST)
+    assert all(flags == SD_FLAG_UNICAST for _, flags in after)
+
+
+def test_manager_keys_are_independent():
+    manager = SessionManager()
+    assert manager.event_counter(0x0238, 0x808C, 0x0701) is manager.event_counter(0x0238, 0x808C, 0x0701)
+    assert manager.next(("someip", 0x0238, 0x808C, 0x0701)) == 1
+    assert manager.event_counter(0x0238, 0x808C, 0x0701).next() == 2
+    assert manager.event_counter(0x0238, 0x808C, 0x0702).next() == 1
+    assert manager.sd_counter("192.168.114.98", "224.244.224.245").next_sd()[0] == 1
+    assert manager.sd_counter("192.168.114.98", "192.168.114.3").next_sd()[0] == 1
+
+
+def test_manager_reset():
+    manager = SessionManager()
+    manager.next("a")
+    manager.next("b")
+    manager.reset("a")
+    assert manager.next("a") == 1
+    assert manager.next("b") == 2
+    manager.sd_counter("ecu", "peer").next_sd()
+    manager.reset()
+    assert manager.next("b") == 1
+    assert manager.sd_counter("ecu", "peer").next_sd() == (1, SD_FLAG_REBOOT | SD_FLAG_UNICAST)
+
+
+def test_counter_is_thread_safe():
+    manager = SessionManager()
+    results = [[] for _ in range(8)]
+
+    def worker(ids):
+        for _ in range(2000):
+            ids.append(manager.next("shared"))
+
+    threads = [threading.Thread(target=worker, args=(ids,)) for ids in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = sorted(session_id for ids in results for session_id in ids)
+    assert ids == list(range(1, 8 * 2000 + 1))
+
+
+def test_shared_manager():
+    assert get_session_manager() is get_session_manager()
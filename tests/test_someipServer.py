@@ -0,0 +1,68 @@
+import pytest
+from scheduler import CyclicTask
+from sdCodec import decode_someip_header, udp_payload
+from someipServer import AsyncSomeipServer
+from transmit import close_pcap_output, set_pcap_output
+
+SERVICE_ID = 140
+SUBSCRIBERS = (("192.168.114.3", 30501), ("192.168.114.4", 30502))
+
+
+@pytest.fixture
+def pcap_output(in_src, tmp_path):
+    # Las tramas se escriben en un fichero en lugar de enviarse por la interfaz
+    set_pcap_output(str(tmp_path / "out.pcapng"))
+    yield
+    close_pcap_output()
+
+
+@pytest.fixture
+def server(pcap_output):
+    def make(**kwargs):
+        srv = AsyncSomeipServer("PCU_Proxy_Frontend", "IVC", [SERVICE_ID], **kwargs)
+        group = srv._eventgroup_of[SERVICE_ID]
+        for endpoint in SUBSCRIBERS:
+            srv.subscriptions.subscribe(*group, endpoint, 3)
+        return srv
+
+    return make
+
+
+def run_event(srv):
+    return srv._cyclic_event(CyclicTask(SERVICE_ID, 0.1, srv._cyclic_event, 0.0))
+
+
+def session_ids(frames):
+    return [decode_someip_header(udp_payload(frame)).session_id for frame in frames]
+
+
+@pytest.mark.parametrize("use_templates", [True, False])
+def test_event_shares_session_id_between_subscribers(server, use_templates):
+    srv = server(use_templates=use_templates)
+    first, second = run_event(srv), run_event(srv)
+    assert len(first) == len(SUBSCRIBERS)
+    [first_id] = set(session_ids(first))
+    assert session_ids(second) == [first_id % 0xFFFF + 1] * len(SUBSCRIBERS)
+
+
+def test_tp_event_shares_session_id_between_subscribers(server, monkeypatch):
+    srv = server()
+    srv._segmented.add(SERVICE_ID)
+    submitted = {}
+    monkeypatch.setattr(srv.tp, "submit", lambda key, frames: submitted.setdefault(key, []).append(frames))
+    assert run_event(srv) is None
+    run_event(srv)
+    assert set(submitted) == {(SERVICE_ID, endpoint) for endpoint in SUBSCRIBERS}
+    ids = {
+        key: [session_ids(bytes(headers) + bytes(chunk) for headers, chunk in message) for message in messages]
+        for key, messages in submitted.items()
+    }
+    first, second = ids.values()
+    assert first == second
+    assert len(set(first[0])) == 1
+
+
+@pytest.mark.parametrize("service_id", [141, 9999])
+def test_rejects_method_without_eventgroup(pcap_output, service_id):
+    with pytest.raises(ValueError):
+        AsyncSomeipServer("PCU_Proxy_Frontend", "IVC", [service_id])
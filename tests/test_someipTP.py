@@ -0,0 +1,284 @@
+import pytest
+from scapy.layers.l2 import Ether
+from scapy.layers.inet import IP, UDP
+from scheduler import CyclicScheduler, VirtualClock
+from sdCodec import (
+    MSG_NOTIFICATION, MSG_TP_FLAG, SOMEIP_HEADER_LEN, TP_HEADER, TP_MORE_SEGMENTS,
+    decode_someip_header, encode_someip_header, udp_payload
+)
+from someipTP import TPPacer, TPReassembler, TPSegmenter, split_segments
+
+DATA_DST = {
+    "mac_address": "02:00:00:00:00:01",
+    "mac_dst": "02:00:00:00:00:02",
+    "vlan": 1500,
+    "ip_src": "192.168.114.98",
+    "ip_dst": "192.168.114.3",
+    "someip_port_src": 30501,
+    "someip_port_dst": 30491,
+}
+METHOD_DATA = {"SOMEIP": {"ServID": 0x0238, "MethodID": 0x808C, "MessageType": MSG_NOTIFICATION}}
+MSG_ID = (0x0238 << 16) | 0x808C
+
+
+def make_payload(length: int) -> bytearray:
+    return bytearray(i % 251 for i in range(length))
+
+
+def segment_messages(payload: bytearray, max_segment: int = 32, session_id: int = 1):
+    """
+    Segmenta una payload y devuelve cada segmento como mensaje SOME/IP (la carga UDP).
+    """
+    frames = TPSegmenter(DATA_DST, METHOD_DATA, max_segment).segments(session_id, payload)
+    return [bytes(udp_payload(bytes(headers) + bytes(chunk))) for headers, chunk in frames]
+
+
+def tp_message(offset: int, chunk: bytes, more: bool, session_id: int = 1, client_id: int = 0x0701) -> bytes:
+    return encode_someip_header(
+        MSG_ID, TP_HEADER.size + len(chunk), session_id, MSG_NOTIFICATION | MSG_TP_FLAG, client_id
+    ) + TP_HEADER.pack(offset | (TP_MORE_SEGMENTS if more else 0)) + chunk
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# split_segments
+
+def test_split_segments_exact_multiple():
+    assert split_segments(64, 32) == [(0, 32, True), (32, 32, False)]
+
+
+def test_split_segments_last_segment_shorter():
+    assert split_segments(70, 32) == [(0, 32, True), (32, 32, True), (64, 6, False)]
+
+
+def test_split_segments_rounds_down_to_16():
+    segments = split_segments(100, 40)
+    assert [length for _, length, _ in segments] == [32, 32, 32, 4]
+    assert all(length % 16 == 0 for _, length, more in segments if more)
+
+
+def test_split_segments_empty_payload():
+    assert split_segments(0, 32) == []
+
+
+def test_split_segments_rejects_small_segment():
+    with pytest.raises(ValueError):
+        split_segments(100, 15)
+
+
+# TPSegmenter
+
+@pytest.mark.parametrize("length", [64, 65, 1392 * 3 + 7])
+def test_segmenter_checksums_match_scapy(length):
+    payload = make_payload(length)
+    frames = TPSegmenter(DATA_DST, METHOD_DATA).segments(7, payload)
+    for headers, chunk in frames:
+        frame = Ether(bytes(headers) + bytes(chunk))
+        ip_checksum, udp_checksum = frame[IP].chksum, frame[UDP].chksum
+        del frame[IP].chksum
+        del frame[UDP].chksum
+        rebuilt = Ether(bytes(frame))
+        assert rebuilt[IP].chksum == ip_checksum
+        assert rebuilt[UDP].chksum == udp_checksum
+
+
+def test_segmenter_headers():
+    payload = make_payload(70)
+    messages = segment_messages(payload, 32, session_id=9)
+    assert len(messages) == 3
+    for message, (offset, length, more) in zip(messages, split_segments(70, 32)):
+        header = decode_someip_header(message)
+        assert header.msg_id == MSG_ID
+        assert header.session_id == 9
+        assert header.msg_type == MSG_NOTIFICATION | MSG_TP_FLAG
+        assert header.length == 8 + TP_HEADER.size + length
+        tp = TP_HEADER.unpack_from(message, SOMEIP_HEADER_LEN)[0]
+        assert tp & ~0x0F == offset
+        assert bool(tp & TP_MORE_SEGMENTS) == more
+        assert message[SOMEIP_HEADER_LEN + TP_HEADER.size:] == payload[offset:offset + length]
+
+
+def test_segmenter_does_not_copy_payload():
+    payload = make_payload(64)
+    _, chunk = TPSegmenter(DATA_DST, METHOD_DATA, 32).segments(1, payload)[1]
+    payload[32] = 0xFF
+    assert chunk[0] == 0xFF
+
+
+# TPReassembler
+
+def test_reassemble_round_trip():
+    payload = make_payload(1392 * 2 + 100)
+    reassembler = TPReassembler()
+    results = [reassembler.feed(message, "ecu") for message in segment_messages(payload, 1392)]
+    assert results[:-1] == [None, None]
+    message = results[-1]
+    assert bytes(message.payload) == payload
+    assert message.header.msg_type == MSG_NOTIFICATION
+    assert message.header.length == 8 + len(payload)
+    assert reassembler.completed == 1
+    assert reassembler.dropped == 0
+    assert reassembler.in_progress() == 0
+
+
+def test_reassemble_ignores_duplicates():
+    payload = make_payload(96)
+    first, second, third = segment_messages(payload)
+    reassembler = TPReassembler()
+    assert reassembler.feed(first) is None
+    assert reassembler.feed(second) is None
+    assert reassembler.feed(second) is None
+    assert bytes(reassembler.feed(third).payload) == payload
+    assert reassembler.dropped == 0
+
+
+def test_reassemble_drops_on_gap():
+    first, _, third = segment_messages(make_payload(96))
+    reassembler = TPReassembler()
+    reassembler.feed(first)
+    assert reassembler.feed(third) is None
+    assert reassembler.dropped == 1
+    assert reassembler.in_progress() == 0
+
+
+def test_reassemble_ignores_message_without_start():
+    _, second, third = segment_messages(make_payload(96))
+    reassembler = TPReassembler()
+    assert reassembler.feed(second) is None
+    assert reassembler.feed(third) is None
+    assert reassembler.in_progress() == 0
+    assert reassembler.completed == 0
+
+
+def test_reassemble_offset_zero_restarts_message():
+    old = segment_messages(make_payload(96), session_id=1)
+    new_payload = bytearray(reversed(make_payload(64)))
+    new = segment_messages(new_payload, session_id=1)
+    reassembler = TPReassembler()
+    reassembler.feed(old[0])
+    reassembler.feed(old[1])
+    assert reassembler.feed(new[0]) is None
+    assert reassembler.dropped == 1
+    assert bytes(reassembler.feed(new[1]).payload) == new_payload
+
+
+def test_reassemble_new_session_restarts_message():
+    reassembler = TPReassembler()
+    reassembler.feed(tp_message(0, bytes(16), True, session_id=1))
+    assert reassembler.feed(tp_message(16, bytes(16), False, session_id=2)) is None
+    assert reassembler.dropped == 1
+    assert reassembler.in_progress() == 0
+
+
+def test_reassemble_drops_misaligned_segment():
+    reassembler = TPReassembler()
+    reassembler.feed(tp_message(0, bytes(20), True))
+    assert reassembler.dropped == 1
+    assert reassembler.in_progress() == 0
+
+
+def test_reassemble_drops_oversized_message():
+    reassembler = TPReassembler(max_message=32)
+    reassembler.feed(tp_message(0, bytes(32), True))
+    assert reassembler.feed(tp_message(32, bytes(16), False)) is None
+    assert reassembler.dropped == 1
+
+
+def test_reassemble_timeout():
+    clock = FakeClock()
+    reassembler = TPReassembler(timeout=1.0, clock=clock)
+    first, second, _ = segment_messages(make_payload(96))
+    reassembler.feed(first)
+    clock.now = 0.5
+    reassembler.feed(second)
+    clock.now = 1.4
+    reassembler.expire()
+    assert reassembler.in_progress() == 1
+    clock.now = 1.6
+    reassembler.expire()
+    assert reassembler.in_progress() == 0
+    assert reassembler.dropped == 1
+
+
+def test_reassemble_evicts_least_recent_flow():
+    reassembler = TPReassembler(max_message=64, max_sessions=2)
+    reassembler.feed(tp_message(0, bytes(16), True), "a")
+    reassembler.feed(tp_message(0, bytes(16), True), "b")
+    # "a" recibe un segmento más y pasa a ser el más reciente
+    reassembler.feed(tp_message(16, bytes(16), True), "a")
+    reassembler.feed(tp_message(0, bytes(16), True), "c")
+    assert reassembler.dropped == 1
+    assert reassembler.feed(tp_message(32, b"\x01", False), "a").payload[32] == 1
+    assert reassembler.feed(tp_message(16, b"", False), "b") is None
+
+
+def test_reassemble_separates_flows():
+    payload_a, payload_b = make_payload(64), bytearray(reversed(make_payload(64)))
+    a, b = segment_messages(payload_a), segment_messages(payload_b)
+    reassembler = TPReassembler()
+    reassembler.feed(a[0], "a")
+    reassembler.feed(b[0], "b")
+    assert bytes(reassembler.feed(a[1], "a").payload) == payload_a
+    assert bytes(reassembler.feed(b[1], "b").payload) == payload_b
+
+
+def test_reassemble_rejects_non_tp_message():
+    with pytest.raises(ValueError):
+        TPReassembler().feed(encode_someip_header(MSG_ID, 4, 1, MSG_NOTIFICATION) + bytes(4))
+
+
+def test_reassemble_rejects_truncated_segment():
+    with pytest.raises(ValueError):
+        TPReassembler().feed(tp_message(0, bytes(32), True)[:-8])
+
+
+# TPPacer
+
+def run_pacer(submissions, duration, separation=0.001, burst=4, on_frames=None):
+    clock = VirtualClock(0.0)
+    sent = []
+    scheduler = CyclicScheduler(flush=sent.extend, clock=clock, sleep_until=clock.advance_to)
+    pacer = TPPacer(scheduler, separation, burst, on_frames)
+    for start, key, frames in submissions:
+        scheduler.add(("submit", start, key), 1.0, lambda task, k=key, f=frames: pacer.submit(k, f), start=start)
+    scheduler.run(lambda: clock() < duration)
+    return pacer, sent
+
+
+def test_pacer_paces_segments():
+    pacer, sent = run_pacer([(0.0, "f", list(range(10)))], 0.0105)
+    assert sent == list(range(10))
+    assert pacer.pending() == 0
+
+
+def test_pacer_reports_segments_per_tick():
+    reported = []
+    run_pacer([(0.0, "f", list(range(10)))], 0.0105, on_frames=lambda key, n: reported.append((key, n)))
+    assert reported == [("f", 4), ("f", 4), ("f", 2)]
+
+
+def test_pacer_replaces_waiting_message():
+    first = [("m1", i) for i in range(8)]
+    second = [("m2", i) for i in range(8)]
+    third = [("m3", i) for i in range(8)]
+    pacer, sent = run_pacer([(0.0, "f", first), (0.0001, "f", second), (0.0002, "f", third)], 0.01)
+    # El mensaje en curso termina completo y el que esperaba se sustituye por el último
+    assert sent == first + third
+    assert pacer.dropped == 1
+
+
+def test_pacer_cancel():
+    clock = VirtualClock(0.0)
+    scheduler = CyclicScheduler(clock=clock, sleep_until=clock.advance_to)
+    pacer = TPPacer(scheduler)
+    pacer.submit("f", list(range(10)))
+    pacer.submit("f", list(range(10)))
+    pacer.cancel("f")
+    assert pacer.pending() == 0
+    assert len(scheduler) == 0